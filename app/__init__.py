@@ -8,16 +8,125 @@ load_dotenv()
 def create_app():
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-dev-key')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit uploads to 16MB
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit request bodies (single uploads, chunks) to 16MB
     app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'app/static/uploads')
     app.config['PROCESSED_FOLDER'] = os.path.join(os.getcwd(), 'app/static/processed')
     
+    # Per-upload page checkpoints so note generation can resume (not served publicly)
+    app.config['CHECKPOINT_FOLDER'] = os.getenv('CHECKPOINT_FOLDER', os.path.join(os.getcwd(), 'checkpoints'))
+    
+    # Concurrent note generation settings (0 disables the corresponding limit)
+    app.config['NOTES_MAX_WORKERS'] = int(os.getenv('NOTES_MAX_WORKERS', '4'))
+    app.config['GEMINI_REQUESTS_PER_SECOND'] = float(os.getenv('GEMINI_REQUESTS_PER_SECOND', '2'))
+    app.config['GEMINI_MAX_IN_FLIGHT'] = int(os.getenv('GEMINI_MAX_IN_FLIGHT', '4'))
+    
+    # Multi-page requests: up to GEMINI_BATCH_PAGES consecutive pages (1 disables)
+    # and GEMINI_BATCH_MAX_BYTES of encoded page data share one Gemini request
+    app.config['GEMINI_BATCH_PAGES'] = int(os.getenv('GEMINI_BATCH_PAGES', '1'))
+    app.config['GEMINI_BATCH_MAX_BYTES'] = int(os.getenv('GEMINI_BATCH_MAX_BYTES', str(4 * 1024 * 1024)))
+    
+    # Skip API calls for blank pages and near-duplicate pages (slide builds)
+    app.config['PAGE_DEDUP'] = os.getenv('PAGE_DEDUP', 'true').lower() == 'true'
+    app.config['BLANK_PAGE_INK_THRESHOLD'] = float(os.getenv('BLANK_PAGE_INK_THRESHOLD', '0.002'))
+    app.config['DUPLICATE_HASH_DISTANCE'] = int(os.getenv('DUPLICATE_HASH_DISTANCE', '4'))
+    
+    # Page rasterization settings (pages are rendered PDF_STREAM_WINDOW at a time)
+    app.config['PDF_RENDER_DPI'] = int(os.getenv('PDF_RENDER_DPI', '200'))
+    app.config['POPPLER_THREAD_COUNT'] = int(os.getenv('POPPLER_THREAD_COUNT', '1'))
+    app.config['PDF_STREAM_WINDOW'] = int(os.getenv('PDF_STREAM_WINDOW', '4'))
+    
+    # Processes used to extract and rasterize page windows in parallel (1 = inline)
+    app.config['PDF_EXTRACT_WORKERS'] = int(os.getenv('PDF_EXTRACT_WORKERS', '1'))
+    
+    # Serve pages as soon as they are ready instead of waiting for the whole PDF
+    app.config['PROGRESSIVE_PAGES'] = os.getenv('PROGRESSIVE_PAGES', 'true').lower() == 'true'
+    
+    # Note pages as PDF vector content ('vector') or full-page images ('raster')
+    app.config['NOTE_PAGE_FORMAT'] = os.getenv('NOTE_PAGE_FORMAT', 'vector').lower()
+    
+    # Compress and deduplicate streams of the processed PDF, and linearize it
+    # for fast web view when qpdf is installed
+    app.config['PDF_OPTIMIZE_OUTPUT'] = os.getenv('PDF_OPTIMIZE_OUTPUT', 'true').lower() == 'true'
+    app.config['PDF_LINEARIZE'] = os.getenv('PDF_LINEARIZE', 'true').lower() == 'true'
+    
     # Ensure upload directories exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['PROCESSED_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['CHECKPOINT_FOLDER'], exist_ok=True)
+    
+    # Disk quota over uploads and everything derived from them; files from
+    # before the index existed are picked up once
+    from app.utils.artifacts import get_artifact_store
+    get_artifact_store().adopt(
+        app.config['UPLOAD_FOLDER'],
+        app.config['PROCESSED_FOLDER'],
+        app.config['CHECKPOINT_FOLDER']
+    )
+    
+    # Chunked, resumable uploads for files larger than a single request
+    from app.utils.uploads import UploadStore
+    app.config['MAX_UPLOAD_SIZE'] = int(os.getenv('MAX_UPLOAD_SIZE_MB', '512')) * 1024 * 1024
+    app.config['UPLOAD_CHUNK_SIZE'] = min(
+        int(os.getenv('UPLOAD_CHUNK_SIZE_MB', '8')) * 1024 * 1024,
+        app.config['MAX_CONTENT_LENGTH']
+    )
+    app.extensions['uploads'] = UploadStore(
+        app.config['UPLOAD_FOLDER'],
+        max_upload_size=app.config['MAX_UPLOAD_SIZE'],
+        chunk_size=app.config['UPLOAD_CHUNK_SIZE']
+    )
+    
+    # Local background worker pool for note generation jobs; job status is
+    # shared through JOB_STATE_FOLDER so any server worker can report it
+    from app.utils.jobs import JobManager
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '2'))
+    app.config['JOB_STATE_FOLDER'] = os.getenv('JOB_STATE_FOLDER', os.path.join(os.getcwd(), 'cache', 'jobs'))
+    app.extensions['jobs'] = JobManager(
+        max_workers=app.config['JOB_WORKERS'],
+        state_folder=app.config['JOB_STATE_FOLDER']
+    )
+    
+    # Viewer page renditions, rendered in batches in the background
+    from app.utils.render_cache import RenderCache, render_settings
+    app.config['VIEWER_PAGE_WIDTH'] = int(os.getenv('VIEWER_PAGE_WIDTH', '1200'))
+    app.config['VIEWER_IMAGE_FORMAT'] = os.getenv('VIEWER_IMAGE_FORMAT', 'WEBP')
+    app.config['VIEWER_IMAGE_QUALITY'] = int(os.getenv('VIEWER_IMAGE_QUALITY', '80'))
+    app.config['THUMBNAIL_WIDTH'] = int(os.getenv('THUMBNAIL_WIDTH', '200'))
+    app.config['RENDER_THREAD_COUNT'] = int(os.getenv('RENDER_THREAD_COUNT', '2'))
+    app.config['PAGE_CACHE_MAX_AGE'] = int(os.getenv('PAGE_CACHE_MAX_AGE', '3600'))
+    app.config['PREFETCH_PAGES'] = int(os.getenv('PREFETCH_PAGES', '3'))
+    app.extensions['render_cache'] = RenderCache(render_settings(app.config))
+    
+    # Per-request cProfile dumps, enabled with ?profile=1 when allowed
+    app.config['PROFILE_REQUESTS'] = os.getenv('PROFILE_REQUESTS', 'false').lower() == 'true'
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(os.getcwd(), 'profiles'))
     
     # Register routes
     from app.routes import main
     app.register_blueprint(main)
     
-    return app
\ No newline at end of file
+    return app
+
+def warm_up(app):
+    """
+    Load the heavy modules and fill the shared caches ahead of the first request
+    
+    The production server calls this once before forking its workers, so
+    PIL, NumPy, PyPDF2, requests, the fonts and the texture tiles sit in
+    memory the workers share copy-on-write instead of each loading them.
+    
+    Args:
+        app (Flask): Application created by `create_app`
+    """
+    from app.utils import pipeline  # noqa: F401 (imports PDF processing, Gemini client and rendering)
+    from app.utils.fonts import preload_fonts
+    from app.utils.texture import pencil_texture
+    from app.utils.vector_notes import TEXTURE_TILE_SIZE
+    
+    preload_fonts()
+    if app.config['NOTE_PAGE_FORMAT'] == 'vector':
+        pencil_texture(TEXTURE_TILE_SIZE, TEXTURE_TILE_SIZE, gray_range=(240, 252))
+    else:
+        # Note pages match the rendered page size; warm US Letter at the render DPI
+        dpi = app.config['PDF_RENDER_DPI']
+        pencil_texture(round(8.5 * dpi), 11 * dpi, gray_range=(240, 252))
\ No newline at end of file
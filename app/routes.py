@@ -1,16 +1,64 @@
-from flask import Blueprint, render_template, request, jsonify, current_app, url_for, send_from_directory
+from flask import Blueprint, render_template, request, jsonify, current_app, url_for, send_from_directory, g, Response
 import os
+import time
 import uuid
+import cProfile
 import traceback
-from werkzeug.utils import secure_filename
-from app.utils.pdf_processor import process_pdf, is_pdf_file
-from app.utils.gemini_client import generate_notes
+from app.utils.render_cache import rendition_path, render_page
+from app.utils.uploads import UploadError
+from app.utils.jobs import JobAlreadyRunning
+from app.utils.artifacts import get_artifact_store, upload_filename_for
+from app.utils.metrics import (
+    METRICS, timed, count_bytes, server_timing_header, profile_path, profile_call, process_memory
+)
 
 main = Blueprint('main', __name__)
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'pdf'}
 
+def _profiling_requested():
+    return current_app.config['PROFILE_REQUESTS'] and request.args.get('profile') == '1'
+
+@main.before_app_request
+def start_request_timing():
+    """Start the request timer and, if requested, the profiler"""
+    g.request_started = time.perf_counter()
+    if _profiling_requested():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@main.after_app_request
+def finish_request_timing(response):
+    """Record request latency, add Server-Timing and save any profile"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        path = profile_path(current_app.config['PROFILE_DIR'], request.endpoint or 'request')
+        profiler.dump_stats(path)
+        response.headers['X-Profile-File'] = os.path.basename(path)
+    
+    started = g.get('request_started')
+    if started is not None:
+        total = time.perf_counter() - started
+        METRICS.observe(
+            'http_request_seconds', total,
+            endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code
+        )
+        header = server_timing_header(total)
+        if header:
+            response.headers['Server-Timing'] = header
+    return response
+
+# PDF processing, the Gemini client and the pipeline pull in PIL, NumPy,
+# PyPDF2 and requests, so routes import them on first use; the production
+# server preloads them before forking workers (see `app.warm_up`)
+
+def _profiled_pipeline(job, output_path, *args):
+    """Run the notes pipeline under cProfile"""
+    from app.utils.pipeline import run_notes_pipeline
+    return profile_call(output_path, run_notes_pipeline, job, *args)
+
 @main.route('/')
 def index():
     """Render the main page"""
@@ -19,6 +67,8 @@ def index():
 @main.route('/upload', methods=['POST'])
 def upload_file():
     """Handle PDF file upload and processing"""
+    from app.utils.pdf_processor import is_pdf_file
+    
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -31,20 +81,112 @@ def upload_file():
         return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
     
     try:
-        # Create unique filename
-        unique_filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(filepath)
+        uploads = current_app.extensions['uploads']
+        received_path = os.path.join(uploads.partial_folder, f"{uuid.uuid4().hex}.upload")
+        with timed('save_upload'):
+            file.save(received_path)
+        count_bytes('upload', os.path.getsize(received_path))
         
-        # Extract original page count before processing
+        # Identical content resolves to the existing upload
+        stored = uploads.add_file(received_path, file.filename)
+        return _upload_response(stored)
+    
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def _upload_response(stored):
+    """Response for a finished upload, with its page count"""
+    from app.utils.pdf_processor import process_pdf
+    
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], stored['filename'])
+    
+    # Extract original page count before processing
+    with timed('page_count'):
         pages_info = process_pdf(filepath, get_info_only=True)
+    
+    return jsonify({
+        'status': 'success',
+        'filename': stored['filename'],
+        'original_pages': pages_info['page_count'],
+        'sha256': stored['sha256'],
+        'deduplicated': stored['deduplicated'],
+        'message': 'File uploaded successfully'
+    })
+
+@main.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a chunked upload
+    
+    JSON body: 'filename', 'size' and optionally 'sha256'. A known hash
+    completes immediately with the existing upload; otherwise the response
+    has the session ID and the chunk size to PUT.
+    """
+    data = request.json or {}
+    uploads = current_app.extensions['uploads']
+    
+    try:
+        existing = uploads.find_by_hash(data['sha256']) if data.get('sha256') else None
+        if existing is not None:
+            return _upload_response({'filename': existing, 'sha256': data['sha256'], 'deduplicated': True})
         
+        session = uploads.create(data.get('filename'), data.get('size'))
         return jsonify({
-            'status': 'success',
-            'filename': unique_filename,
-            'original_pages': pages_info['page_count'],
-            'message': 'File uploaded successfully'
-        })
+            'upload_id': session['upload_id'],
+            'upload_url': url_for('main.upload_chunk', upload_id=session['upload_id']),
+            'offset': session['offset'],
+            'size': session['size'],
+            'chunk_size': uploads.chunk_size
+        }), 201
+    
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+@main.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Report how many bytes of a chunked upload have arrived, to resume from"""
+    session = current_app.extensions['uploads'].status(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'upload_id': upload_id, 'offset': session['offset'], 'size': session['size']})
+
+@main.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    Append one chunk to a chunked upload
+    
+    The chunk's position is given as `Content-Range: bytes start-end/total`
+    and must continue exactly where the upload stands. The body is streamed
+    to disk. The last chunk finishes the upload and returns the same
+    response as /upload.
+    """
+    uploads = current_app.extensions['uploads']
+    
+    content_range = request.headers.get('Content-Range', '')
+    try:
+        unit, _, span = content_range.partition(' ')
+        start, end = (int(value) for value in span.split('/', 1)[0].split('-', 1))
+        if unit != 'bytes' or end < start:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Missing or invalid Content-Range header'}), 400
+    
+    try:
+        with timed('save_upload'):
+            session = uploads.write_chunk(upload_id, start, request.stream, end - start + 1)
+        count_bytes('upload', session['offset'] - start)
+        
+        if session['offset'] < session['size']:
+            return jsonify({'upload_id': upload_id, 'offset': session['offset'], 'size': session['size']})
+        
+        return _upload_response(uploads.finalize(upload_id))
+    
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
     
     except Exception as e:
         traceback.print_exc()
@@ -52,7 +194,17 @@ def upload_file():
 
 @main.route('/generate-notes', methods=['POST'])
 def generate_ai_notes():
-    """Generate AI handwritten notes for the uploaded PDF"""
+    """
+    Queue background generation of AI handwritten notes for the uploaded PDF
+    
+    Pages finished by an earlier run are reused. Optional JSON fields:
+    'pages' ("1-3,7" or a list of page numbers) regenerates just those
+    pages, and 'force' regenerates the whole document.
+    """
+    from app.utils.pdf_processor import process_pdf
+    from app.utils.pipeline import run_notes_pipeline
+    from app.utils.checkpoints import parse_page_ranges
+    
     data = request.json
     filename = data.get('filename')
     
@@ -63,65 +215,170 @@ def generate_ai_notes():
     
     if not os.path.exists(filepath):
         return jsonify({'error': 'File not found'}), 404
+    get_artifact_store().touch(filename)
+    
+    pages = None
+    if data.get('pages'):
+        try:
+            total_pages = process_pdf(filepath, get_info_only=True)['page_count']
+            pages = parse_page_ranges(data['pages'], total_pages)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
     try:
-        # Process the PDF and generate notes
-        result = process_pdf(filepath)
-        
         processed_filepath = os.path.join(
             current_app.config['PROCESSED_FOLDER'], 
             f"processed_{filename}"
         )
         
-        # Generate notes for each extracted content
-        for i, page_content in enumerate(result['extracted_contents']):
-            # Only generate notes for original pages (not blank pages)
-            if i % 2 == 0:  # Original pages are at even indices
-                note_image = generate_notes(page_content)
-                
-                # Save the note image to be inserted after the original page
-                result['note_images'][i//2] = note_image
-        
-        # Create the final PDF with original pages and inserted note pages
-        final_pdf_path = result['create_annotated_pdf'](processed_filepath)
+        # Run the pipeline on the local worker pool and return straight away;
+        # a profiled request also profiles its background job
+        pipeline_args = (filepath, processed_filepath, dict(current_app.config), pages, bool(data.get('force')))
+        if _profiling_requested():
+            job_profile = profile_path(current_app.config['PROFILE_DIR'], 'job')
+            job = current_app.extensions['jobs'].submit(filename, _profiled_pipeline, job_profile, *pipeline_args)
+        else:
+            job = current_app.extensions['jobs'].submit(filename, run_notes_pipeline, *pipeline_args)
         
         return jsonify({
-            'status': 'success',
-            'processed_file': os.path.basename(final_pdf_path),
-            'total_pages': result['total_pages'] * 2,  # Original + note pages
-            'message': 'Notes generated successfully'
-        })
+            'status': 'queued',
+            'job_id': job.id,
+            'status_url': url_for('main.job_status', job_id=job.id),
+            'processed_file': os.path.basename(processed_filepath),
+            'download_url': url_for('main.download_pdf', filename=os.path.basename(processed_filepath)),
+            'progressive': current_app.config['PROGRESSIVE_PAGES'],
+            'pages': pages,
+            'message': 'Note generation started'
+        }), 202
+    
+    except JobAlreadyRunning as e:
+        # Two runs for one upload would overwrite each other's output
+        return jsonify({
+            'error': str(e),
+            'job_id': e.job.id,
+            'status_url': url_for('main.job_status', job_id=e.job.id)
+        }), e.status_code
     
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@main.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report progress, per-page timings and the result of a note generation job"""
+    job = current_app.extensions['jobs'].get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    status = job.to_dict()
+    status['output_pages'] = job.total_pages * 2  # Original + note pages
+    return jsonify(status)
+
+def _missing_processed_file(filename):
+    """202 while notes are still in progress for this file, 404 otherwise"""
+    job = current_app.extensions['jobs'].latest_for(upload_filename_for(filename))
+    if job is not None and not job.finished:
+        response = jsonify({'status': 'pending', 'job_id': job.id})
+        response.headers['Retry-After'] = '1'
+        return response, 202
+    return jsonify({'error': 'Processed file not found'}), 404
+
+def _send_rendition(filename, page_num, kind):
+    """Serve a cached page rendition, rendering it on a cache miss"""
+    render_cache = current_app.extensions['render_cache']
+    processed_filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
+    view_path = rendition_path(processed_filepath, page_num, render_cache.settings)
+    get_artifact_store().touch(upload_filename_for(filename))
+    
+    if os.path.exists(processed_filepath):
+        # Render all pages in one background pass so the next pages are
+        # ready before the viewer asks for them
+        render_cache.schedule(processed_filepath)
+        
+        # Render this page now if the batch hasn't reached it yet
+        if not os.path.exists(view_path):
+            render_page(processed_filepath, page_num, render_cache.settings)
+    
+    elif not os.path.exists(view_path):
+        return _missing_processed_file(filename)
+    
+    # Renditions carry an ETag, so repeat views revalidate to a 304
+    response = send_from_directory(
+        current_app.config['PROCESSED_FOLDER'],
+        os.path.basename(rendition_path(processed_filepath, page_num, render_cache.settings, kind=kind)),
+        max_age=current_app.config['PAGE_CACHE_MAX_AGE']
+    )
+    response.headers['Cache-Control'] = f"private, max-age={current_app.config['PAGE_CACHE_MAX_AGE']}, must-revalidate"
+    return response
+
 @main.route('/get-page/<filename>/<int:page_num>', methods=['GET'])
 def get_page(filename, page_num):
-    """Get a specific page image from the processed PDF"""
+    """Get a specific page image from the processed PDF, or its artifact while notes are generated"""
+    try:
+        return _send_rendition(filename, page_num, 'view')
+    
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/get-thumbnail/<filename>/<int:page_num>', methods=['GET'])
+def get_thumbnail(filename, page_num):
+    """Get a thumbnail of a specific page of the processed PDF"""
+    try:
+        return _send_rendition(filename, page_num, 'thumb')
+    
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/download/<filename>', methods=['GET'])
+def download_pdf(filename):
+    """
+    Serve the processed PDF itself, with HTTP Range support
+    
+    Range and If-Range requests get 206 partial responses, so a browser
+    PDF viewer can fetch a linearized file's first page before the rest.
+    `?download=1` saves the file instead of opening it.
+    """
     try:
         processed_filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
+        if not filename.lower().endswith('.pdf') or not os.path.isfile(processed_filepath):
+            return _missing_processed_file(filename)
+        get_artifact_store().touch(upload_filename_for(filename))
         
-        if not os.path.exists(processed_filepath):
-            return jsonify({'error': 'Processed file not found'}), 404
-        
-        # Extract the requested page as an image
-        page_image_path = os.path.join(
+        # The ETag changes whenever the file is rewritten, so a stale
+        # If-Range gets the whole new file instead of mismatched bytes
+        response = send_from_directory(
             current_app.config['PROCESSED_FOLDER'],
-            f"{os.path.splitext(filename)[0]}_page_{page_num}.png"
-        )
-        
-        # If page image doesn't exist yet, extract it
-        if not os.path.exists(page_image_path):
-            from app.utils.pdf_processor import extract_page_as_image
-            extract_page_as_image(processed_filepath, page_num, page_image_path)
-        
-        # Return the image
-        return send_from_directory(
-            current_app.config['PROCESSED_FOLDER'],
-            f"{os.path.splitext(filename)[0]}_page_{page_num}.png"
+            filename,
+            mimetype='application/pdf',
+            as_attachment=request.args.get('download') == '1',
+            conditional=True
         )
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     
     except Exception as e:
         traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    """Export stage latencies, byte, page and error counters in Prometheus text format"""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/stats', methods=['GET'])
+def stats():
+    """Report Gemini client, response cache, artifact store and worker process stats for monitoring"""
+    from app.utils.gemini_client import get_client, get_response_cache
+    
+    client = get_client(create=False)
+    cache = get_response_cache()
+    return jsonify({
+        'gemini_client': client.stats() if client is not None else None,
+        'response_cache': cache.stats() if cache is not None else None,
+        'artifacts': get_artifact_store().stats(),
+        'process': dict(pid=os.getpid(), **process_memory())
+    })
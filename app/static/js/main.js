@@ -16,10 +16,27 @@ document.addEventListener('DOMContentLoaded', function() {
     const currentPageSpan = document.getElementById('current-page');
     const totalPagesSpan = document.getElementById('total-pages');
     const pageDisplay = document.getElementById('page-display');
+    const downloadLink = document.getElementById('download-link');
     const errorModal = document.getElementById('error-modal');
     const errorMessage = document.getElementById('error-message');
     const closeBtn = document.querySelector('.close-btn');
 
+    // How often to poll a running note generation job
+    const JOB_POLL_INTERVAL_MS = 1000;
+
+    // How often to retry a page that is still being generated
+    const PAGE_RETRY_INTERVAL_MS = 1000;
+
+    // Fallback chunk size for resumed uploads (the server reports its own)
+    const UPLOAD_CHUNK_SIZE = parseInt(document.body.dataset.uploadChunkSize || '8388608', 10);
+
+    // How often a failed upload chunk is retried, and how long to wait between tries
+    const UPLOAD_RETRIES = 3;
+    const UPLOAD_RETRY_INTERVAL_MS = 1000;
+
+    // How many pages ahead of the current one to prefetch
+    const PREFETCH_PAGES = parseInt(document.body.dataset.prefetchPages || '0', 10);
+
     // State
     let currentState = {
         uploadedFile: null,
@@ -92,29 +109,21 @@ document.addEventListener('DOMContentLoaded', function() {
         uploadFile(file);
     }
 
-    // Upload file to server
+    // Upload file to server in chunks, resuming after interruptions
     function uploadFile(file) {
-        const formData = new FormData();
-        formData.append('file', file);
-        
         // Show loading state
         statusMessage.textContent = 'Uploading file...';
         progressContainer.classList.remove('hidden');
-        progressFill.style.width = '20%';
+        progressFill.style.width = '0%';
         
-        fetch('/upload', {
-            method: 'POST',
-            body: formData
-        })
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(data => {
-                    throw new Error(data.error || 'Something went wrong during upload');
-                });
-            }
-            return response.json();
-        })
+        // A page reload can resume the same file's unfinished upload
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        
+        getUploadSession(file, resumeKey)
+        .then(session => sendChunks(file, session))
         .then(data => {
+            localStorage.removeItem(resumeKey);
+            
             // Update state
             currentState.uploadedFile = data.filename;
             currentState.originalPageCount = data.original_pages;
@@ -131,6 +140,76 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    function jsonOrError(response) {
+        return response.json().then(data => {
+            if (!response.ok) {
+                throw new Error(data.error || 'Something went wrong during upload');
+            }
+            return data;
+        });
+    }
+
+    // Resume a stored session if the server still has it, else start a new one
+    function getUploadSession(file, resumeKey) {
+        const uploadId = localStorage.getItem(resumeKey);
+        const resumed = uploadId
+            ? fetch(`/uploads/${uploadId}`).then(response => response.ok ? response.json() : null)
+            : Promise.resolve(null);
+        
+        return resumed.then(session => {
+            if (session) {
+                return {
+                    upload_id: session.upload_id,
+                    upload_url: `/uploads/${session.upload_id}`,
+                    offset: session.offset,
+                    chunk_size: UPLOAD_CHUNK_SIZE
+                };
+            }
+            return fetch('/uploads', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({filename: file.name, size: file.size})
+            })
+            .then(jsonOrError)
+            .then(data => {
+                localStorage.setItem(resumeKey, data.upload_id);
+                return data;
+            });
+        });
+    }
+
+    // PUT the file chunk by chunk; a failed chunk resumes from the server's offset
+    function sendChunks(file, session, retries = UPLOAD_RETRIES) {
+        const start = session.offset;
+        const end = Math.min(start + session.chunk_size, file.size);
+        
+        return fetch(session.upload_url, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/octet-stream',
+                'Content-Range': `bytes ${start}-${end - 1}/${file.size}`
+            },
+            body: file.slice(start, end)
+        })
+        .then(jsonOrError)
+        .then(data => {
+            if (data.status === 'success') {
+                progressFill.style.width = '100%';
+                return data;
+            }
+            progressFill.style.width = `${Math.round(100 * data.offset / file.size)}%`;
+            return sendChunks(file, Object.assign({}, session, {offset: data.offset}));
+        })
+        .catch(error => {
+            if (retries <= 0) {
+                throw error;
+            }
+            return new Promise(resolve => setTimeout(resolve, UPLOAD_RETRY_INTERVAL_MS))
+                .then(() => fetch(`/uploads/${session.upload_id}`).then(jsonOrError))
+                .then(status => sendChunks(file, Object.assign({}, session, {offset: status.offset}), retries - 1));
+        });
+    }
+
     // Generate AI notes
     generateBtn.addEventListener('click', function() {
         if (!currentState.uploadedFile) {
@@ -154,42 +233,113 @@ document.addEventListener('DOMContentLoaded', function() {
             })
         })
         .then(response => {
+            if (response.status === 409) {
+                // Notes for this file are already being generated; follow that job
+                return response.json().then(data => {
+                    pollJob(data.status_url);
+                    return null;
+                });
+            }
             if (!response.ok) {
                 return response.json().then(data => {
                     throw new Error(data.error || 'Something went wrong during note generation');
                 });
             }
-            progressFill.style.width = '80%';
             return response.json();
         })
         .then(data => {
-            // Update state
-            currentState.processedFilename = data.processed_file;
-            currentState.totalPages = data.total_pages;
-            currentState.currentPage = 1;
+            if (!data) {
+                return;
+            }
             
-            // Update UI
-            totalPagesSpan.textContent = data.total_pages;
-            currentPageSpan.textContent = '1';
+            // In progressive mode pages can be viewed while notes are generated
+            if (data.progressive) {
+                openViewer(data.processed_file, currentState.originalPageCount * 2);
+            }
             
-            // Show viewer section
-            viewerSection.classList.remove('hidden');
-            progressFill.style.width = '100%';
+            // The server queued a background job; poll it until it finishes
+            pollJob(data.status_url);
+        })
+        .catch(error => {
+            showGenerationError(error.message);
+        });
+    });
+
+    // Poll a note generation job and update progress until it finishes
+    function pollJob(statusUrl) {
+        fetch(statusUrl)
+        .then(response => {
+            if (!response.ok) {
+                return response.json().then(data => {
+                    throw new Error(data.error || 'Lost track of note generation');
+                });
+            }
+            return response.json();
+        })
+        .then(job => {
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Something went wrong during note generation');
+            }
             
-            // Load first page
-            loadPage(1);
+            if (job.status !== 'completed') {
+                // Scale page progress into the 40%-90% band of the bar
+                const fraction = job.total_pages ? job.completed_pages / job.total_pages : 0;
+                progressFill.style.width = `${40 + Math.round(fraction * 50)}%`;
+                statusMessage.textContent = job.total_pages
+                    ? `Generating AI notes... (${job.completed_pages}/${job.total_pages} pages)`
+                    : 'Waiting for a free worker...';
+                setTimeout(() => pollJob(statusUrl), JOB_POLL_INTERVAL_MS);
+                return;
+            }
             
-            // Hide progress after a short delay
-            setTimeout(() => {
-                progressContainer.classList.add('hidden');
-            }, 500);
+            showProcessedFile(job);
         })
         .catch(error => {
-            showError(error.message);
-            fileDetails.classList.remove('hidden');
-            progressContainer.classList.add('hidden');
+            showGenerationError(error.message);
         });
-    });
+    }
+
+    // Show the viewer once notes are ready
+    function showProcessedFile(job) {
+        if (currentState.processedFilename !== job.processed_file) {
+            openViewer(job.processed_file, job.output_pages);
+        }
+        progressFill.style.width = '100%';
+        
+        // The finished PDF opens in the browser's own viewer, which fetches it in ranges
+        downloadLink.href = `/download/${job.processed_file}`;
+        downloadLink.classList.remove('hidden');
+        
+        // Hide progress after a short delay
+        setTimeout(() => {
+            progressContainer.classList.add('hidden');
+        }, 500);
+    }
+
+    // Open the viewer on the first page of a processed file
+    function openViewer(processedFilename, totalPages) {
+        // Update state
+        currentState.processedFilename = processedFilename;
+        currentState.totalPages = totalPages;
+        currentState.currentPage = 1;
+        downloadLink.classList.add('hidden');
+        
+        // Update UI
+        totalPagesSpan.textContent = totalPages;
+        currentPageSpan.textContent = '1';
+        
+        // Show viewer section
+        viewerSection.classList.remove('hidden');
+        
+        // Load first page
+        loadPage(1);
+    }
+
+    function showGenerationError(message) {
+        showError(message);
+        fileDetails.classList.remove('hidden');
+        progressContainer.classList.add('hidden');
+    }
 
     // Navigation
     prevBtn.addEventListener('click', function() {
@@ -212,27 +362,66 @@ document.addEventListener('DOMContentLoaded', function() {
         currentPageSpan.textContent = pageNum;
         
         // Show loading state
+        if (pageDisplay.src.startsWith('blob:')) {
+            URL.revokeObjectURL(pageDisplay.src);
+        }
         pageDisplay.src = '';
         pageDisplay.alt = 'Loading...';
         
-        // Fetch page image
+        // Update button states
+        prevBtn.disabled = pageNum <= 1;
+        nextBtn.disabled = pageNum >= currentState.totalPages;
+        
+        fetchPage(pageNum);
+    }
+
+    // Fetch a page image, retrying while the server reports it as pending
+    function fetchPage(pageNum) {
         const pageSrc = `/get-page/${currentState.processedFilename}/${pageNum - 1}`;
         
-        // Create a new image to preload
-        const img = new Image();
-        img.onload = function() {
-            pageDisplay.src = pageSrc;
+        fetch(pageSrc)
+        .then(response => {
+            if (response.status === 202) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`Failed to load page ${pageNum}`);
+            }
+            return response.blob();
+        })
+        .then(blob => {
+            // Ignore responses for a page the user already navigated away from
+            if (pageNum !== currentState.currentPage) {
+                return;
+            }
+            
+            if (blob === null) {
+                pageDisplay.alt = 'Page is still being generated...';
+                setTimeout(() => {
+                    if (pageNum === currentState.currentPage) {
+                        fetchPage(pageNum);
+                    }
+                }, PAGE_RETRY_INTERVAL_MS);
+                return;
+            }
+            
+            pageDisplay.src = URL.createObjectURL(blob);
             pageDisplay.alt = `Page ${pageNum}`;
-        };
-        img.onerror = function() {
-            showError(`Failed to load page ${pageNum}`);
+            
+            prefetchPages(pageNum);
+        })
+        .catch(error => {
+            showError(error.message);
             pageDisplay.alt = 'Error loading page';
-        };
-        img.src = pageSrc;
-        
-        // Update button states
-        prevBtn.disabled = pageNum <= 1;
-        nextBtn.disabled = pageNum >= currentState.totalPages;
+        });
+    }
+
+    // Warm the browser cache with the next few pages
+    function prefetchPages(pageNum) {
+        const lastPage = Math.min(pageNum + PREFETCH_PAGES, currentState.totalPages);
+        for (let nextPage = pageNum + 1; nextPage <= lastPage; nextPage++) {
+            fetch(`/get-page/${currentState.processedFilename}/${nextPage - 1}`).catch(() => {});
+        }
     }
 
     // Error handling
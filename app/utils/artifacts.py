@@ -0,0 +1,373 @@
+import os
+import re
+import time
+import shutil
+import sqlite3
+import threading
+from app.utils.metrics import METRICS, count_bytes
+
+# Seconds between last-access writes for the same group
+TOUCH_INTERVAL = 60
+
+# Seconds between scans for groups past their maximum age
+EXPIRE_INTERVAL = 300
+
+# Groups deleted per eviction query
+EVICTION_BATCH = 32
+
+# `processed_<upload stem>_<kind>_<page>.<ext>` viewer renditions
+RENDITION_NAME = re.compile(r'^processed_(.+)_(?:view|thumb)_\d+\.\w+$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    group_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS groups_last_access ON groups (last_access);
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    group_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_group ON artifacts (group_id);
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO usage (id, bytes) VALUES (1, 0);
+"""
+
+def upload_filename_for(processed_filepath):
+    """Upload file name (the artifact group) of a processed PDF path"""
+    filename = os.path.basename(processed_filepath)
+    return filename[len('processed_'):] if filename.startswith('processed_') else filename
+
+def _disk_size(path):
+    """Size of a file, or of everything under a directory"""
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _delete(path):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ArtifactStore:
+    """
+    Disk-quota index of uploads and everything derived from them
+
+    An upload, its processed PDF, page renditions and checkpoints form one
+    group, named after the upload file. The index (SQLite, shared by all
+    worker processes) keeps each artifact's size and each group's last
+    access, so lookups and quota checks never list a directory. When the
+    total size goes over `max_bytes`, least recently used groups are
+    deleted as a whole, as are groups idle for longer than `max_age`.
+    Groups accessed within `min_idle` seconds are never evicted, which
+    covers uploads with a running job.
+    """
+
+    def __init__(self, index_path, max_bytes=0, max_age=0, min_idle=900):
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_idle = min_idle
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._touched = {}  # group -> monotonic time of its last access write
+        self._last_expiry = 0.0
+        self._stats = {'evicted_groups': 0, 'evicted_bytes': 0}
+
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+        # SQLite connections must not be used across a fork; a preloading
+        # server creates the store in its master process
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Keep the parent's connection referenced so it is never closed here
+        self._inherited = getattr(self._local, 'connection', None)
+        self._local = threading.local()
+
+    def _connection(self):
+        """One connection per thread, in autocommit mode with explicit transactions"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, statements):
+        """Run (sql, params) statements in one write transaction"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in statements:
+                connection.execute(sql, params)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def add(self, path, group_id, kind):
+        """
+        Record a new or rewritten artifact and enforce the quota
+
+        Args:
+            path (str): File or directory of the artifact
+            group_id (str): Upload file name the artifact belongs to
+            kind (str): 'upload', 'processed', 'rendition' or 'checkpoints'
+        """
+        path = os.path.abspath(path)
+        size = _disk_size(path)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT group_id, bytes FROM artifacts WHERE path = ?', (path,)).fetchone()
+            if row is not None:
+                connection.execute('UPDATE groups SET bytes = bytes - ? WHERE group_id = ?', (row[1], row[0]))
+                connection.execute('UPDATE usage SET bytes = bytes - ? WHERE id = 1', (row[1],))
+            connection.execute(
+                'INSERT OR REPLACE INTO artifacts (path, group_id, kind, bytes) VALUES (?, ?, ?, ?)',
+                (path, group_id, kind, size)
+            )
+            connection.execute(
+                'INSERT INTO groups (group_id, last_access, bytes) VALUES (?, ?, ?) '
+                'ON CONFLICT (group_id) DO UPDATE SET last_access = excluded.last_access, bytes = bytes + excluded.bytes',
+                (group_id, time.time(), size)
+            )
+            connection.execute('UPDATE usage SET bytes = bytes + ? WHERE id = 1', (size,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self._touched[group_id] = time.monotonic()
+        self.enforce()
+
+    def discard(self, path):
+        """Forget an artifact that was deleted outside the store"""
+        path = os.path.abspath(path)
+        row = self._connection().execute('SELECT group_id, bytes FROM artifacts WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return
+        self._transaction([
+            ('DELETE FROM artifacts WHERE path = ?', (path,)),
+            ('UPDATE groups SET bytes = bytes - ? WHERE group_id = ?', (row[1], row[0])),
+            ('UPDATE usage SET bytes = bytes - ? WHERE id = 1', (row[1],))
+        ])
+
+    def touch(self, group_id):
+        """
+        Mark a group as recently used
+
+        Writes are throttled to one per group every TOUCH_INTERVAL seconds,
+        so calling this on every page view is cheap.
+
+        Args:
+            group_id (str): Upload file name
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._touched.get(group_id, float('-inf')) < TOUCH_INTERVAL:
+                return
+            self._touched[group_id] = now
+        self._connection().execute(
+            'UPDATE groups SET last_access = ? WHERE group_id = ?', (time.time(), group_id)
+        )
+
+    def group_of(self, path):
+        """
+        Group an artifact belongs to
+
+        Returns:
+            str: Upload file name, or None if the path isn't indexed
+        """
+        row = self._connection().execute(
+            'SELECT group_id FROM artifacts WHERE path = ?', (os.path.abspath(path),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def usage(self):
+        """Total bytes of all indexed artifacts"""
+        return self._connection().execute('SELECT bytes FROM usage WHERE id = 1').fetchone()[0]
+
+    def enforce(self):
+        """Expire old groups (at most every EXPIRE_INTERVAL) and evict down to the quota"""
+        now = time.monotonic()
+        if self.max_age and now - self._last_expiry >= EXPIRE_INTERVAL:
+            self._last_expiry = now
+            self._evict_where('last_access < ?', time.time() - self.max_age, 'expired')
+        if self.max_bytes and self.usage() > self.max_bytes:
+            self._evict_where('last_access < ?', time.time() - self.min_idle, 'quota')
+
+    def _evict_where(self, condition, value, reason):
+        """Delete groups matching `condition`, oldest first, until none match or the quota is met"""
+        connection = self._connection()
+        while True:
+            if reason == 'quota' and self.usage() <= self.max_bytes:
+                return
+            groups = connection.execute(
+                f'SELECT group_id FROM groups WHERE {condition} ORDER BY last_access LIMIT ?',
+                (value, EVICTION_BATCH)
+            ).fetchall()
+            if not groups:
+                return
+            for (group_id,) in groups:
+                self.evict_group(group_id, reason)
+                if reason == 'quota' and self.usage() <= self.max_bytes:
+                    return
+
+    def evict_group(self, group_id, reason='manual'):
+        """
+        Delete every artifact of a group and drop it from the index
+
+        Args:
+            group_id (str): Upload file name
+            reason (str): Metric label for why the group was removed
+
+        Returns:
+            int: Bytes freed
+        """
+        connection = self._connection()
+        rows = connection.execute('SELECT path, bytes FROM artifacts WHERE group_id = ?', (group_id,)).fetchall()
+        for path, _ in rows:
+            _delete(path)
+
+        freed = sum(size for _, size in rows)
+        self._transaction([
+            ('DELETE FROM artifacts WHERE group_id = ?', (group_id,)),
+            ('DELETE FROM groups WHERE group_id = ?', (group_id,)),
+            ('UPDATE usage SET bytes = bytes - ? WHERE id = 1', (freed,))
+        ])
+        with self._lock:
+            self._touched.pop(group_id, None)
+            self._stats['evicted_groups'] += 1
+            self._stats['evicted_bytes'] += freed
+        METRICS.inc('artifact_evictions_total', reason=reason)
+        count_bytes('evicted', freed)
+        return freed
+
+    def adopt(self, upload_folder, processed_folder, checkpoint_folder):
+        """
+        Index files that were written before the store existed
+
+        Runs only while the index is empty, so it lists the folders once.
+
+        Args:
+            upload_folder (str): Folder of uploaded PDFs
+            processed_folder (str): Folder of processed PDFs and renditions
+            checkpoint_folder (str): Folder of per-upload checkpoints
+
+        Returns:
+            int: Number of artifacts indexed
+        """
+        if self._connection().execute('SELECT 1 FROM artifacts LIMIT 1').fetchone():
+            return 0
+
+        uploads = {}  # upload stem -> upload file name
+        found = []
+        for entry in os.scandir(upload_folder):
+            if entry.is_file() and not entry.name.startswith('.'):
+                uploads[os.path.splitext(entry.name)[0]] = entry.name
+                found.append((entry.path, entry.name, 'upload'))
+        for entry in os.scandir(processed_folder):
+            if not entry.is_file():
+                continue
+            match = RENDITION_NAME.match(entry.name)
+            if match:
+                stem = match.group(1)
+                found.append((entry.path, uploads.get(stem, f"{stem}.pdf"), 'rendition'))
+            elif entry.name.startswith('processed_'):
+                found.append((entry.path, upload_filename_for(entry.name), 'processed'))
+        if os.path.isdir(checkpoint_folder):
+            for entry in os.scandir(checkpoint_folder):
+                if entry.is_dir():
+                    found.append((entry.path, uploads.get(entry.name, f"{entry.name}.pdf"), 'checkpoints'))
+
+        # One transaction; a group's last access starts at its newest file's mtime
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            total = 0
+            for path, group_id, kind in found:
+                size = _disk_size(path)
+                total += size
+                connection.execute(
+                    'INSERT OR REPLACE INTO artifacts (path, group_id, kind, bytes) VALUES (?, ?, ?, ?)',
+                    (os.path.abspath(path), group_id, kind, size)
+                )
+                connection.execute(
+                    'INSERT INTO groups (group_id, last_access, bytes) VALUES (?, ?, ?) '
+                    'ON CONFLICT (group_id) DO UPDATE SET '
+                    'last_access = MAX(last_access, excluded.last_access), bytes = bytes + excluded.bytes',
+                    (group_id, os.path.getmtime(path), size)
+                )
+            connection.execute('UPDATE usage SET bytes = bytes + ? WHERE id = 1', (total,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        self.enforce()
+        return len(found)
+
+    def stats(self):
+        """
+        Snapshot of the store
+
+        Returns:
+            dict: Group and artifact counts, bytes used, quota and evictions
+        """
+        connection = self._connection()
+        with self._lock:
+            stats = dict(self._stats)
+        stats['groups'] = connection.execute('SELECT COUNT(*) FROM groups').fetchone()[0]
+        stats['artifacts'] = connection.execute('SELECT COUNT(*) FROM artifacts').fetchone()[0]
+        stats['bytes'] = self.usage()
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+# Index shared by requests, background jobs and renderers in this process
+_artifact_store = None
+_artifact_store_lock = threading.Lock()
+
+def get_artifact_store():
+    """
+    Get the process-wide artifact store
+
+    Returns:
+        ArtifactStore: Store configured from the environment
+    """
+    global _artifact_store
+    if _artifact_store is None:
+        with _artifact_store_lock:
+            if _artifact_store is None:
+                _artifact_store = ArtifactStore(
+                    os.getenv('ARTIFACT_INDEX', os.path.join(os.getcwd(), 'cache', 'artifacts.db')),
+                    max_bytes=int(float(os.getenv('ARTIFACT_QUOTA_MB', '10240')) * 1024 * 1024),
+                    max_age=float(os.getenv('ARTIFACT_MAX_AGE_HOURS', '168')) * 3600,
+                    min_idle=float(os.getenv('ARTIFACT_MIN_IDLE_SECONDS', '900'))
+                )
+    return _artifact_store
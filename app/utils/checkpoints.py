@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import tempfile
+from app.utils.note_layout import parse_notes, notes_from_list, flow_notes
+
+
+def parse_page_ranges(value, total_pages):
+    """
+    Parse a page selection such as "1-3,7" or [1, 2, 3]
+
+    Args:
+        value (str or list): Page numbers and inclusive ranges (1-based)
+        total_pages (int): Number of pages in the document
+
+    Returns:
+        list: Sorted, de-duplicated page numbers
+    """
+    if isinstance(value, (list, tuple)):
+        tokens = [str(item) for item in value]
+    else:
+        tokens = str(value).split(',')
+
+    pages = set()
+    for token in tokens:
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            if '-' in token:
+                first, last = (int(part) for part in token.split('-', 1))
+            else:
+                first = last = int(token)
+        except ValueError:
+            raise ValueError(f"Invalid page range: {token}")
+        if first < 1 or last > total_pages or first > last:
+            raise ValueError(f"Page range {token} is outside 1-{total_pages}")
+        pages.update(range(first, last + 1))
+
+    if not pages:
+        raise ValueError("No pages selected")
+    return sorted(pages)
+
+
+class CheckpointStore:
+    """
+    Per-upload store of finished pages, so a re-run only redoes what's missing
+
+    Each page keeps its generated notes text, the notes parsed from it and
+    their layout, so the note page can be drawn again in either format or
+    at any scale without parsing or calling the API. Failed pages are
+    stored without a note page and are retried on the next run. The store
+    is tied to the uploaded file's size and mtime and is cleared when they
+    change.
+    """
+
+    def __init__(self, directory, source_path):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        stat = os.stat(source_path)
+        fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        manifest_path = os.path.join(directory, 'manifest.json')
+        manifest = self._read_json(manifest_path)
+        if manifest is None or manifest.get('source') != fingerprint:
+            self.clear()
+            self._write_json(manifest_path, {'source': fingerprint})
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as json_file:
+                return json.load(json_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path, data):
+        """Write JSON atomically so a crash never leaves a torn checkpoint"""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as json_file:
+                json.dump(data, json_file)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _page_path(self, page_number, extension):
+        return os.path.join(self.directory, f"page_{page_number}.{extension}")
+
+    def clear(self, page_numbers=None):
+        """
+        Drop checkpoints
+
+        Args:
+            page_numbers (iterable): Pages to drop; all pages if None
+        """
+        if page_numbers is None:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            return
+        for page_number in page_numbers:
+            for extension in ('json', 'png'):
+                path = self._page_path(page_number, extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def load(self, page_number):
+        """
+        Load a page checkpoint
+
+        Args:
+            page_number (int): 1-based page number
+
+        Returns:
+            dict: 'status', 'text', 'error', 'width', 'height', 'analysis',
+                'parsed_notes' (tuple of `Note`) and 'note_layout' (list);
+                None if the page has no checkpoint
+        """
+        checkpoint = self._read_json(self._page_path(page_number, 'json'))
+        if checkpoint is None:
+            return None
+
+        checkpoint['note_image'] = None
+        parsed_notes = checkpoint.get('parsed_notes')
+        checkpoint['parsed_notes'] = None if parsed_notes is None else notes_from_list(parsed_notes)
+        checkpoint.setdefault('note_layout', None)
+        if checkpoint['status'] == 'completed' and checkpoint['note_layout'] is None:
+            # Raster checkpoints from older versions kept an image instead of
+            # the layout; lay their text out again
+            if checkpoint['parsed_notes'] is None:
+                checkpoint['parsed_notes'] = parse_notes(checkpoint['text'] or '')
+            checkpoint['note_layout'] = flow_notes(checkpoint['parsed_notes'], checkpoint['width'], checkpoint['height'])
+        return checkpoint
+
+    def completed_pages(self, total_pages):
+        """Page numbers that finished successfully in an earlier run"""
+        completed = []
+        for page_number in range(1, total_pages + 1):
+            checkpoint = self._read_json(self._page_path(page_number, 'json'))
+            if checkpoint is not None and checkpoint.get('status') == 'completed':
+                completed.append(page_number)
+        return completed
+
+    def save(self, page_result):
+        """
+        Persist one page result from the notes pipeline
+
+        Args:
+            page_result (dict): Page number, status, text, error, page size,
+                analysis, parsed notes and note layout
+        """
+        page_number = page_result['page_number']
+        completed = page_result['error'] is None
+        self._write_json(self._page_path(page_number, 'json'), {
+            'page_number': page_number,
+            'status': 'completed' if completed else 'failed',
+            'text': page_result['text'],
+            'error': page_result['error'],
+            'width': page_result['width'],
+            'height': page_result['height'],
+            'analysis': page_result['analysis'],
+            'parsed_notes': page_result['parsed_notes'] if completed else None,
+            'note_layout': page_result['note_layout'] if completed else None
+        })
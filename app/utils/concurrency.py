@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter
+
+    Tokens are refilled continuously at `rate` per second up to `capacity`.
+    Callers block in `acquire` until enough tokens are available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def acquire(self, tokens=1):
+        """
+        Block until `tokens` tokens are available, then consume them
+
+        Args:
+            tokens (int): Number of tokens to consume
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                # Time until enough tokens have been refilled
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestThrottle:
+    """
+    Combine a token bucket rate limit with a cap on in-flight requests
+
+    Either limit can be disabled by passing None.
+    """
+
+    def __init__(self, requests_per_second=None, max_in_flight=None, burst=None):
+        self.bucket = TokenBucket(requests_per_second, burst) if requests_per_second else None
+        self.semaphore = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+    @contextmanager
+    def slot(self):
+        """Context manager that holds one request slot for the duration of a call"""
+        if self.semaphore is not None:
+            self.semaphore.acquire()
+        try:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            yield
+        finally:
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+
+def imap_ordered(func, items, max_workers=4, on_error=None, window=None):
+    """
+    Lazily apply `func` to items on a thread pool, yielding results in input order
+
+    Items are pulled from `items` only as pool capacity frees up, so at most
+    `window` items (default: twice the pool size) are in memory at once. A
+    failure on one item does not cancel the others; failed items are replaced
+    by the return value of `on_error(item, exception)`, or None.
+
+    Args:
+        func (callable): Function applied to each item
+        items (iterable): Items to process (may be a generator)
+        max_workers (int): Size of the thread pool
+        on_error (callable): Optional fallback for failed items
+        window (int): Maximum number of submitted but not yet yielded items
+
+    Yields:
+        object: Result for each item, in the same order as `items`
+    """
+    def call(item):
+        try:
+            return func(item)
+        except Exception as e:
+            return on_error(item, e) if on_error else None
+
+    if max_workers <= 1:
+        for item in items:
+            yield call(item)
+        return
+
+    window = max(window or max_workers * 2, max_workers)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for item in items:
+            pending.append(executor.submit(call, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
@@ -0,0 +1,55 @@
+import os
+from functools import lru_cache
+from PIL import ImageFont
+
+# Handwriting font shipped in the Docker image; None falls back to PIL's default font
+FONT_PATH = os.path.join(os.path.dirname(__file__), '../../app/static/fonts/handwriting.ttf')
+if not os.path.exists(FONT_PATH):
+    FONT_PATH = None
+
+# Range of font sizes used for note lines (inclusive, exclusive)
+NOTE_FONT_SIZES = (22, 32)
+
+# Font size of note headings
+HEADING_FONT_SIZE = 36
+
+@lru_cache(maxsize=None)
+def get_font(size):
+    """
+    Get the handwriting font at a given size, loaded once per process
+    
+    Args:
+        size (int): Font size in pixels
+    
+    Returns:
+        PIL.ImageFont.ImageFont: Handwriting font, or PIL's default font if unavailable
+    """
+    try:
+        if FONT_PATH:
+            return ImageFont.truetype(FONT_PATH, size)
+    except Exception:
+        pass
+    return _default_font()
+
+@lru_cache(maxsize=1)
+def _default_font():
+    return ImageFont.load_default()
+
+@lru_cache(maxsize=8192)
+def text_length(text, size):
+    """
+    Width of a line of text in the handwriting font, memoized per string and size
+    
+    Args:
+        text (str): Text to measure
+        size (int): Font size in pixels
+    
+    Returns:
+        float: Advance width in pixels
+    """
+    return get_font(size).getlength(text)
+
+def preload_fonts():
+    """Load every note font size up front (e.g. before forking workers)"""
+    for size in (*range(*NOTE_FONT_SIZES), HEADING_FONT_SIZE):
+        get_font(size)
@@ -1,48 +1,58 @@
 import os
-import io
 import base64
-import requests
-import json
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
-import tempfile
+import re
+import time
+import threading
+from PIL import ImageDraw, ImageFont
+from app.utils.gemini_http import GeminiClient
+from app.utils.response_cache import ResponseCache
+from app.utils.texture import pencil_texture
+from app.utils.image_encoding import upload_settings, encode_page_for_upload
+from app.utils.fonts import FONT_PATH, get_font
+from app.utils.note_layout import Note, parse_notes, flow_notes
+from app.utils.metrics import METRICS, timed, record_stage
 
-# Check if the API key is set
+# API key, checked when the client is first needed so the app can start
+# (and be benchmarked against a local stand-in) without it
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable is not set")
 
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro-vision:generateContent"
+# Base URL of the Gemini API; point it at a local server for benchmarks
+GEMINI_API_BASE_URL = os.getenv('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com').rstrip('/')
+GEMINI_API_URL = f"{GEMINI_API_BASE_URL}/v1beta/models/gemini-pro-vision:generateContent"
 
-# Load handwriting-like fonts
-try:
-    # Try to load a handwriting font
-    font_path = os.path.join(os.path.dirname(__file__), '../../app/static/fonts/handwriting.ttf')
-    if not os.path.exists(font_path):
-        # If the font doesn't exist, we'll use a default font later
-        font_path = None
-except Exception:
-    font_path = None
+# Shared HTTP client, created lazily and reused by every request thread
+_client = None
+_client_lock = threading.Lock()
 
-def generate_notes(page_content):
+def get_client(create=True):
     """
-    Generate handwritten-style notes using Gemini model
+    Get the process-wide Gemini HTTP client
     
     Args:
-        page_content (dict): Dictionary containing text and image from PDF page
-    
+        create (bool): Build the client if it doesn't exist yet
+        
     Returns:
-        PIL.Image: Image with handwritten-style notes
+        GeminiClient: Pooled keep-alive client configured from the environment,
+            or None if it hasn't been built and `create` is False
     """
-    try:
-        # Extract text and image from page content
-        text = page_content['text']
-        image_bytes = page_content['image']
-        width = page_content['width']
-        height = page_content['height']
-        
-        # Create prompt for Gemini
-        prompt = """
+    global _client
+    if _client is None and create:
+        with _client_lock:
+            if _client is None:
+                if not GEMINI_API_KEY:
+                    raise ValueError("GEMINI_API_KEY environment variable is not set")
+                _client = GeminiClient(
+                    GEMINI_API_KEY,
+                    GEMINI_API_URL,
+                    pool_size=int(os.getenv('GEMINI_POOL_SIZE', '10')),
+                    connect_timeout=float(os.getenv('GEMINI_CONNECT_TIMEOUT', '5')),
+                    read_timeout=float(os.getenv('GEMINI_READ_TIMEOUT', '120')),
+                    max_retries=int(os.getenv('GEMINI_MAX_RETRIES', '4'))
+                )
+    return _client
+
+# Prompt sent with every page
+NOTES_PROMPT = """
         Create handwritten notes from this PDF page content. Focus on:
         1. Key concepts and important points
         2. Use arrows to connect related ideas
@@ -56,78 +66,260 @@ def generate_notes(page_content):
         Format your response as a structured list of notes with positions
         (x, y coordinates), content (text or drawing instructions), and style (normal text, underline, arrow, etc.).
         """
-        
-        # Prepare image for API request
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # Construct API request
-        request_data = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt},
-                        {
-                            "inline_data": {
-                                "mime_type": "image/png",
-                                "data": image_base64
-                            }
-                        }
-                    ]
-                }
-            ]
+
+# On-disk cache of generated text, keyed by page content + prompt + model
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Get the process-wide Gemini response cache
+    
+    Returns:
+        ResponseCache: Cache configured from the environment, or None if disabled
+    """
+    global _response_cache
+    max_mb = float(os.getenv('GEMINI_CACHE_MAX_MB', '512'))
+    if max_mb <= 0:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    os.getenv('GEMINI_CACHE_DIR', os.path.join(os.getcwd(), 'cache', 'gemini')),
+                    int(max_mb * 1024 * 1024)
+                )
+    return _response_cache
+
+# Instructions appended to the prompt when several pages share one request
+BATCH_PROMPT = """
+        You will receive {page_count} consecutive pages, each introduced by a line
+        "=== PAGE n ===". Write separate notes for every page and start each page's
+        notes with that same marker line, in the same order, with nothing before the
+        first marker.
+        """
+
+# Marker lines separating pages in a batched response
+PAGE_MARKER = re.compile(r'^\W*=+\s*PAGE\s+(\d+)\s*=+\W*$', re.IGNORECASE | re.MULTILINE)
+
+def _cache_key(cache, page_content, settings):
+    """Cache key for a page's generated text under the current prompt and encoding"""
+    return cache.make_key(
+        GEMINI_API_URL, NOTES_PROMPT, repr(sorted(settings.items())),
+        page_content['text'], page_content['image']
+    )
+
+def _page_part(page_content, encoded):
+    """Request part carrying one encoded page"""
+    if encoded['text_only']:
+        return {"text": f"Page text:\n{page_content['text']}"}
+    return {
+        "inline_data": {
+            "mime_type": encoded['mime_type'],
+            "data": base64.b64encode(encoded['data']).decode('utf-8')
         }
-        
-        # Make API request
-        response = requests.post(
-            f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(request_data)
-        )
-        
-        response_data = response.json()
-        
-        # Check if the API call was successful
-        if response.status_code != 200:
-            error_message = response_data.get('error', {}).get('message', 'Unknown error')
-            raise Exception(f"Gemini API error: {error_message}")
-        
-        # Extract AI-generated notes from response
-        generated_content = response_data.get('candidates', [])[0].get('content', {}).get('parts', [])[0].get('text', '')
-        
-        # Parse the generated content to extract note information
-        notes = parse_generated_notes(generated_content)
-        
-        # Create a blank page with pencil texture
-        note_image = create_pencil_texture_background(width, height)
-        draw = ImageDraw.Draw(note_image)
-        
-        # Try to load a handwriting-like font, or use default
-        try:
-            if font_path:
-                base_font = ImageFont.truetype(font_path, 28)
-            else:
-                base_font = ImageFont.load_default()
-        except Exception:
-            base_font = ImageFont.load_default()
-        
-        # Draw the generated notes onto the blank page
-        draw_notes_on_image(draw, notes, base_font, width, height)
-        
-        return note_image
+    }
+
+def _response_text(response_data):
+    """Extract AI-generated text from a generateContent response"""
+    return response_data.get('candidates', [])[0].get('content', {}).get('parts', [])[0].get('text', '')
+
+def _encode(page_content, settings):
+    """Encode a page for upload, recording the encoding time"""
+    encoded = encode_page_for_upload(page_content, settings)
+    record_stage('upload_encode', encoded['seconds'])
+    return encoded
+
+def _cached_text(cache, cache_key):
+    """Look up a cached response, counting hits and misses"""
+    cached_text = cache.get(cache_key)
+    METRICS.inc('response_cache_total', result='miss' if cached_text is None else 'hit')
+    return cached_text
+
+def _upload_details(encoded, request_seconds, batch_size=1):
+    return {
+        'cached': False,
+        'text_only': encoded['text_only'],
+        'bytes_sent': encoded['bytes'],
+        'encode_seconds': round(encoded['seconds'], 3),
+        'request_seconds': round(request_seconds, 3),
+        'batch_size': batch_size
+    }
+
+def split_batched_notes(content, page_count):
+    """
+    Split a batched response into per-page notes text
+    
+    Args:
+        content (str): Response text with "=== PAGE n ===" marker lines
+        page_count (int): Number of pages in the batch
+    
+    Returns:
+        list: Notes text for each page, or None if the response is malformed
+    """
+    markers = list(PAGE_MARKER.finditer(content))
+    if [int(marker.group(1)) for marker in markers] != list(range(1, page_count + 1)):
+        return None
+    
+    sections = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(content)
+        section = content[marker.end():end].strip()
+        if not section:
+            return None
+        sections.append(section)
+    return sections
+
+def _fetch_single(page_content, encoded, cache, cache_key, throttle):
+    """Request notes for one already encoded page and cache the result"""
+    # Construct API request
+    request_data = {"contents": [{"parts": [{"text": NOTES_PROMPT}, _page_part(page_content, encoded)]}]}
+    
+    # Make API request through the shared client (retries transient errors
+    # and holds a throttle slot per attempt when running concurrently)
+    started = time.perf_counter()
+    response_data = get_client().generate_content(request_data, throttle=throttle)
+    page_content['upload'] = _upload_details(encoded, time.perf_counter() - started)
+    
+    generated_content = _response_text(response_data)
+    
+    if cache is not None:
+        cache.put(cache_key, generated_content)
+    
+    return generated_content
+
+def _fetch_batch(batch, cache, throttle):
+    """
+    Request notes for several (page_content, encoded, cache_key) entries at once
+    
+    Returns:
+        list: Notes text per page, or None if the request failed or the
+            response could not be split
+    """
+    parts = [{"text": NOTES_PROMPT + BATCH_PROMPT.format(page_count=len(batch))}]
+    for number, (page_content, encoded, _) in enumerate(batch, start=1):
+        parts.append({"text": f"=== PAGE {number} ==="})
+        parts.append(_page_part(page_content, encoded))
+    
+    started = time.perf_counter()
+    try:
+        response_data = get_client().generate_content({"contents": [{"parts": parts}]}, throttle=throttle)
+        sections = split_batched_notes(_response_text(response_data), len(batch))
+    except Exception:
+        return None
+    if sections is None:
+        return None
+    request_seconds = time.perf_counter() - started
+    
+    for (page_content, encoded, cache_key), section in zip(batch, sections):
+        page_content['upload'] = _upload_details(encoded, request_seconds, batch_size=len(batch))
+        if cache is not None:
+            cache.put(cache_key, section)
+    return sections
+
+def fetch_generated_texts(page_contents, throttle=None, max_batch_bytes=4 * 1024 * 1024, refresh=False):
+    """
+    Get notes text for consecutive pages, packing uncached pages into shared requests
+    
+    Pages are grouped into one request until the encoded payload would exceed
+    `max_batch_bytes`. If a batched request fails or its response can't be
+    split back into pages, those pages fall back to one request each.
+    
+    Args:
+        page_contents (list): Consecutive extracted page contents
+        throttle (RequestThrottle): Optional shared rate limit / in-flight cap for API calls
+        max_batch_bytes (int): Encoded byte budget per batched request
+        refresh (bool): Skip cached responses (new responses are still cached)
     
-    except Exception as e:
-        # In case of error, return a blank page with error message
-        error_image = create_pencil_texture_background(width, height)
-        draw = ImageDraw.Draw(error_image)
+    Returns:
+        list: One dict per page with 'text' (str or None) and 'error' (str or None)
+    """
+    settings = upload_settings()
+    cache = get_response_cache()
+    results = [None] * len(page_contents)
+    
+    # Serve what we can from the cache, then encode the rest
+    pending = []
+    for index, page_content in enumerate(page_contents):
+        cache_key = None
+        if cache is not None:
+            cache_key = _cache_key(cache, page_content, settings)
+            cached_text = None if refresh else _cached_text(cache, cache_key)
+            if cached_text is not None:
+                page_content['upload'] = {'cached': True, 'bytes_sent': 0}
+                results[index] = {'text': cached_text, 'error': None}
+                continue
+        pending.append((index, page_content, _encode(page_content, settings), cache_key))
+    
+    # Pack pages into batches within the byte budget
+    batches = []
+    for entry in pending:
+        if batches and sum(item[2]['bytes'] for item in batches[-1]) + entry[2]['bytes'] <= max_batch_bytes:
+            batches[-1].append(entry)
+        else:
+            batches.append([entry])
+    
+    for batch in batches:
+        sections = None
+        if len(batch) > 1:
+            sections = _fetch_batch([entry[1:] for entry in batch], cache, throttle)
         
-        try:
-            font = ImageFont.load_default()
-            draw.text((50, 50), f"Error generating notes: {str(e)}", fill=(100, 100, 100), font=font)
-        except Exception:
-            # Fallback if even drawing error message fails
-            pass
+        if sections is not None:
+            for (index, _, _, _), section in zip(batch, sections):
+                results[index] = {'text': section, 'error': None}
+            continue
         
-        return error_image
+        # Single page, or the batch failed: one request per page
+        for index, page_content, encoded, cache_key in batch:
+            try:
+                text = _fetch_single(page_content, encoded, cache, cache_key, throttle)
+                results[index] = {'text': text, 'error': None}
+            except Exception as e:
+                results[index] = {'text': None, 'error': str(e)}
+    
+    return results
+
+def layout_generated_notes(generated_content, width, height):
+    """
+    Lay out generated notes text without rendering it
+    
+    The text is parsed once per distinct response (see `parse_notes`), so
+    laying the same notes out again, e.g. for another page size, is cheap.
+    
+    Args:
+        generated_content (str): Raw notes text from Gemini
+        width (int): Width of the page
+        height (int): Height of the page
+    
+    Returns:
+        list: Drawing operations from `flow_notes`
+    """
+    with timed('layout_notes'):
+        return flow_notes(parse_notes(generated_content), width, height)
+
+def render_error_image(message, width, height):
+    """
+    Render a blank textured page carrying an error message
+    
+    Args:
+        message (str): Error description
+        width (int): Width of the page
+        height (int): Height of the page
+    
+    Returns:
+        PIL.Image: Error page
+    """
+    error_image = create_pencil_texture_background(width, height)
+    draw = ImageDraw.Draw(error_image)
+    
+    try:
+        font = ImageFont.load_default()
+        draw.text((50, 50), f"Error generating notes: {message}", fill=(100, 100, 100), font=font)
+    except Exception:
+        # Fallback if even drawing error message fails
+        pass
+    
+    return error_image
 
 def parse_generated_notes(content):
     """
@@ -139,45 +331,30 @@ def parse_generated_notes(content):
     Returns:
         list: List of note elements with positions and styles
     """
-    # This is a simplified parser - in a real application, you might want a more robust parser
-    notes = []
-    
-    # Very simple parsing for demonstration - extract key points
-    for line in content.split('\n'):
-        if line.strip():
-            # Create a random position for the note
-            notes.append({
-                'type': 'text',
-                'content': line,
-                'position': None,  # We'll assign positions later
-                'style': 'normal'
-            })
-    
-    return notes
+    return [
+        {
+            'type': 'text',
+            'content': note.text,
+            'position': None if note.x is None else (note.x, note.y),
+            'style': note.style
+        }
+        for note in parse_notes(content)
+    ]
 
-def create_pencil_texture_background(width, height):
+def create_pencil_texture_background(width, height, seed=None):
     """
     Create a background with pencil texture
     
     Args:
         width (int): Width of the image
         height (int): Height of the image
+        seed (int): Optional seed for reproducible texture
     
     Returns:
         PIL.Image: Image with pencil texture background
     """
-    # Create a white background
-    background = Image.new('RGB', (width, height), color=(255, 255, 255))
-    draw = ImageDraw.Draw(background)
-    
-    # Add subtle texture (very light gray noise)
-    for _ in range(width * height // 100):  # Adjust density as needed
-        x = np.random.randint(0, width)
-        y = np.random.randint(0, height)
-        gray = np.random.randint(240, 252)
-        draw.point((x, y), fill=(gray, gray, gray))
-    
-    return background
+    # Very light gray noise from the shared, cached texture generator
+    return pencil_texture(width, height, gray_range=(240, 252), seed=seed)
 
 def draw_notes_on_image(draw, notes, base_font, width, height):
     """
@@ -193,96 +370,62 @@ def draw_notes_on_image(draw, notes, base_font, width, height):
     Returns:
         None
     """
-    # Define margin
-    margin = 50
+    draw_layout(draw, layout_notes(notes, width, height), base_font=base_font)
+
+def layout_notes(notes, width, height):
+    """
+    Lay out note elements from `parse_generated_notes`
     
-    # Default values for hand-drawn appearance
-    pencil_color = (80, 80, 80)  # Dark gray for pencil
+    Args:
+        notes (list): List of note elements
+        width (int): Width of the page
+        height (int): Height of the page
     
-    # Layout the notes with some randomness to appear handwritten
-    current_y = margin + np.random.randint(0, 30)
+    Returns:
+        list: Drawing operations from `flow_notes`
+    """
+    return flow_notes([
+        Note(note['content'], note.get('style') or 'normal', *(note.get('position') or (None, None)))
+        for note in notes if note.get('content', '').strip()
+    ], width, height)
+
+def draw_layout(draw, ops, base_font=None, scale=1.0):
+    """
+    Replay layout operations onto an image
     
-    for note in notes:
-        # Skip empty notes
-        if not note.get('content', '').strip():
-            continue
-        
-        # Add some randomness to the position to make it look more natural
-        current_x = margin + np.random.randint(0, 40)
-        
-        # Slightly vary the font size and rotation for a more natural look
-        font_size = np.random.randint(22, 32)
-        try:
-            if font_path:
-                font = ImageFont.truetype(font_path, font_size)
+    Args:
+        draw (PIL.ImageDraw.ImageDraw): Drawing context
+        ops (list): Drawing operations from `flow_notes`
+        base_font (PIL.ImageFont.ImageFont): Font used when no handwriting font is installed
+        scale (float): Image pixels per page pixel
+    
+    Returns:
+        None
+    """
+    for op in ops:
+        if op['op'] == 'text':
+            if FONT_PATH or base_font is None:
+                font = get_font(max(1, round(op['size'] * scale)))
             else:
                 font = base_font
-        except Exception:
-            font = base_font
-        
-        # Calculate text size and check if it fits on current line
-        text_width = draw.textlength(note['content'], font=font)
-        if current_x + text_width > width - margin:
-            # Move to next line
-            current_y += font_size * 1.5
-            current_x = margin + np.random.randint(0, 40)
-        
-        # Draw text with slight variation in color to mimic pencil
-        text_color = (np.random.randint(50, 90), np.random.randint(50, 90), np.random.randint(50, 90))
-        
-        # Add slight angle variation to text
-        rotation_angle = np.random.uniform(-1, 1)
-        
-        # Draw the text
-        draw.text((current_x, current_y), note['content'], fill=text_color, font=font)
-        
-        # Randomly underline some text (about 30% chance)
-        if np.random.random() < 0.3:
-            # Draw rough underline (not perfectly straight)
-            y_underline = current_y + font_size + np.random.randint(0, 5)
-            
-            # Draw underline as a series of short, slightly uneven lines
-            x_start = current_x
-            while x_start < current_x + text_width:
-                segment_length = np.random.randint(5, 20)
-                y_variation = np.random.randint(-2, 3)
-                draw.line(
-                    (x_start, y_underline + y_variation, 
-                     min(x_start + segment_length, current_x + text_width), y_underline + y_variation),
-                    fill=pencil_color,
-                    width=1
-                )
-                x_start += segment_length
-        
-        # Randomly add arrows (about 15% chance)
-        if np.random.random() < 0.15:
-            # Calculate arrow start position
-            arrow_x = current_x - 20 + np.random.randint(-10, 10)
-            arrow_y = current_y + font_size/2 + np.random.randint(-10, 10)
-            
-            # Draw arrow (simplified)
-            arrow_length = np.random.randint(15, 25)
-            draw.line(
-                (arrow_x - arrow_length, arrow_y, arrow_x, arrow_y),
-                fill=pencil_color,
-                width=1
-            )
-            # Arrow head
-            draw.line(
-                (arrow_x, arrow_y, arrow_x - 5, arrow_y - 5),
-                fill=pencil_color,
-                width=1
-            )
-            draw.line(
-                (arrow_x, arrow_y, arrow_x - 5, arrow_y + 5),
-                fill=pencil_color,
-                width=1
-            )
-        
-        # Move down for next item
-        current_y += font_size * 1.5
-        
-        # If we're getting too far down the page, reset to a new column
-        if current_y > height - margin:
-            current_y = margin + np.random.randint(0, 30)
-            margin += width // 2  # Move to right half of page
\ No newline at end of file
+            draw.text((op['x'] * scale, op['y'] * scale), op['text'], fill=tuple(op['color']), font=font)
+        elif op['op'] == 'line':
+            points = [(x * scale, y * scale) for x, y in op['points']]
+            draw.line(points, fill=tuple(op['color']), width=max(1, round(op['width'] * scale)))
+
+def render_layout_image(ops, width, height, scale=1.0):
+    """
+    Render a laid-out note page as an image
+    
+    Args:
+        ops (list): Drawing operations from `flow_notes`
+        width (int): Width of the page
+        height (int): Height of the page
+        scale (float): Image pixels per page pixel
+    
+    Returns:
+        PIL.Image: Note page image
+    """
+    image = create_pencil_texture_background(max(1, round(width * scale)), max(1, round(height * scale)))
+    draw_layout(ImageDraw.Draw(image), ops, scale=scale)
+    return image
@@ -0,0 +1,196 @@
+import json
+import time
+import random
+import threading
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.metrics import record_stage, count_bytes
+
+# Status codes that are worth retrying (rate limited / transient server errors)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeminiAPIError(Exception):
+    """Error returned by the Gemini API after all retries were exhausted"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GeminiClient:
+    """
+    Long-lived, thread-safe HTTP client for the Gemini generateContent endpoint
+
+    Keeps a pooled keep-alive `requests.Session`, applies connect/read timeouts
+    and retries transient failures with exponential backoff and full jitter,
+    honoring `Retry-After` when the server sends it.
+    """
+
+    def __init__(self, api_key, api_url, pool_size=10, connect_timeout=5.0,
+                 read_timeout=120.0, max_retries=4, backoff_base=0.5, backoff_max=30.0):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # A single session shares its connection pool across threads; block
+        # instead of opening extra connections when the pool is exhausted
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                   pool_block=True, max_retries=0)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive'
+        })
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'bytes_sent': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0
+        }
+
+    def generate_content(self, request_data, throttle=None):
+        """
+        POST a generateContent request, retrying transient failures
+
+        Args:
+            request_data (dict): JSON body for the request
+            throttle (RequestThrottle): Optional rate limit held for each attempt
+
+        Returns:
+            dict: Decoded JSON response
+        """
+        body = json.dumps(request_data).encode('utf-8')
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            started = time.perf_counter()
+            try:
+                with throttle.slot() if throttle else nullcontext():
+                    response = self.session.post(
+                        self.api_url,
+                        params={'key': self.api_key},
+                        data=body,
+                        timeout=self.timeout
+                    )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                elapsed = time.perf_counter() - started
+                self._record_request(elapsed, len(body))
+                record_stage('gemini_request', elapsed, error=response is None or response.status_code != 200)
+                count_bytes('gemini_sent', len(body))
+                if response is not None:
+                    count_bytes('gemini_received', len(response.content))
+
+            if response is not None and response.status_code == 200:
+                return response.json()
+
+            retryable = error is not None or response.status_code in RETRY_STATUS_CODES
+            if not retryable or attempt >= self.max_retries:
+                with self._lock:
+                    self._stats['failures'] += 1
+                if error is not None:
+                    raise GeminiAPIError(f"Gemini API request failed: {error}")
+                raise GeminiAPIError(
+                    f"Gemini API error: {self._error_message(response)}",
+                    status_code=response.status_code
+                )
+
+            with self._lock:
+                self._stats['retries'] += 1
+            time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    def _retry_delay(self, attempt, response):
+        """Seconds to wait before the next attempt"""
+        retry_after = self._parse_retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+
+        # Exponential backoff with full jitter
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def _parse_retry_after(response):
+        """Parse a Retry-After header given either in seconds or as an HTTP date"""
+        if response is None:
+            return None
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _error_message(response):
+        try:
+            return response.json().get('error', {}).get('message', 'Unknown error')
+        except ValueError:
+            return f"HTTP {response.status_code}"
+
+    def _record_request(self, elapsed, bytes_sent):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['bytes_sent'] += bytes_sent
+            self._stats['latency_total'] += elapsed
+            self._stats['latency_max'] = max(self._stats['latency_max'], elapsed)
+
+    def stats(self):
+        """
+        Snapshot of client counters
+
+        Returns:
+            dict: Request, retry, failure, upload size, connection reuse and latency counters
+        """
+        # urllib3 tracks how many connections each pool opened and how many
+        # requests it served; the difference is keep-alive reuse
+        connections_opened = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections_opened += pool.num_connections
+                pool_requests += pool.num_requests
+
+        with self._lock:
+            stats = dict(self._stats)
+
+        requests_made = stats['requests']
+        return {
+            'requests': requests_made,
+            'retries': stats['retries'],
+            'failures': stats['failures'],
+            'bytes_sent': stats['bytes_sent'],
+            'connections_opened': connections_opened,
+            'connections_reused': max(0, pool_requests - connections_opened),
+            'latency_avg_ms': round(1000 * stats['latency_total'] / requests_made, 2) if requests_made else 0.0,
+            'latency_max_ms': round(1000 * stats['latency_max'], 2)
+        }
+
+    def close(self):
+        self.session.close()
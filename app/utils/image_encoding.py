@@ -0,0 +1,115 @@
+import os
+import io
+import time
+from PIL import Image, ImageChops, ImageStat
+
+# MIME types for the supported upload formats
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png'}
+
+# Mean channel difference below which a page counts as grayscale
+GRAYSCALE_THRESHOLD = 6
+
+def upload_settings():
+    """
+    Read page upload encoding settings from the environment
+
+    Returns:
+        dict: Target long edge, image format/quality, grayscale mode and
+            minimum extracted text length for text-only requests
+    """
+    image_format = os.getenv('GEMINI_IMAGE_FORMAT', 'JPEG').upper()
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported Gemini image format: {image_format}")
+
+    return {
+        'max_edge': int(os.getenv('GEMINI_IMAGE_MAX_EDGE', '1600')),
+        'format': image_format,
+        'quality': int(os.getenv('GEMINI_IMAGE_QUALITY', '80')),
+        'grayscale': os.getenv('GEMINI_GRAYSCALE', 'auto').lower(),
+        'text_only_min_chars': int(os.getenv('GEMINI_TEXT_ONLY_MIN_CHARS', '0'))
+    }
+
+def is_grayscale(image):
+    """
+    Check whether a page has (almost) no color
+
+    Args:
+        image (PIL.Image): Page image
+
+    Returns:
+        bool: True if the page can be sent as grayscale without losing information
+    """
+    if image.mode in ('1', 'L', 'LA'):
+        return True
+
+    # Compare channels on a small thumbnail; colored pages differ between channels
+    sample = image.convert('RGB').resize((64, 64))
+    red, green, blue = sample.split()
+    spread = ImageChops.lighter(
+        ImageChops.difference(red, green),
+        ImageChops.lighter(ImageChops.difference(green, blue), ImageChops.difference(red, blue))
+    )
+    return ImageStat.Stat(spread).mean[0] < GRAYSCALE_THRESHOLD
+
+def encode_page_for_upload(page_content, settings):
+    """
+    Encode a page as compactly as possible for a Gemini request
+
+    Sends only the extracted text when it is long enough to stand on its
+    own; otherwise downscales the page image to the target long edge,
+    converts it to grayscale when it has no color, and re-encodes it.
+
+    Args:
+        page_content (dict): Dictionary containing text and image from PDF page
+        settings (dict): Encoding settings from `upload_settings`
+
+    Returns:
+        dict: 'text_only', 'mime_type', encoded 'data' (None for text-only),
+            encoded 'bytes' and 'seconds' spent encoding
+    """
+    started = time.perf_counter()
+    text = page_content['text'] or ''
+
+    min_chars = settings['text_only_min_chars']
+    if min_chars and len(text.strip()) >= min_chars:
+        return {
+            'text_only': True,
+            'mime_type': None,
+            'data': None,
+            'bytes': len(text.encode('utf-8')),
+            'seconds': time.perf_counter() - started
+        }
+
+    original = page_content['image']
+    image = Image.open(io.BytesIO(original))
+
+    # Downscale so the long edge fits the target (never upscale)
+    long_edge = max(image.size)
+    if settings['max_edge'] and long_edge > settings['max_edge']:
+        scale = settings['max_edge'] / long_edge
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+
+    grayscale = settings['grayscale'] == 'always' or (settings['grayscale'] == 'auto' and is_grayscale(image))
+    image = image.convert('L' if grayscale else 'RGB')
+
+    buffer = io.BytesIO()
+    if settings['format'] == 'PNG':
+        image.save(buffer, format='PNG', optimize=True)
+    else:
+        image.save(buffer, format=settings['format'], quality=settings['quality'])
+    data = buffer.getvalue()
+    mime_type = MIME_TYPES[settings['format']]
+
+    # Flat, sharp-edged pages can compress better as the original PNG than
+    # as JPEG/WebP; keep whichever is smaller
+    if len(data) >= len(original):
+        data = original
+        mime_type = MIME_TYPES['PNG']
+
+    return {
+        'text_only': False,
+        'mime_type': mime_type,
+        'data': data,
+        'bytes': len(data),
+        'seconds': time.perf_counter() - started
+    }
@@ -0,0 +1,340 @@
+import os
+import json
+import fcntl
+import time
+import uuid
+import socket
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.metrics import METRICS, record_stage
+from app.utils.artifacts import get_artifact_store
+
+# Seconds between status snapshots written for other worker processes
+STATE_SAVE_INTERVAL = 0.5
+
+# Fields a job snapshot is rebuilt from
+STATE_FIELDS = (
+    'id', 'filename', 'status', 'created_at', 'started_at', 'finished_at',
+    'total_pages', 'pages', 'stages', 'counters', 'processed_file', 'error'
+)
+
+def _write_json(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file)
+    os.replace(temp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+def _process_alive(state):
+    """Whether the process that ran a job snapshot still exists (unknown counts as alive)"""
+    if state.get('host') != socket.gethostname() or not state.get('pid'):
+        return True
+    try:
+        os.kill(state['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class JobAlreadyRunning(Exception):
+    """A job for the same upload is still queued or running"""
+
+    def __init__(self, job, status_code=409):
+        super().__init__('Notes are already being generated for this file')
+        self.job = job
+        self.status_code = status_code
+
+
+class Job:
+    """
+    State of one background note-generation run
+
+    All mutators are thread-safe; `to_dict` returns a consistent snapshot
+    for the status endpoint. With a `state_folder`, the state is also
+    written to `<state_folder>/<id>.json` so other worker processes can
+    report it.
+    """
+
+    def __init__(self, filename, state_folder=None):
+        self.id = uuid.uuid4().hex
+        self.state_path = os.path.join(state_folder, f"{self.id}.json") if state_folder else None
+        self._saved_at = float('-inf')
+        self.filename = filename
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total_pages = 0
+        self.pages = {}
+        self.stages = {}
+        self.counters = {}
+        self.processed_file = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def start(self, total_pages):
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+            self.total_pages = total_pages
+            self.pages = {
+                page_number: {'status': 'pending', 'seconds': None}
+                for page_number in range(1, total_pages + 1)
+            }
+        self.save(force=True)
+
+    def record_page(self, page_number, status, seconds=None, error=None, details=None):
+        """Record the outcome of one page ('completed' or 'failed') plus optional details"""
+        with self._lock:
+            self.pages[page_number] = {
+                'status': status,
+                'seconds': round(seconds, 3) if seconds is not None else None
+            }
+            if error:
+                self.pages[page_number]['error'] = error
+            if details:
+                self.pages[page_number].update(details)
+        self.save()
+
+    def record_stage(self, name, seconds):
+        """Record wall-clock time spent in a pipeline stage"""
+        record_stage(f'job_{name}', seconds)
+        with self._lock:
+            self.stages[name] = round(seconds, 3)
+
+    def count(self, name, amount=1):
+        """Increment a named job counter (e.g. API calls saved)"""
+        METRICS.inc(f'{name}_total', amount)
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def complete(self, processed_file):
+        METRICS.inc('jobs_total', status='completed')
+        with self._lock:
+            self.status = 'completed'
+            self.processed_file = processed_file
+            self.finished_at = time.time()
+        self.save(force=True)
+
+    def fail(self, error):
+        METRICS.inc('jobs_total', status='failed')
+        with self._lock:
+            self.status = 'failed'
+            self.error = error
+            self.finished_at = time.time()
+        self.save(force=True)
+
+    def save(self, force=False):
+        """
+        Write the state snapshot, at most every STATE_SAVE_INTERVAL unless forced
+
+        Args:
+            force (bool): Write even if a snapshot was written just now
+        """
+        if self.state_path is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._saved_at < STATE_SAVE_INTERVAL:
+                return
+            self._saved_at = now
+            state = {field: getattr(self, field) for field in STATE_FIELDS}
+            state['pages'] = {str(number): dict(page) for number, page in self.pages.items()}
+            state['stages'] = dict(self.stages)
+            state['counters'] = dict(self.counters)
+        state['host'] = socket.gethostname()
+        state['pid'] = os.getpid()
+        _write_json(self.state_path, state)
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuild a read-only job from a snapshot written by another process
+
+        A running job whose process has exited is reported as failed.
+
+        Args:
+            state (dict): Snapshot written by `save`
+
+        Returns:
+            Job: Detached job for status reporting
+        """
+        job = cls(state['filename'])
+        for field in STATE_FIELDS:
+            setattr(job, field, state[field])
+        job.pages = {int(number): page for number, page in state['pages'].items()}
+        if not job.finished and not _process_alive(state):
+            job.status = 'failed'
+            job.error = 'The worker running this job stopped'
+            job.finished_at = time.time()
+        return job
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        with self._lock:
+            completed_pages = sum(1 for page in self.pages.values() if page['status'] != 'pending')
+            failed_pages = sum(1 for page in self.pages.values() if page['status'] == 'failed')
+            end = self.finished_at or time.time()
+            return {
+                'job_id': self.id,
+                'filename': self.filename,
+                'status': self.status,
+                'total_pages': self.total_pages,
+                'completed_pages': completed_pages,
+                'failed_pages': failed_pages,
+                'pages': {str(number): dict(page) for number, page in self.pages.items()},
+                'stages': dict(self.stages),
+                'counters': dict(self.counters),
+                'queued_seconds': round((self.started_at or end) - self.created_at, 3),
+                'elapsed_seconds': round(end - self.started_at, 3) if self.started_at else 0.0,
+                'processed_file': self.processed_file,
+                'error': self.error
+            }
+
+
+class JobManager:
+    """
+    Local background job queue backed by a thread pool
+
+    Jobs run in submission order once a worker is free. Finished jobs are
+    kept for status polling until `max_finished_jobs` newer ones finish.
+    With a `state_folder` shared by several server processes, jobs started
+    by one process can be looked up from any other; their snapshots belong
+    to the upload's artifact group and are deleted with it.
+    """
+
+    def __init__(self, max_workers=2, max_finished_jobs=200, state_folder=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='notes-job')
+        self.max_finished_jobs = max_finished_jobs
+        self.state_folder = state_folder
+        if state_folder:
+            os.makedirs(state_folder, exist_ok=True)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, filename, func, *args, **kwargs):
+        """
+        Queue `func(job, *args, **kwargs)` to run in the background
+
+        Only one job per upload runs at a time, since jobs for the same
+        upload write the same processed PDF and checkpoints. With a state
+        folder this holds across server processes.
+
+        Args:
+            filename (str): Upload the job works on
+            func (callable): Pipeline to run; receives the Job first
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            JobAlreadyRunning: A job for this upload hasn't finished yet
+        """
+        job = Job(filename, state_folder=self.state_folder)
+        with self._lock:
+            if not self.state_folder:
+                active = self.latest_for(filename, lock_held=True)
+                if active is not None and not active.finished:
+                    raise JobAlreadyRunning(active)
+            else:
+                self._claim(filename, job)
+            self._jobs[job.id] = job
+            self._prune()
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _claim(self, filename, job):
+        """
+        Make `job` the upload's latest job unless its current one is unfinished
+
+        Checked and written under a file lock, so two processes can't both
+        start a job for the same upload.
+        """
+        latest_path = self._latest_path(filename)
+        lock_path = f"{latest_path}.lock"
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            latest = _read_json(latest_path)
+            active = self.get(latest['job_id'], lock_held=True) if latest is not None else None
+            if active is not None and not active.finished:
+                raise JobAlreadyRunning(active)
+            job.save(force=True)
+            _write_json(latest_path, {'job_id': job.id})
+        artifacts = get_artifact_store()
+        artifacts.add(job.state_path, filename, 'job')
+        artifacts.add(latest_path, filename, 'job')
+        artifacts.add(lock_path, filename, 'job')
+
+    def _run(self, job, func, args, kwargs):
+        try:
+            func(job, *args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            job.fail(str(e))
+
+    def _latest_path(self, filename):
+        return os.path.join(self.state_folder, f"{filename}.latest")
+
+    def get(self, job_id, lock_held=False):
+        """
+        Look up a job started by this or (with a state folder) any other process
+
+        Args:
+            job_id (str): Job ID
+            lock_held (bool): The caller holds the manager's lock
+
+        Returns:
+            Job: The job, or None if unknown
+        """
+        if lock_held:
+            job = self._jobs.get(job_id)
+        else:
+            with self._lock:
+                job = self._jobs.get(job_id)
+        if job is not None or not self.state_folder or not job_id.isalnum():
+            return job
+        state = _read_json(os.path.join(self.state_folder, f"{job_id}.json"))
+        return Job.from_state(state) if state else None
+
+    def latest_for(self, filename, lock_held=False):
+        """
+        Most recently submitted job for an upload
+
+        Args:
+            filename (str): Upload file name
+            lock_held (bool): The caller holds the manager's lock
+
+        Returns:
+            Job: The latest job, or None if there is none
+        """
+        if self.state_folder:
+            latest = _read_json(self._latest_path(filename))
+            if latest is not None:
+                return self.get(latest['job_id'], lock_held=lock_held)
+        if not lock_held:
+            with self._lock:
+                return self.latest_for(filename, lock_held=True)
+        for job in reversed(self._jobs.values()):
+            if job.filename == filename:
+                return job
+        return None
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the retention limit (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
@@ -0,0 +1,258 @@
+import os
+import sys
+import time
+import threading
+import cProfile
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'scribblepdf'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+def _format_value(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters and latency histograms
+
+    Exported in the Prometheus text format. Metrics are created on first
+    use; each label combination is a separate series.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, help_text):
+        """Set the HELP text for a metric"""
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Add to a counter
+
+        Args:
+            name (str): Metric name without prefix
+            amount (float): Amount to add
+            **labels: Label values
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a latency in a histogram
+
+        Args:
+            name (str): Metric name without prefix
+            seconds (float): Observed duration
+            **labels: Label values
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+                    break
+            series['sum'] += seconds
+            series['count'] += 1
+
+    def render(self):
+        """
+        Export every series in the Prometheus text format (version 0.0.4)
+
+        Returns:
+            str: Exposition text
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {
+                'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']
+            } for key, series in self._histograms.items()}
+
+        lines = []
+        for metric_type, series_by_key in (('counter', counters), ('histogram', histograms)):
+            names = sorted({name for name, _ in series_by_key})
+            for name in names:
+                full_name = f'{METRIC_PREFIX}_{name}'
+                if name in self._help:
+                    lines.append(f'# HELP {full_name} {self._help[name]}')
+                lines.append(f'# TYPE {full_name} {metric_type}')
+                for (series_name, labels), value in sorted(series_by_key.items()):
+                    if series_name != name:
+                        continue
+                    if metric_type == 'counter':
+                        lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+                        continue
+                    # Histogram buckets are cumulative; +Inf holds every observation
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, value['buckets']):
+                        cumulative += count
+                        lines.append(
+                            f'{full_name}_bucket{_format_labels(labels, [("le", _format_value(bound))])} {cumulative}'
+                        )
+                    lines.append(f'{full_name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value["count"]}')
+                    lines.append(f'{full_name}_sum{_format_labels(labels)} {value["sum"]!r}')
+                    lines.append(f'{full_name}_count{_format_labels(labels)} {value["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry shared by all requests and background jobs
+METRICS = MetricsRegistry()
+METRICS.describe('stage_seconds', 'Time spent in each processing stage')
+METRICS.describe('stage_errors_total', 'Processing stages that raised an error')
+METRICS.describe('bytes_total', 'Bytes read, uploaded or written, by kind')
+METRICS.describe('pages_total', 'Pages processed, by outcome')
+METRICS.describe('http_request_seconds', 'HTTP request latency by endpoint')
+METRICS.describe('jobs_total', 'Finished note generation jobs, by outcome')
+METRICS.describe('api_calls_saved_total', 'Gemini calls skipped for blank and near-duplicate pages')
+METRICS.describe('response_cache_total', 'Gemini response cache lookups, by result')
+METRICS.describe('artifact_evictions_total', 'Upload groups deleted from disk, by reason')
+
+def record_stage(stage, seconds, error=False):
+    """
+    Record one run of a processing stage
+
+    Adds it to the stage histogram and, inside a request, to that
+    request's Server-Timing entries.
+
+    Args:
+        stage (str): Stage name
+        seconds (float): Duration
+        error (bool): Whether the stage failed
+    """
+    METRICS.observe('stage_seconds', seconds, stage=stage)
+    if error:
+        METRICS.inc('stage_errors_total', stage=stage)
+    if has_request_context():
+        timings = g.setdefault('server_timings', {})
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def record_stages(timings):
+    """Record a dict of stage durations measured elsewhere (e.g. in a worker process)"""
+    for stage, seconds in (timings or {}).items():
+        record_stage(stage, seconds)
+
+def count_bytes(kind, amount):
+    """Add to the byte counter for `kind`"""
+    METRICS.inc('bytes_total', amount, kind=kind)
+
+def count_pages(status, amount=1):
+    """Add to the page counter for `status`"""
+    METRICS.inc('pages_total', amount, status=status)
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block as a processing stage, counting it as an error if it raises
+
+    Args:
+        stage (str): Stage name
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_stage(stage, time.perf_counter() - started, error=True)
+        raise
+    record_stage(stage, time.perf_counter() - started)
+
+def server_timing_header(total_seconds=None):
+    """
+    Build the Server-Timing header value for the current request
+
+    Args:
+        total_seconds (float): Whole request duration, reported as 'total'
+
+    Returns:
+        str: Header value, or None if nothing was timed
+    """
+    entries = [
+        f'{stage};dur={seconds * 1000:.1f}'
+        for stage, seconds in g.get('server_timings', {}).items()
+    ]
+    if total_seconds is not None:
+        entries.append(f'total;dur={total_seconds * 1000:.1f}')
+    return ', '.join(entries) or None
+
+def process_memory():
+    """
+    Memory of this process
+    
+    On Linux, 'private_bytes' is the part no other process shares, i.e.
+    what a forked server worker costs on top of its preloaded master.
+    Where the current resident size can't be read, only the peak is
+    reported, as 'max_rss_bytes'.
+    
+    Returns:
+        dict: 'rss_bytes' and, where available, 'pss_bytes' and
+            'private_bytes'; or just 'max_rss_bytes'
+    """
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            fields = dict(line.split(':', 1) for line in smaps if ':' in line and not line.startswith(' '))
+        kilobytes = {name: int(value.split()[0]) for name, value in fields.items() if value.strip().endswith('kB')}
+        memory['rss_bytes'] = kilobytes['Rss'] * 1024
+        memory['pss_bytes'] = kilobytes['Pss'] * 1024
+        memory['private_bytes'] = (kilobytes['Private_Clean'] + kilobytes['Private_Dirty']) * 1024
+        return memory
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        # Older kernels: resident pages from statm
+        with open('/proc/self/statm') as statm:
+            memory['rss_bytes'] = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        return memory
+    except (OSError, IndexError, ValueError):
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    memory['max_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+    return memory
+
+def profile_path(profile_dir, name):
+    """Unique path for a cProfile dump"""
+    os.makedirs(profile_dir, exist_ok=True)
+    return os.path.join(profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof")
+
+def profile_call(output_path, func, *args, **kwargs):
+    """
+    Run a function under cProfile and dump the stats to `output_path`
+
+    Args:
+        output_path (str): Where to write the .prof file (pstats format)
+        func (callable): Function to profile
+        *args, **kwargs: Arguments for `func`
+
+    Returns:
+        The return value of `func`
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(output_path)
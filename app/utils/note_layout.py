@@ -0,0 +1,362 @@
+import re
+import json
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from app.utils.fonts import NOTE_FONT_SIZES, HEADING_FONT_SIZE, text_length
+
+# One parsed note. `x` and `y` are the position the model asked for as
+# fractions of the page (0-1), or None when it gave no position
+Note = namedtuple('Note', ['text', 'style', 'x', 'y'])
+
+# Styles the layout engine draws, and the words the model uses for them
+STYLE_NAMES = (
+    ('heading', ('heading', 'header', 'title', 'bold')),
+    ('underline', ('underline', 'highlight', 'emphasi', 'important')),
+    ('arrow', ('arrow', 'connector', 'pointer')),
+    ('box', ('box', 'circle', 'frame')),
+    ('normal', ('normal', 'text', 'plain'))
+)
+
+# Page margin and the width a column needs, in page pixels
+MARGIN = 50
+MIN_COLUMN_WIDTH = 700
+
+# Line height as a multiple of the font size
+LINE_SPACING = 1.5
+
+# Dark gray used for underlines, arrows and boxes
+PENCIL_COLOR = (80, 80, 80)
+
+# Random values drawn per note: indent, font size, color, arrow offset
+JITTER_FIELDS = 4
+
+_NUMBER = r'(-?\d+(?:\.\d+)?)\s*%?'
+_XY = rf'x\s*:\s*{_NUMBER}\s*[,;]?\s*y\s*:\s*{_NUMBER}'
+_PAIR = rf'(?:x\s*[:=]\s*)?{_NUMBER}\s*[,;]\s*(?:y\s*[:=]\s*)?{_NUMBER}'
+
+# Position directives. Only explicit ones are taken, so pairs in the notes
+# themselves ("f(2, 3) = 13", "the point (3, 4)") stay in the text:
+# "(x: 120, y: 80)" or "x: 120, y: 80" at the start of a line,
+_LEADING_XY = re.compile(rf'^\s*(?:\(\s*{_XY}\s*\)|{_XY})', re.IGNORECASE)
+# "(120, 80)" at the start of a line that also has a "Content:" label,
+_LEADING_PAIR = re.compile(rf'^\s*\(\s*{_NUMBER}\s*,\s*{_NUMBER}\s*\)')
+# and "Position: (120, 80)" at the start of a line or after a separator
+_POSITION = re.compile(
+    rf'(?:^|[,;|(\[])\s*(?:position|pos|coordinates|coords)\s*[:=]\s*(?:\(\s*{_PAIR}\s*\)|{_PAIR})',
+    re.IGNORECASE
+)
+_CONTENT = re.compile(
+    r'(?:^\s*|[,;|)\]]\s*)(?:content|text)\s*[:=]\s*(?:"([^"]*)"|“([^”]*)”|(.+?))'
+    r'\s*(?=[,;|]?\s*(?:style|position|pos|coordinates)\s*[:=]|$)',
+    re.IGNORECASE
+)
+# "Style: underline", taken only when the value is a style name
+_STYLE = re.compile(r'\bstyle\s*[:=]\s*["\']?([a-z]+(?:[ -][a-z]+)?)["\']?\s*(?=[,;|)\]]|$)', re.IGNORECASE)
+# "... (underline)" at the end of a line
+_TRAILING_STYLE = re.compile(r'\s+[\[(]\s*([a-z]+(?:[ -][a-z]+)?)\s*[\])]\s*$', re.IGNORECASE)
+_LIST_MARKER = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+_ARROW = re.compile(r'->|→|=>')
+
+def _style(name):
+    """Map the model's style description to a drawn style (None if unrecognised)"""
+    name = name.lower()
+    for style, words in STYLE_NAMES:
+        if any(word in name for word in words):
+            return style
+    return None
+
+def _directive_style(value):
+    """Drawn style named by a style directive's value, matching whole words only"""
+    for token in value.lower().replace('-', ' ').split():
+        for style, words in STYLE_NAMES:
+            if any(token.startswith(word) for word in words):
+                return style
+    return None
+
+def _clean(text):
+    """Drop Markdown emphasis and the separators and quotes around a note's text"""
+    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
+    text = re.sub(r'`([^`]*)`', r'\1', text)
+    text = text.strip(' \t,;|')
+    for quote in ('""', '“”', "''"):
+        if len(text) > 1 and text[0] == quote[0] and text[-1] == quote[1]:
+            text = text[1:-1].strip()
+    return text
+
+def _parse_json(content):
+    """Notes from a JSON response: a list of objects, or an object with a 'notes' list"""
+    stripped = re.sub(r'^```(?:json)?|```$', '', content.strip(), flags=re.MULTILINE).strip()
+    if not stripped or stripped[0] not in '[{':
+        return None
+    try:
+        data = json.loads(stripped)
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        data = data.get('notes')
+    if not isinstance(data, list):
+        return None
+
+    notes = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        text = str(item.get('content') or item.get('text') or '').strip()
+        if not text:
+            continue
+        position = item.get('position')
+        x, y = item.get('x'), item.get('y')
+        if isinstance(position, dict):
+            x, y = position.get('x'), position.get('y')
+        elif isinstance(position, (list, tuple)) and len(position) == 2:
+            x, y = position
+        try:
+            x, y = float(x), float(y)
+        except (TypeError, ValueError):
+            x = y = None
+        notes.append([text, _style(str(item.get('style') or '')) or 'normal', x, y])
+    return notes
+
+def _parse_line(line):
+    """
+    One note from a line of text, or None for a blank line
+
+    Position and style are read from explicit directives only; anything
+    else on the line is note text and is kept as written.
+    """
+    if not line.strip():
+        return None
+    style = None
+    if line.lstrip().startswith('#'):
+        style = 'heading'
+        line = line.lstrip().lstrip('#')
+    line = _LIST_MARKER.sub('', line)
+    if line.strip().startswith('**') and line.strip().endswith('**') and len(line.strip()) > 4:
+        style = 'heading'
+
+    x = y = None
+    position = _LEADING_XY.search(line) or _POSITION.search(line)
+    if position is None and _CONTENT.search(_LEADING_PAIR.sub('', line, count=1)):
+        position = _LEADING_PAIR.search(line)
+    if position:
+        x, y = (float(value) for value in position.groups() if value is not None)
+        line = line[:position.start()] + line[position.end():]
+
+    content = _CONTENT.search(line)
+    if content:
+        # Structured line: the text is the labelled content, the rest are directives
+        text = next(group for group in content.groups() if group is not None)
+        rest = line[:content.start()] + ' ' + line[content.end():]
+        style_match = _STYLE.search(rest)
+        if style_match and _directive_style(style_match.group(1)):
+            style = _directive_style(style_match.group(1))
+    else:
+        text = line
+        style_match = _STYLE.search(text)
+        # A style directive has to start the line or follow a separator;
+        # "Writing style: bold" is a note about writing
+        if style_match and _directive_style(style_match.group(1)) and (
+            not text[:style_match.start()].strip() or text[:style_match.start()].rstrip()[-1] in ',;|)]"”'
+        ):
+            style = _directive_style(style_match.group(1))
+            text = text[:style_match.start()] + text[style_match.end():]
+        trailing = _TRAILING_STYLE.search(text)
+        if trailing and _directive_style(trailing.group(1)) not in (None, 'normal'):
+            style = style or _directive_style(trailing.group(1))
+            text = text[:trailing.start()]
+    text = _clean(text)
+    if not text:
+        return None
+
+    if style is None:
+        style = 'arrow' if _ARROW.search(text) else 'normal'
+    return [text, style, x, y]
+
+def _normalize_positions(notes):
+    """
+    Turn positions into page fractions
+
+    A position with both coordinates up to 1 is taken as fractions. Other
+    positions are percentages when every coordinate in the response is up
+    to 100, and units of a canvas at least 1000 wide otherwise.
+    """
+    values = [value for note in notes for value in note[2:] if value is not None]
+    if not values:
+        return
+    largest = max(values)
+    scale = 100.0 if largest <= 100 else max(1000.0, largest)
+    for note in notes:
+        if note[2] is not None:
+            note_scale = 1.0 if max(note[2], note[3]) <= 1 else scale
+            note[2] = round(min(1.0, max(0.0, note[2] / note_scale)), 4)
+            note[3] = round(min(1.0, max(0.0, note[3] / note_scale)), 4)
+
+@lru_cache(maxsize=256)
+def parse_notes(content):
+    """
+    Parse generated notes into structured notes, once per distinct response
+
+    Understands JSON lists of {content, x, y, style} objects and the
+    line-based formats the model writes for the notes prompt, e.g.
+    `1. (x: 120, y: 80) Content: "Mitosis" Style: underline`, as well as
+    Markdown headings, bullets and plain lines. Results are cached, so
+    they are returned as immutable tuples.
+
+    Args:
+        content (str): Text response from Gemini
+
+    Returns:
+        tuple: `Note` tuples in reading order
+    """
+    notes = _parse_json(content)
+    if notes is None:
+        notes = [note for note in map(_parse_line, content.split('\n')) if note is not None]
+    _normalize_positions(notes)
+    return tuple(Note(*note) for note in notes)
+
+def notes_from_list(items):
+    """Rebuild notes stored as JSON lists (e.g. in a checkpoint)"""
+    return tuple(Note(*item) for item in items)
+
+def _wrap(words, size, max_width):
+    """
+    Greedy word wrap in one pass over the words
+
+    Returns:
+        list: (line text, line width) pairs
+    """
+    space = text_length(' ', size)
+    lines = []
+    current, current_width = [], 0.0
+    for word in words:
+        word_width = text_length(word, size)
+        if current and current_width + space + word_width > max_width:
+            lines.append((' '.join(current), current_width))
+            current, current_width = [], 0.0
+        current_width += word_width + (space if current else 0.0)
+        current.append(word)
+    if current:
+        lines.append((' '.join(current), current_width))
+    return lines
+
+def _line_op(start, end, color, width=1):
+    return {
+        'op': 'line',
+        'points': [(float(start[0]), float(start[1])), (float(end[0]), float(end[1]))],
+        'color': color,
+        'width': width
+    }
+
+def _underline(rng, x, y, length):
+    """Rough pencil underline made of short, slightly uneven segments"""
+    segments = rng.integers(5, 20, size=int(length // 5) + 1)
+    offsets = rng.integers(-2, 3, size=len(segments))
+    ops = []
+    x_start = x
+    for segment_length, offset in zip(segments, offsets):
+        if x_start >= x + length:
+            break
+        ops.append(_line_op((x_start, y + offset), (min(x_start + segment_length, x + length), y + offset), PENCIL_COLOR))
+        x_start += segment_length
+    return ops
+
+def _column_order(notes, columns):
+    """Reading order: by the column and height the model asked for, when every note has a position"""
+    if columns == 1 or not notes or any(note.x is None for note in notes):
+        return list(notes)
+    return sorted(notes, key=lambda note: (min(columns - 1, int(note.x * columns)), note.y))
+
+def flow_notes(notes, width, height, seed=None):
+    """
+    Lay out parsed notes in a single pass with word wrap and column flow
+
+    The page is split into columns at least MIN_COLUMN_WIDTH wide. Notes
+    are wrapped to their column and flow down it, then into the next
+    column. A position from the model picks the column and is used as the
+    lowest point the note may start at. Notes that don't fit on the page
+    are left out. Handwritten variation (indent, size, color) comes from
+    one random draw per page, seeded from the notes unless `seed` is
+    given, so the same notes always produce the same page.
+
+    The result is a list of drawing operations in page pixels:
+        {'op': 'text', 'x', 'y', 'text', 'size', 'color'}
+        {'op': 'line', 'points': [(x, y), (x, y)], 'color', 'width'}
+    Text positions are the top-left corner of the line, as in PIL.
+
+    Args:
+        notes (sequence): `Note` tuples from `parse_notes`
+        width (int): Width of the page
+        height (int): Height of the page
+        seed (int): Optional seed for the handwritten variation
+
+    Returns:
+        list: Drawing operations
+    """
+    if seed is None:
+        seed = zlib.crc32('\n'.join(note.text for note in notes).encode('utf-8'))
+    rng = np.random.default_rng(seed)
+    jitter = rng.random((len(notes), JITTER_FIELDS))
+
+    columns = max(1, min(2, (width - 2 * MARGIN) // MIN_COLUMN_WIDTH))
+    column_width = (width - 2 * MARGIN - MARGIN * (columns - 1)) / columns
+    bottom = height - MARGIN
+
+    ops = []
+    column = 0
+    y = MARGIN + jitter[0][0] * 30 if notes else MARGIN
+    for index, note in enumerate(_column_order(notes, columns)):
+        indent, size_jitter, gray, arrow_jitter = jitter[index]
+        if note.style == 'heading':
+            size = HEADING_FONT_SIZE
+        else:
+            size = NOTE_FONT_SIZES[0] + int(size_jitter * (NOTE_FONT_SIZES[1] - NOTE_FONT_SIZES[0]))
+        line_height = size * LINE_SPACING
+
+        # The model's position picks the column and a minimum height
+        if note.x is not None and columns > 1:
+            wanted = min(columns - 1, int(note.x * columns))
+            if wanted > column:
+                column, y = wanted, MARGIN
+        if note.y is not None:
+            y = max(y, MARGIN + note.y * (bottom - MARGIN - line_height))
+
+        x = MARGIN + column * (column_width + MARGIN) + indent * 40
+        lines = _wrap(note.text.split(), size, column_width - indent * 40)
+        if y + len(lines) * line_height > bottom and column + 1 < columns and len(lines) * line_height <= bottom - MARGIN:
+            column += 1
+            y = MARGIN + indent * 30
+            x = MARGIN + column * (column_width + MARGIN) + indent * 40
+        if y + line_height > bottom:
+            break
+
+        color = (int(50 + gray * 40),) * 3
+        block_top = y
+        block_width = 0.0
+        for line_text, line_width in lines:
+            if y + line_height > bottom:
+                break
+            ops.append({'op': 'text', 'x': float(x), 'y': float(y), 'text': line_text, 'size': size, 'color': color})
+            if note.style == 'underline':
+                ops.extend(_underline(rng, x, y + size + 2, line_width))
+            block_width = max(block_width, line_width)
+            y += line_height
+
+        if note.style == 'arrow':
+            # Short arrow pointing at the note from the left
+            arrow_x = x - 15 + arrow_jitter * 10
+            arrow_y = block_top + size / 2
+            ops.append(_line_op((arrow_x - 20, arrow_y), (arrow_x, arrow_y), PENCIL_COLOR))
+            ops.append(_line_op((arrow_x, arrow_y), (arrow_x - 5, arrow_y - 5), PENCIL_COLOR))
+            ops.append(_line_op((arrow_x, arrow_y), (arrow_x - 5, arrow_y + 5), PENCIL_COLOR))
+        elif note.style == 'box':
+            left, top = x - 8, block_top - 6
+            right, lower = x + block_width + 8, y - line_height + size + 8
+            corners = [(left, top), (right, top + 2), (right - 1, lower), (left + 1, lower + 1), (left, top)]
+            ops.extend(_line_op(start, end, PENCIL_COLOR) for start, end in zip(corners, corners[1:]))
+
+        # A little extra space between notes
+        y += line_height * 0.25
+
+    return ops
@@ -0,0 +1,112 @@
+import io
+import numpy as np
+from PIL import Image
+
+def difference_hash(image, hash_size=8):
+    """
+    Perceptual difference hash of an image
+
+    Args:
+        image (PIL.Image): Grayscale image
+        hash_size (int): Hash width/height in bits
+
+    Returns:
+        int: 64-bit hash (for the default size)
+    """
+    pixels = np.asarray(image.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+def hamming_distance(first, second):
+    """Number of differing bits between two hashes"""
+    return bin(first ^ second).count('1')
+
+def page_signature(page_content):
+    """
+    Compute the features used to compare pages
+
+    Args:
+        page_content (dict): Dictionary containing text and image from PDF page
+
+    Returns:
+        dict: Perceptual hash, ink coverage (fraction of dark pixels) and
+            normalized text lines
+    """
+    image = Image.open(io.BytesIO(page_content['image'])).convert('L')
+
+    # Ink coverage on a small copy is plenty and much cheaper
+    small = image.resize((200, max(1, round(200 * image.height / image.width))), Image.BILINEAR)
+    ink_coverage = float((np.asarray(small) < 200).mean())
+
+    lines = [' '.join(line.split()) for line in (page_content['text'] or '').splitlines()]
+    return {
+        'hash': difference_hash(small),
+        'ink_coverage': ink_coverage,
+        'lines': [line for line in lines if line]
+    }
+
+def _added_lines(previous_lines, lines):
+    """
+    Lines added to `previous_lines` if `lines` keeps all of them in order, else None
+
+    This matches slide "builds" that reveal one more bullet per page.
+    """
+    added = []
+    position = 0
+    for line in lines:
+        if position < len(previous_lines) and line == previous_lines[position]:
+            position += 1
+        else:
+            added.append(line)
+    return added if position == len(previous_lines) else None
+
+def analyze_pages(page_contents, blank_ink_threshold=0.002, duplicate_distance=4, extend_distance=12):
+    """
+    Classify each page relative to the previous one so API calls can be skipped
+
+    Each page gets `page_content['analysis']` with a 'kind':
+        'blank'      - no text and almost no ink
+        'duplicate'  - looks the same and has the same text as the previous page
+        'extends'    - previous page's text plus new lines (a bullet build);
+                       'added_text' holds the new lines
+        'unique'     - needs its own notes
+    Duplicates and extensions name their 'source' page number. Pages are
+    only compared across consecutive page numbers, so a gap in the input
+    (a partial run) starts the comparison afresh.
+
+    Args:
+        page_contents (iterable): Extracted page contents in page order
+        blank_ink_threshold (float): Maximum ink coverage of a blank page
+        duplicate_distance (int): Maximum hash distance for a duplicate
+        extend_distance (int): Maximum hash distance for an extension
+
+    Yields:
+        dict: The same page contents, annotated
+    """
+    previous = None  # (page number, signature) of the last non-blank page
+    last_page_number = None
+    for page_content in page_contents:
+        if last_page_number is not None and page_content['page_number'] != last_page_number + 1:
+            previous = None
+        last_page_number = page_content['page_number']
+
+        signature = page_signature(page_content)
+        analysis = {'kind': 'unique'}
+
+        if not signature['lines'] and signature['ink_coverage'] <= blank_ink_threshold:
+            analysis = {'kind': 'blank'}
+        elif previous is not None:
+            source, previous_signature = previous
+            distance = hamming_distance(signature['hash'], previous_signature['hash'])
+            if distance <= duplicate_distance and signature['lines'] == previous_signature['lines']:
+                analysis = {'kind': 'duplicate', 'source': source}
+            elif distance <= extend_distance and previous_signature['lines']:
+                added = _added_lines(previous_signature['lines'], signature['lines'])
+                if added:
+                    analysis = {'kind': 'extends', 'source': source, 'added_text': '\n'.join(added)}
+
+        if analysis['kind'] != 'blank':
+            previous = (page_content['page_number'], signature)
+
+        page_content['analysis'] = analysis
+        yield page_content
@@ -1,156 +1,503 @@
 import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import PyPDF2
-from PIL import Image, ImageDraw
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, StreamObject
 import io
-import tempfile
+import time
 from pdf2image import convert_from_path
-import numpy as np
+from app.utils.texture import pencil_texture
+from app.utils.vector_notes import VectorNoteRenderer
+from app.utils.metrics import timed, record_stages, count_bytes, count_pages
 
 def is_pdf_file(filename):
     """Check if the file is a PDF based on extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'pdf'}
 
-def process_pdf(pdf_path, get_info_only=False):
+def count_pdf_pages(pdf_path):
+    """
+    Count the pages of a PDF from its page tree root
+    
+    Only the cross-reference table, the document catalog and the root
+    /Pages node are read; the file is accessed by seeking instead of being
+    loaded into memory, and individual pages are never parsed.
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+    
+    Returns:
+        int: Number of pages
+    """
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        try:
+            page_count = int(pdf_reader.trailer['/Root']['/Pages']['/Count'])
+        except (KeyError, TypeError, ValueError):
+            page_count = -1
+        if page_count < 0:
+            # Malformed page tree; fall back to walking it
+            page_count = len(pdf_reader.pages)
+        return page_count
+
+def _page_content(page_number, text, image):
+    """
+    Build the extracted-content record for one rasterized page
+    
+    Args:
+        page_number (int): 1-based page number
+        text (str): Extracted page text
+        image (PIL.Image): Rasterized page
+    
+    Returns:
+        dict: Page number, text, PNG bytes, pixel size and PNG encoding time
+    """
+    # Convert PIL Image to bytes for AI processing
+    started = time.perf_counter()
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='PNG')
+    
+    return {
+        'page_number': page_number,
+        'text': text,
+        'image': img_byte_arr.getvalue(),
+        'width': image.width,
+        'height': image.height,
+        'timings': {'encode_png': time.perf_counter() - started}
+    }
+
+def extract_page_range(pdf_path, first_page, last_page, dpi=200, thread_count=1, pdf_reader=None):
+    """
+    Extract text, rasterize and encode a range of pages
+    
+    Used both inline and as the process pool task, so the serial and
+    parallel paths produce identical results. Stage timings travel with
+    each page in `timings` because worker processes can't record metrics
+    for the web process.
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        first_page (int): First page to extract (1-based, inclusive)
+        last_page (int): Last page to extract (1-based, inclusive)
+        dpi (int): Rasterization resolution
+        thread_count (int): Number of poppler threads
+        pdf_reader (PyPDF2.PdfReader): Already parsed document, if available
+    
+    Returns:
+        list: Extracted content for each page in the range
+    """
+    if pdf_reader is None:
+        pdf_reader = PyPDF2.PdfReader(pdf_path)
+    
+    started = time.perf_counter()
+    images = convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        first_page=first_page,
+        last_page=last_page,
+        thread_count=thread_count
+    )
+    rasterize_seconds = (time.perf_counter() - started) / max(1, len(images))
+    
+    contents = []
+    for offset, image in enumerate(images):
+        page_number = first_page + offset
+        started = time.perf_counter()
+        text = pdf_reader.pages[page_number - 1].extract_text() or ""
+        extract_seconds = time.perf_counter() - started
+        
+        page_content = _page_content(page_number, text, image)
+        page_content['timings'].update({'rasterize': rasterize_seconds, 'extract_text': extract_seconds})
+        contents.append(page_content)
+        image.close()
+    
+    return contents
+
+def iter_pdf_pages(pdf_path, dpi=200, thread_count=1, window=4, workers=1, page_numbers=None, pdf_reader=None):
+    """
+    Lazily rasterize and extract a PDF a few pages at a time
+    
+    Only a few windows of pages are held in memory at once, so peak memory
+    does not depend on document length. With `workers` > 1 the windows are
+    extracted in a process pool and merged back in page order.
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        dpi (int): Rasterization resolution
+        thread_count (int): Number of poppler threads per window
+        window (int): Number of pages rasterized per poppler call
+        workers (int): Number of extraction processes (1 extracts inline)
+        page_numbers (iterable): Only extract these pages (1-based); all if None
+        pdf_reader (PyPDF2.PdfReader): Already parsed document, if available
+    
+    Yields:
+        dict: Extracted content for each page, in page order
+    """
+    if pdf_reader is None:
+        pdf_reader = PyPDF2.PdfReader(pdf_path)
+    total_pages = len(pdf_reader.pages)
+    if page_numbers is None:
+        page_numbers = range(1, total_pages + 1)
+    page_ranges = _page_windows(sorted(set(page_numbers)), max(1, window))
+    
+    if workers <= 1:
+        for first_page, last_page in page_ranges:
+            yield from _recorded(extract_page_range(pdf_path, first_page, last_page, dpi, thread_count, pdf_reader))
+        return
+    
+    # Spawned workers avoid forking the threaded web process; at most two
+    # ranges per worker are queued so finished pages don't pile up
+    pending = deque()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for first_page, last_page in page_ranges:
+            pending.append(executor.submit(extract_page_range, pdf_path, first_page, last_page, dpi, thread_count))
+            if len(pending) >= 2 * workers:
+                yield from _recorded(pending.popleft().result())
+        while pending:
+            yield from _recorded(pending.popleft().result())
+
+def _page_windows(page_numbers, window):
+    """Group sorted page numbers into runs of consecutive pages, at most `window` long"""
+    page_ranges = []
+    for page_number in page_numbers:
+        if page_ranges:
+            first_page, last_page = page_ranges[-1]
+            if page_number == last_page + 1 and last_page - first_page + 1 < window:
+                page_ranges[-1] = (first_page, page_number)
+                continue
+        page_ranges.append((page_number, page_number))
+    return page_ranges
+
+def _recorded(page_contents):
+    """Record the extraction metrics carried by each page as it is yielded"""
+    for page_content in page_contents:
+        record_stages(page_content.pop('timings', None))
+        count_bytes('page_png', len(page_content['image']))
+        count_pages('extracted')
+        yield page_content
+
+def process_pdf(pdf_path, get_info_only=False, stream=False, dpi=200, thread_count=1, window=4, workers=1,
+                page_numbers=None):
     """
     Process a PDF file to extract text, images, and create annotated version
     
     Args:
         pdf_path (str): Path to the PDF file
         get_info_only (bool): If True, only return page count info
+        stream (bool): If True, `extracted_contents` is a generator that
+            rasterizes pages on demand instead of a fully built list
+        dpi (int): Rasterization resolution
+        thread_count (int): Number of poppler threads per window
+        window (int): Number of pages rasterized per poppler call
+        workers (int): Number of extraction processes (1 extracts inline)
+        page_numbers (iterable): Only extract these pages (1-based); all if None
     
     Returns:
         dict: Results containing extracted content and functions to generate final PDF
     """
     try:
-        # Open PDF file
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            total_pages = len(pdf_reader)
-            
-            if get_info_only:
-                return {'page_count': total_pages}
-            
-            extracted_contents = []
-            
-            # Convert PDF pages to images for better processing
-            images = convert_from_path(pdf_path)
-            
-            # Extract content from each page
-            for i in range(total_pages):
-                page = pdf_reader.pages[i]
-                text = page.extract_text() or ""
-                
-                # Convert PIL Image to bytes for AI processing
-                img_byte_arr = io.BytesIO()
-                images[i].save(img_byte_arr, format='PNG')
-                img_bytes = img_byte_arr.getvalue()
-                
-                # Store extracted content (both text and image)
-                extracted_contents.append({
-                    'page_number': i + 1,
-                    'text': text,
-                    'image': img_bytes,
-                    'width': images[i].width,
-                    'height': images[i].height
-                })
-            
-            # Prepare storage for generated note images
-            note_images = [None] * total_pages
-            
-            # Function to create the final annotated PDF
-            def create_annotated_pdf(output_path):
-                # Create a new PDF with blank pages inserted between original pages
-                pdf_writer = PyPDF2.PdfWriter()
-                
-                # Create a temporary directory for intermediate files
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    page_files = []
-                    
-                    for i in range(total_pages):
-                        # Add original page
-                        with open(pdf_path, 'rb') as input_file:
-                            reader = PyPDF2.PdfReader(input_file)
-                            pdf_writer.add_page(reader.pages[i])
-                        
-                        # Add blank page with handwritten notes if available
-                        if note_images[i] is not None:
-                            # Convert note image to PDF page
-                            note_page_path = os.path.join(temp_dir, f"note_page_{i}.pdf")
-                            note_images[i].save(note_page_path, "PDF")
-                            
-                            # Add the note page to the output PDF
-                            with open(note_page_path, 'rb') as note_file:
-                                note_reader = PyPDF2.PdfReader(note_file)
-                                pdf_writer.add_page(note_reader.pages[0])
-                        else:
-                            # Add a blank page if no notes were generated
-                            pdf_writer.add_blank_page()
-                    
-                    # Write the final PDF
-                    with open(output_path, 'wb') as output_file:
-                        pdf_writer.write(output_file)
-                
-                return output_path
-            
-            return {
-                'total_pages': total_pages,
-                'extracted_contents': extracted_contents,
-                'note_images': note_images,
-                'create_annotated_pdf': create_annotated_pdf
-            }
+        if get_info_only:
+            return {'page_count': count_pdf_pages(pdf_path)}
+        
+        # Writer that parses the source once; note pages can be added to it
+        # as soon as they are ready so the images don't have to be kept. Its
+        # reader also serves the page count and text extraction
+        annotated_writer = AnnotatedPdfWriter(pdf_path)
+        total_pages = annotated_writer.total_pages
+        
+        # Convert PDF pages to images for better processing
+        extracted_contents = iter_pdf_pages(
+            pdf_path,
+            dpi=dpi,
+            thread_count=thread_count,
+            window=window,
+            workers=workers,
+            page_numbers=page_numbers,
+            pdf_reader=annotated_writer.reader
+        )
+        if not stream:
+            extracted_contents = list(extracted_contents)
+        
+        # Prepare storage for generated note images
+        note_images = [None] * total_pages
+        
+        # Function to create the final annotated PDF
+        def create_annotated_pdf(output_path, optimize=False, linearize=False):
+            for i, note_image in enumerate(note_images):
+                if note_image is not None:
+                    annotated_writer.add_note_image(i, note_image)
+            return annotated_writer.write(output_path, optimize=optimize, linearize=linearize)
+        
+        return {
+            'total_pages': total_pages,
+            'extracted_contents': extracted_contents,
+            'note_images': note_images,
+            'annotated_writer': annotated_writer,
+            'create_annotated_pdf': create_annotated_pdf
+        }
     
     except Exception as e:
         raise Exception(f"Error processing PDF: {str(e)}")
 
-def extract_page_as_image(pdf_path, page_num, output_path):
+def image_to_pdf_page(image):
     """
-    Extract a specific page from a PDF as an image
+    Convert an image to a single PDF page entirely in memory
     
     Args:
-        pdf_path (str): Path to the PDF file
-        page_num (int): Page number to extract (0-indexed)
-        output_path (str): Path to save the output image
+        image (PIL.Image): Image to convert
     
     Returns:
-        str: Path to the saved image
+        PyPDF2.PageObject: Page containing the image
     """
-    try:
-        # Convert the specific page to an image
-        images = convert_from_path(pdf_path, first_page=page_num+1, last_page=page_num+1)
+    with timed('embed_note_image'):
+        buffer = io.BytesIO()
+        image.save(buffer, "PDF")
+        buffer.seek(0)
+        return PyPDF2.PdfReader(buffer).pages[0]
+
+# Note page kept as layout operations until the PDF is written
+NoteLayout = namedtuple('NoteLayout', ['ops', 'width', 'height'])
+
+class AnnotatedPdfWriter:
+    """
+    Assemble original pages interleaved with note pages
+    
+    The source PDF is parsed once. Note images are converted to compressed
+    PDF pages as soon as they are added, so callers can add each page when
+    its notes are ready and drop the image straight away. Note layouts are
+    kept as drawing operations and written as vector pages.
+    """
+    
+    def __init__(self, pdf_path):
+        self.reader = PyPDF2.PdfReader(pdf_path)
+        self.total_pages = len(self.reader.pages)
+        self.note_pages = [None] * self.total_pages
+    
+    def add_note_image(self, index, image):
+        """
+        Add the note page that follows original page `index` (0-indexed)
+        
+        Args:
+            index (int): Index of the original page
+            image (PIL.Image): Rendered note page
+        """
+        self.note_pages[index] = image_to_pdf_page(image)
+    
+    def add_note_layout(self, index, ops, width, height):
+        """
+        Add a note page as vector content after original page `index` (0-indexed)
+        
+        Args:
+            index (int): Index of the original page
+            ops (list): Drawing operations from `flow_notes`
+            width (int): Width of the note page
+            height (int): Height of the note page
+        """
+        self.note_pages[index] = NoteLayout(ops, width, height)
+    
+    def write(self, output_path, optimize=False, linearize=False):
+        """
+        Write the annotated PDF
         
-        if images and len(images) > 0:
-            # Save the image
-            images[0].save(output_path, 'PNG')
-            return output_path
+        The file is written next to `output_path` and moved into place when
+        complete, so readers never see a partial PDF.
+        
+        Args:
+            output_path (str): Path to save the output PDF
+            optimize (bool): Compress uncompressed streams and merge identical ones
+            linearize (bool): Linearize the file for fast web view (needs qpdf)
+        
+        Returns:
+            str: Path to the saved PDF
+        """
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or '.', suffix='.pdf.tmp')
+        os.close(fd)
+        try:
+            with timed('assemble'):
+                self._write(temp_path, optimize)
+            if linearize and qpdf_available():
+                try:
+                    with timed('linearize'):
+                        temp_path = linearize_pdf(temp_path)
+                except Exception:
+                    # Keep the plain PDF; the failure shows in stage_errors_total
+                    pass
+            os.replace(temp_path, output_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        count_bytes('pdf_output', os.path.getsize(output_path))
+        return output_path
+    
+    def _write(self, output_path, optimize=False):
+        pdf_writer = PyPDF2.PdfWriter()
+        
+        # Font and texture are embedded once and shared by all vector pages
+        vector_renderer = None
+        if any(isinstance(note_page, NoteLayout) for note_page in self.note_pages):
+            vector_renderer = VectorNoteRenderer(pdf_writer)
+        
+        for i in range(self.total_pages):
+            # Add original page
+            pdf_writer.add_page(self.reader.pages[i])
+            
+            # Add page with handwritten notes, or a blank page if none were generated
+            if isinstance(self.note_pages[i], NoteLayout):
+                note_page = self.note_pages[i]
+                pdf_writer.add_page(vector_renderer.page(note_page.ops, note_page.width, note_page.height))
+            elif self.note_pages[i] is not None:
+                pdf_writer.add_page(self.note_pages[i])
+            else:
+                pdf_writer.add_blank_page()
+        
+        if optimize:
+            with timed('optimize'):
+                optimize_pdf_objects(pdf_writer)
+        
+        with open(output_path, 'wb') as output_file:
+            pdf_writer.write(output_file)
+
+def _stream_key(stream):
+    """Content hash of a stream's data and entries, ignoring /Length"""
+    entries = sorted((str(key), repr(value)) for key, value in stream.items() if key != '/Length')
+    digest = hashlib.sha256(repr(entries).encode('utf-8'))
+    digest.update(stream._data)
+    return digest.hexdigest()
+
+def _compress_stream(stream):
+    """Flate-encode an unfiltered stream, or return None if it wouldn't get smaller"""
+    if '/Filter' in stream or stream.get('/Type') == '/Metadata':
+        return None
+    encoded = stream.flate_encode()
+    if len(encoded._data) >= len(stream._data):
+        return None
+    # flate_encode only carries /Filter over
+    for key, value in stream.items():
+        if key not in ('/Length', '/Filter'):
+            encoded[NameObject(key)] = value
+    return encoded
+
+def optimize_pdf_objects(pdf_writer):
+    """
+    Compress and deduplicate the streams of a PdfWriter before it is written
+    
+    Unfiltered streams (typically content streams copied from the source
+    PDF or written by PIL) are Flate-compressed. Streams with identical
+    data and entries, such as an image or font embedded once per page,
+    are merged into one object that every page references.
+    
+    Args:
+        pdf_writer (PyPDF2.PdfWriter): Writer with all pages added
+    
+    Returns:
+        dict: Number of 'compressed' and 'deduplicated' streams
+    """
+    objects = pdf_writer._objects
+    canonical = {}   # stream hash -> object number
+    duplicates = {}  # object number -> object number of the identical stream
+    compressed = 0
+    
+    for i, obj in enumerate(objects):
+        if not isinstance(obj, StreamObject):
+            continue
+        encoded = _compress_stream(obj)
+        if encoded is not None:
+            objects[i] = obj = encoded
+            compressed += 1
+        key = _stream_key(obj)
+        if key in canonical:
+            duplicates[i + 1] = canonical[key]
         else:
-            raise Exception(f"Could not extract page {page_num} from PDF")
+            canonical[key] = i + 1
     
-    except Exception as e:
-        raise Exception(f"Error extracting page as image: {str(e)}")
+    if duplicates:
+        # Point every reference at the kept copy, then drop the others
+        pending = [obj for obj in objects if obj is not None]
+        while pending:
+            container = pending.pop()
+            items = container.items() if isinstance(container, DictionaryObject) else enumerate(container)
+            for key, value in list(items):
+                if isinstance(value, IndirectObject):
+                    if value.pdf is pdf_writer and value.idnum in duplicates:
+                        container[key] = IndirectObject(duplicates[value.idnum], 0, pdf_writer)
+                elif isinstance(value, (DictionaryObject, ArrayObject)):
+                    pending.append(value)
+        for idnum in duplicates:
+            objects[idnum - 1] = NullObject()
+    
+    return {'compressed': compressed, 'deduplicated': len(duplicates)}
 
-def create_blank_page_with_pencil_texture(width, height):
+def qpdf_available():
+    """Whether the qpdf binary used for linearization is installed"""
+    return shutil.which('qpdf') is not None
+
+def linearize_pdf(pdf_path):
+    """
+    Linearize a PDF with qpdf so viewers can show page 1 before the rest arrives
+    
+    Object streams are generated as well, which packs the many small
+    dictionaries of a PDF into compressed streams.
+    
+    Args:
+        pdf_path (str): PDF to linearize
+    
+    Returns:
+        str: Path of the linearized copy, written next to `pdf_path`;
+            `pdf_path` itself is removed
+    """
+    output_path = f"{pdf_path}.linear"
+    result = subprocess.run(
+        ['qpdf', '--linearize', '--object-streams=generate', pdf_path, output_path],
+        capture_output=True, text=True
+    )
+    # Exit status 3 means the file was written with warnings
+    if result.returncode not in (0, 3):
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise Exception(f"qpdf failed: {result.stderr.strip()}")
+    os.remove(pdf_path)
+    return output_path
+
+def save_page_image(image, output_path, format='PNG', **save_options):
+    """
+    Atomically save a page image so readers never see a partial file
+    
+    Args:
+        image (PIL.Image or bytes): Image, or already encoded image bytes
+        output_path (str): Path to save the image
+        format (str): PIL format name used when `image` is a PIL image
+        **save_options: Extra options passed to `Image.save`
+    
+    Returns:
+        str: Path to the saved image
+    """
+    temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if isinstance(image, bytes):
+        with open(temp_path, 'wb') as image_file:
+            image_file.write(image)
+    else:
+        image.save(temp_path, format, **save_options)
+    os.replace(temp_path, output_path)
+    return output_path
+
+def create_blank_page_with_pencil_texture(width, height, seed=None):
     """
     Create a blank page with a subtle pencil texture background
     
     Args:
         width (int): Width of the page
         height (int): Height of the page
+        seed (int): Optional seed for reproducible texture
     
     Returns:
         PIL.Image: Blank page with pencil texture
     """
-    # Create a blank white page
-    blank_page = Image.new('RGB', (width, height), color='white')
-    
-    # Add subtle pencil texture
-    draw = ImageDraw.Draw(blank_page)
-    
-    # Create texture by adding random light gray points
-    for _ in range(width * height // 100):  # Adjust density as needed
-        x = np.random.randint(0, width)
-        y = np.random.randint(0, height)
-        # Very light gray dots
-        gray_value = np.random.randint(230, 250)
-        draw.point((x, y), fill=(gray_value, gray_value, gray_value))
-    
-    return blank_page
\ No newline at end of file
+    # Light gray dots from the shared, cached texture generator
+    return pencil_texture(width, height, gray_range=(230, 250), seed=seed)
@@ -0,0 +1,342 @@
+import os
+import time
+import threading
+from app.utils.pdf_processor import process_pdf
+from app.utils.render_cache import render_settings, rendition_path, save_rendition, render_all_pages
+from app.utils.gemini_client import (
+    fetch_generated_texts, render_error_image, layout_generated_notes, render_layout_image
+)
+from app.utils.note_layout import parse_notes
+from app.utils.vector_notes import vector_notes_available, layout_encodable
+from app.utils.metrics import count_pages, timed
+from app.utils.checkpoints import CheckpointStore
+from app.utils.artifacts import get_artifact_store
+from app.utils.concurrency import RequestThrottle, imap_ordered
+from app.utils.page_analysis import analyze_pages
+
+# Gemini rate limit shared by every job in the process, by its settings
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+def get_request_throttle(requests_per_second, max_in_flight):
+    """
+    Get the process-wide Gemini request throttle
+
+    Concurrent jobs share one token bucket and in-flight cap, so the limits
+    hold for the whole process rather than for each job.
+
+    Args:
+        requests_per_second (float): Request rate limit (0 disables it)
+        max_in_flight (int): Concurrent request cap (0 disables it)
+
+    Returns:
+        RequestThrottle: Shared throttle for these settings
+    """
+    key = (requests_per_second or None, max_in_flight or None)
+    with _throttles_lock:
+        if key not in _throttles:
+            _throttles[key] = RequestThrottle(requests_per_second=key[0], max_in_flight=key[1])
+        return _throttles[key]
+
+def _chunked(items, size):
+    """Group an iterable into lists of up to `size` consecutive items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def run_notes_pipeline(job, filepath, processed_filepath, config, pages=None, force=False):
+    """
+    Rasterize a PDF, generate notes for every page and write the annotated PDF
+
+    Runs outside the request context, so settings are passed in as a plain
+    copy of the app config. Finished pages are checkpointed per upload, so
+    a re-run only rasterizes and generates pages that are missing or failed
+    last time, plus any pages asked for explicitly.
+
+    Args:
+        job (Job): Job that receives progress and timings
+        filepath (str): Path to the uploaded PDF
+        processed_filepath (str): Path to write the annotated PDF to
+        config (dict): Application config values
+        pages (list): Page numbers (1-based) to regenerate even if checkpointed
+        force (bool): Regenerate every page
+
+    Returns:
+        str: Path to the annotated PDF
+    """
+    upload_id = os.path.splitext(os.path.basename(filepath))[0]
+    artifacts = get_artifact_store()
+    group_id = os.path.basename(filepath)
+    checkpoints = CheckpointStore(os.path.join(config['CHECKPOINT_FOLDER'], upload_id), filepath)
+    artifacts.add(checkpoints.directory, group_id, 'checkpoints')
+    total_pages = process_pdf(filepath, get_info_only=True)['page_count']
+    if force:
+        checkpoints.clear()
+    elif pages:
+        checkpoints.clear(pages)
+
+    # Explicitly regenerated pages get fresh responses instead of cached ones
+    refresh = force or bool(pages)
+
+    # Pages finished in an earlier run are reused as they are
+    reused = {}
+    for page_number in checkpoints.completed_pages(total_pages):
+        checkpoint = checkpoints.load(page_number)
+        if checkpoint is not None:
+            reused[page_number] = checkpoint
+    remaining = [page_number for page_number in range(1, total_pages + 1) if page_number not in reused]
+
+    # Pages are rasterized lazily in small windows so memory doesn't grow
+    # with document length
+    result = process_pdf(
+        filepath,
+        stream=True,
+        dpi=config['PDF_RENDER_DPI'],
+        thread_count=config['POPPLER_THREAD_COUNT'],
+        window=config['PDF_STREAM_WINDOW'],
+        workers=config['PDF_EXTRACT_WORKERS'],
+        page_numbers=remaining
+    )
+    job.start(total_pages)
+
+    # Drop output from an earlier run so stale pages are never served;
+    # renditions of reused pages are still valid
+    settings = render_settings(config)
+    for page_number in remaining:
+        for page_num in (2 * (page_number - 1), 2 * (page_number - 1) + 1):
+            for kind in ('view', 'thumb'):
+                stale_path = rendition_path(processed_filepath, page_num, settings, kind=kind)
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+                    artifacts.discard(stale_path)
+    if os.path.exists(processed_filepath):
+        os.remove(processed_filepath)
+        artifacts.discard(processed_filepath)
+
+    # Generate notes for all pages concurrently, bounded by the worker pool
+    # and the process-wide rate limit / in-flight cap on Gemini requests
+    throttle = get_request_throttle(config['GEMINI_REQUESTS_PER_SECOND'], config['GEMINI_MAX_IN_FLIGHT'])
+
+    # In progressive mode every page is stored as a viewer rendition as soon as
+    # it exists, so the viewer can show it before the whole PDF is written.
+    # Original page i is output page 2i and its notes are output page 2i + 1
+    progressive = config['PROGRESSIVE_PAGES']
+    
+    # Vector note pages embed the handwriting font; without it they fall
+    # back to raster pages, as do pages with text outside its encoding
+    vector = config['NOTE_PAGE_FORMAT'] == 'vector' and vector_notes_available()
+
+    def view_scale(width):
+        return min(1.0, settings['page_width'] / width)
+
+    def finish_page(page_content, text, error, started, store_rendition=True):
+        """Lay out a page's notes (or render an error page) and store its rendition"""
+        width = page_content['width']
+        height = page_content['height']
+        index = page_content['page_number'] - 1
+        note_image = parsed_notes = note_layout = None
+        try:
+            if error is None:
+                # Parsed once; the layout serves both page formats and every
+                # rendition scale
+                parsed_notes = parse_notes(text)
+                note_layout = layout_generated_notes(text, width, height)
+                if not vector or not layout_encodable(note_layout):
+                    with timed('render_notes'):
+                        note_image = render_layout_image(note_layout, width, height)
+        except Exception as e:
+            error = str(e)
+            parsed_notes = note_layout = note_image = None
+        if error is not None:
+            # A failed page gets an error page instead of stopping the job
+            note_image = render_error_image(error, width, height)
+        if progressive and store_rendition:
+            rendition = note_image
+            if note_layout is not None:
+                # Draw the layout straight at viewer size
+                rendition = render_layout_image(note_layout, width, height, scale=view_scale(width))
+            save_rendition(rendition, processed_filepath, 2 * index + 1, settings)
+        return {
+            'page_number': page_content['page_number'],
+            'note_image': note_image,
+            'parsed_notes': parsed_notes,
+            'note_layout': note_layout,
+            'width': width,
+            'height': height,
+            'text': text if error is None else None,
+            'error': error,
+            'seconds': time.perf_counter() - started,
+            'upload': page_content.get('upload'),
+            'analysis': page_content.get('analysis')
+        }
+
+    def notes_for_pages(page_contents):
+        started = time.perf_counter()
+        if progressive:
+            for page_content in page_contents:
+                index = page_content['page_number'] - 1
+                save_rendition(page_content['image'], processed_filepath, 2 * index, settings)
+
+        # Only pages that need their own notes go to Gemini; consecutive
+        # pages may share one request in batching mode
+        kinds = [page_content.get('analysis', {}).get('kind', 'unique') for page_content in page_contents]
+        api_pages = [page_content for page_content, kind in zip(page_contents, kinds) if kind == 'unique']
+        generated = iter(fetch_generated_texts(
+            api_pages,
+            throttle=throttle,
+            max_batch_bytes=config['GEMINI_BATCH_MAX_BYTES'],
+            refresh=refresh
+        ))
+
+        page_results = []
+        for page_content, kind in zip(page_contents, kinds):
+            if kind == 'unique':
+                page_generated = next(generated)
+                page_results.append(finish_page(page_content, page_generated['text'], page_generated['error'], started))
+            elif kind == 'blank':
+                # Plain note page, no API call
+                page_results.append(finish_page(page_content, '', None, started))
+            else:
+                # Duplicates and extensions are resolved in page order once
+                # their source page's notes exist
+                page_results.append({'page_number': page_content['page_number'], 'deferred': page_content})
+        return page_results
+
+    def failed_chunk(page_contents, exception):
+        """
+        Error pages for every page of a chunk that raised, so one failure
+        doesn't stop the job
+
+        No renditions are stored (storing them may be what failed); the
+        viewer renders these pages from the finished PDF instead.
+        """
+        started = time.perf_counter()
+        return [
+            finish_page(page_content, None, str(exception), started, store_rendition=False)
+            for page_content in page_contents
+        ]
+
+    def resolve_deferred(page_content):
+        """Reuse (and extend) the source page's notes for a near-duplicate page"""
+        started = time.perf_counter()
+        analysis = page_content['analysis']
+        source_text = generated_by_page.get(analysis['source'])
+        if source_text is None:
+            # Source page failed; generate this page's notes on its own
+            page_generated = fetch_generated_texts([page_content], throttle=throttle, refresh=refresh)[0]
+            return finish_page(page_content, page_generated['text'], page_generated['error'], started)
+
+        job.count('api_calls_saved')
+        text = source_text
+        if analysis['kind'] == 'extends':
+            text = f"{source_text}\n{analysis['added_text']}"
+        return finish_page(page_content, text, None, started)
+
+    def add_note_page(page_result):
+        index = page_result['page_number'] - 1
+        note_image = page_result['note_image']
+        if note_image is None and vector and layout_encodable(page_result['note_layout']):
+            result['annotated_writer'].add_note_layout(
+                index, page_result['note_layout'], page_result['width'], page_result['height']
+            )
+            return
+        if note_image is None:
+            # Checkpointed page: draw it from its stored layout, so switching
+            # the note page format needs no new notes
+            note_image = render_layout_image(page_result['note_layout'], page_result['width'], page_result['height'])
+        result['annotated_writer'].add_note_image(index, note_image)
+
+    # Put checkpointed pages straight into the output
+    generated_by_page = {}
+    for page_number, checkpoint in reused.items():
+        if progressive:
+            index = page_number - 1
+            if not os.path.exists(rendition_path(processed_filepath, 2 * index + 1, settings)):
+                rendition = render_layout_image(
+                    checkpoint['note_layout'], checkpoint['width'], checkpoint['height'],
+                    scale=view_scale(checkpoint['width'])
+                )
+                save_rendition(rendition, processed_filepath, 2 * index + 1, settings)
+        checkpoint['page_number'] = page_number
+        add_note_page(checkpoint)
+        generated_by_page[page_number] = checkpoint['text']
+        job.count('pages_reused')
+        job.record_page(page_number, 'completed', details={'checkpoint': True})
+    reused.clear()
+
+    # Pre-pass that flags blank and near-duplicate pages so they skip the API
+    extracted_pages = result['extracted_contents']
+    if config['PAGE_DEDUP']:
+        extracted_pages = analyze_pages(
+            extracted_pages,
+            blank_ink_threshold=config['BLANK_PAGE_INK_THRESHOLD'],
+            duplicate_distance=config['DUPLICATE_HASH_DISTANCE']
+        )
+
+    # Add each note page to the output (and its checkpoint) as soon as it is
+    # ready so the images aren't held for the whole document
+    started = time.perf_counter()
+    for page_results in imap_ordered(
+        notes_for_pages,
+        _chunked(extracted_pages, max(1, config['GEMINI_BATCH_PAGES'])),
+        max_workers=config['NOTES_MAX_WORKERS'],
+        on_error=failed_chunk
+    ):
+        for page_result in page_results:
+            if 'deferred' in page_result:
+                try:
+                    page_result = resolve_deferred(page_result['deferred'])
+                except Exception as e:
+                    page_result = failed_chunk([page_result['deferred']], e)[0]
+            elif page_result['analysis'] and page_result['analysis']['kind'] == 'blank':
+                job.count('api_calls_saved')
+
+            if page_result['text'] is not None:
+                generated_by_page[page_result['page_number']] = page_result['text']
+            add_note_page(page_result)
+            checkpoints.save(page_result)
+            # Keeps the upload from being evicted while the job runs
+            artifacts.touch(group_id)
+
+            details = {}
+            if page_result['upload']:
+                details['upload'] = page_result['upload']
+            if page_result['analysis']:
+                details['analysis'] = {
+                    key: value for key, value in page_result['analysis'].items() if key != 'added_text'
+                }
+            status = 'failed' if page_result['error'] else 'completed'
+            count_pages(status)
+            job.record_page(
+                page_result['page_number'],
+                status,
+                seconds=page_result['seconds'],
+                error=page_result['error'],
+                details=details
+            )
+    job.record_stage('generate', time.perf_counter() - started)
+
+    # Create the final PDF with original pages and inserted note pages
+    started = time.perf_counter()
+    final_pdf_path = result['create_annotated_pdf'](
+        processed_filepath,
+        optimize=config['PDF_OPTIMIZE_OUTPUT'],
+        linearize=config['PDF_LINEARIZE']
+    )
+    job.record_stage('assemble', time.perf_counter() - started)
+    artifacts.add(final_pdf_path, group_id, 'processed')
+    artifacts.add(checkpoints.directory, group_id, 'checkpoints')
+
+    # Without progressive renditions, pre-render the viewer pages in one batch
+    if not progressive:
+        started = time.perf_counter()
+        render_all_pages(final_pdf_path, settings)
+        job.record_stage('render', time.perf_counter() - started)
+
+    job.complete(os.path.basename(final_pdf_path))
+    return final_pdf_path
@@ -0,0 +1,213 @@
+import os
+import io
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.metrics import timed
+from app.utils.artifacts import get_artifact_store, upload_filename_for
+
+# PIL, PyPDF2 and pdf2image are imported where they are used, so the web
+# app can start (and route requests) without loading them
+
+# File extensions for the supported viewer image formats
+IMAGE_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+def render_settings(config):
+    """
+    Collect page rendition settings from the app config
+
+    Args:
+        config (dict): Application config values
+
+    Returns:
+        dict: Viewer width, thumbnail width, image format/quality and poppler threads
+    """
+    image_format = config['VIEWER_IMAGE_FORMAT'].upper()
+    if image_format not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Unsupported viewer image format: {image_format}")
+
+    return {
+        'page_width': config['VIEWER_PAGE_WIDTH'],
+        'thumbnail_width': config['THUMBNAIL_WIDTH'],
+        'format': image_format,
+        'quality': config['VIEWER_IMAGE_QUALITY'],
+        'thread_count': config['RENDER_THREAD_COUNT']
+    }
+
+def rendition_path(processed_filepath, page_num, settings, kind='view'):
+    """
+    Path of a cached rendition for one page of a processed PDF
+
+    Args:
+        processed_filepath (str): Path to the processed PDF
+        page_num (int): Page number in the processed PDF (0-indexed)
+        settings (dict): Rendition settings from `render_settings`
+        kind (str): 'view' for the viewer-sized image, 'thumb' for the thumbnail
+
+    Returns:
+        str: Path of the rendition
+    """
+    extension = IMAGE_EXTENSIONS[settings['format']]
+    return f"{os.path.splitext(processed_filepath)[0]}_{kind}_{page_num}.{extension}"
+
+def save_rendition(image, processed_filepath, page_num, settings):
+    """
+    Save the viewer-sized image and thumbnail for one page
+
+    Args:
+        image (PIL.Image or bytes): Page image at any resolution, or encoded image bytes
+        processed_filepath (str): Path to the processed PDF
+        page_num (int): Page number in the processed PDF (0-indexed)
+        settings (dict): Rendition settings from `render_settings`
+
+    Returns:
+        str: Path of the viewer-sized rendition
+    """
+    from PIL import Image
+    from app.utils.pdf_processor import save_page_image
+
+    with timed('save_rendition'):
+        if isinstance(image, bytes):
+            image = Image.open(io.BytesIO(image))
+        image = image.convert('RGB')
+
+        # Downscale to the viewer width (never upscale)
+        if image.width > settings['page_width']:
+            height = round(image.height * settings['page_width'] / image.width)
+            image = image.resize((settings['page_width'], height), Image.LANCZOS)
+
+        view_path = rendition_path(processed_filepath, page_num, settings)
+        save_page_image(image, view_path, settings['format'], quality=settings['quality'])
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((settings['thumbnail_width'], settings['thumbnail_width'] * 4))
+        thumb_path = rendition_path(processed_filepath, page_num, settings, kind='thumb')
+        save_page_image(thumbnail, thumb_path, settings['format'], quality=settings['quality'])
+
+    # Renditions count towards the disk quota of their upload
+    artifacts = get_artifact_store()
+    group_id = upload_filename_for(processed_filepath)
+    artifacts.add(view_path, group_id, 'rendition')
+    artifacts.add(thumb_path, group_id, 'rendition')
+
+    return view_path
+
+def render_page(processed_filepath, page_num, settings):
+    """
+    Render one page of a processed PDF straight to viewer size
+
+    Args:
+        processed_filepath (str): Path to the processed PDF
+        page_num (int): Page number to render (0-indexed)
+        settings (dict): Rendition settings from `render_settings`
+
+    Returns:
+        str: Path of the viewer-sized rendition
+    """
+    from pdf2image import convert_from_path
+
+    with timed('render_page'):
+        images = convert_from_path(
+            processed_filepath,
+            first_page=page_num + 1,
+            last_page=page_num + 1,
+            size=(settings['page_width'], None)
+        )
+
+    if not images:
+        raise Exception(f"Could not extract page {page_num} from PDF")
+
+    return save_rendition(images[0], processed_filepath, page_num, settings)
+
+def render_all_pages(processed_filepath, settings):
+    """
+    Render every page of a processed PDF in one batched poppler pass
+
+    Poppler writes the pages to a temporary folder, and they are converted
+    one at a time, so memory stays bounded for long documents. Pages that
+    already have a rendition are kept (a new pipeline run deletes its old
+    renditions before writing the PDF), and poppler is skipped entirely when
+    all of them exist.
+
+    Args:
+        processed_filepath (str): Path to the processed PDF
+        settings (dict): Rendition settings from `render_settings`
+
+    Returns:
+        int: Number of pages rendered
+    """
+    import PyPDF2
+    from PIL import Image
+    from pdf2image import convert_from_path
+
+    total_pages = len(PyPDF2.PdfReader(processed_filepath).pages)
+    missing = [
+        page_num for page_num in range(total_pages)
+        if not os.path.exists(rendition_path(processed_filepath, page_num, settings))
+    ]
+    if not missing:
+        return 0
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with timed('render_all_pages'):
+            page_paths = convert_from_path(
+                processed_filepath,
+                size=(settings['page_width'], None),
+                output_folder=temp_dir,
+                first_page=missing[0] + 1,
+                last_page=missing[-1] + 1,
+                fmt='ppm',
+                thread_count=settings['thread_count'],
+                paths_only=True
+            )
+
+        # pdf2image returns the paths in page order; with several poppler
+        # threads their file names start with per-thread random prefixes, so
+        # they must not be re-sorted by name
+        rendered = 0
+        for page_num, page_path in enumerate(page_paths, start=missing[0]):
+            if not os.path.exists(rendition_path(processed_filepath, page_num, settings)):
+                with Image.open(page_path) as image:
+                    save_rendition(image, processed_filepath, page_num, settings)
+                rendered += 1
+            os.remove(page_path)
+
+    return rendered
+
+class RenderCache:
+    """
+    Background batch renderer for processed PDFs
+
+    `schedule` queues one batched render per processed file; repeated calls
+    for the same file are ignored while it is queued or already rendered.
+    """
+
+    def __init__(self, settings, max_workers=1):
+        self.settings = settings
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='page-render')
+        self._scheduled = {}  # processed file path -> PDF mtime it was scheduled for
+        self._lock = threading.Lock()
+
+    def schedule(self, processed_filepath):
+        """
+        Queue a background render of all pages of a processed PDF
+
+        Args:
+            processed_filepath (str): Path to the processed PDF
+        """
+        pdf_mtime = os.path.getmtime(processed_filepath)
+        with self._lock:
+            if self._scheduled.get(processed_filepath) == pdf_mtime:
+                return
+            self._scheduled[processed_filepath] = pdf_mtime
+        self.executor.submit(self._render, processed_filepath)
+
+    def _render(self, processed_filepath):
+        try:
+            render_all_pages(processed_filepath, self.settings)
+        except Exception:
+            traceback.print_exc()
+            # Allow a later request to try again
+            with self._lock:
+                self._scheduled.pop(processed_filepath, None)
@@ -0,0 +1,189 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Seconds between rescans of the cache directory, which pick up entries
+# written by other server worker processes
+RESCAN_INTERVAL = 60
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of generated note text
+
+    Entries are stored as one file per key under `directory` and evicted in
+    least-recently-used order once the total size exceeds `max_bytes`.
+    Recency is kept in memory and mirrored to file mtimes so it survives
+    restarts. Several processes may share the directory: entries another
+    process wrote are found on disk, and every `RESCAN_INTERVAL` seconds the
+    index is rebuilt from disk so the cap holds for the directory as a whole.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._scanned_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Build a cache key from bytes/str parts
+
+        Each part is length-prefixed so different splits of the same bytes
+        can never collide.
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def _load_index(self):
+        """Rebuild the LRU index from the files already on disk"""
+        index = self._scan()
+        with self._lock:
+            self._swap_index(index)
+            self._evict()
+
+    def _scan(self):
+        """Index of the files on disk, oldest first (runs without the lock)"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.txt'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+
+        return OrderedDict((key, size) for _, key, size in sorted(entries))
+
+    def _swap_index(self, index):
+        """Replace the index with a fresh scan of the directory (lock held)"""
+        self._index = index
+        self._total_bytes = sum(index.values())
+        self._scanned_at = time.monotonic()
+
+    def get(self, key):
+        """
+        Look up generated text
+
+        Args:
+            key (str): Cache key from `make_key`
+
+        Returns:
+            str: Cached text, or None on a miss
+        """
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+
+        # Keys missing from the index may have been stored by another process
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                text = cache_file.read()
+            os.utime(path)
+        except OSError:
+            # File vanished underneath us; treat as a miss
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+                self._stats['misses'] += 1
+            return None
+
+        with self._lock:
+            if key not in self._index:
+                size = len(text.encode('utf-8'))
+                self._index[key] = size
+                self._total_bytes += size
+            self._stats['hits'] += 1
+        return text
+
+    def put(self, key, text):
+        """
+        Store generated text, evicting old entries if over the size cap
+
+        Args:
+            key (str): Cache key from `make_key`
+            text (str): Generated text to store
+        """
+        data = text.encode('utf-8')
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write atomically so concurrent readers never see partial files
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            self._stats['stores'] += 1
+            rescan = time.monotonic() - self._scanned_at > RESCAN_INTERVAL
+            if rescan:
+                # Claim the rescan so concurrent stores don't start their own
+                self._scanned_at = time.monotonic()
+            else:
+                self._evict()
+        if not rescan:
+            return
+
+        # Count what other processes have added before deciding what to evict.
+        # The directory walk runs outside the lock so lookups aren't blocked
+        index = self._scan()
+        with self._lock:
+            self._swap_index(index)
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until under the size cap (lock held)"""
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self._stats['evictions'] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                # Already evicted by another process
+                pass
+
+    def stats(self):
+        """
+        Snapshot of cache counters
+
+        Returns:
+            dict: Hit/miss/store/eviction counts, entry count and size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._index)
+            stats['bytes'] = self._total_bytes
+            stats['max_bytes'] = self.max_bytes
+        return stats
@@ -0,0 +1,60 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+# Number of pre-generated textures (one per page size / gray range / seed) kept in memory
+TEXTURE_CACHE_SIZE = int(os.getenv('TEXTURE_CACHE_SIZE', '8'))
+
+_texture_cache = OrderedDict()
+_texture_cache_lock = threading.Lock()
+
+def _generate_texture(width, height, gray_range, seed):
+    """
+    Build a pencil texture as a single vectorized NumPy operation
+
+    Scatters `width * height / 100` light gray dots over a white page, the
+    same density the per-pixel drawing loops used.
+    """
+    rng = np.random.default_rng(seed)
+    dot_count = width * height // 100
+
+    pixels = np.full(width * height, 255, dtype=np.uint8)
+    positions = rng.integers(0, width * height, size=dot_count)
+    pixels[positions] = rng.integers(gray_range[0], gray_range[1], size=dot_count, dtype=np.uint8)
+
+    return Image.fromarray(pixels.reshape(height, width), mode='L').convert('RGB')
+
+def pencil_texture(width, height, gray_range=(240, 252), seed=None):
+    """
+    Get a white page with a subtle pencil texture
+
+    Textures are cached per page size, gray range and seed and reused across
+    pages and requests, so repeated calls only pay for a copy. Without a seed
+    the cached texture is generated once per process from fresh entropy.
+
+    Args:
+        width (int): Width of the page
+        height (int): Height of the page
+        gray_range (tuple): Lowest (inclusive) and highest (exclusive) dot gray value
+        seed (int): Optional seed for reproducible output
+
+    Returns:
+        PIL.Image: New RGB image with the texture, safe to draw on
+    """
+    key = (width, height, tuple(gray_range), seed)
+
+    with _texture_cache_lock:
+        texture = _texture_cache.get(key)
+        if texture is not None:
+            _texture_cache.move_to_end(key)
+
+    if texture is None:
+        texture = _generate_texture(width, height, gray_range, seed)
+        with _texture_cache_lock:
+            _texture_cache[key] = texture
+            while len(_texture_cache) > TEXTURE_CACHE_SIZE:
+                _texture_cache.popitem(last=False)
+
+    return texture.copy()
@@ -0,0 +1,350 @@
+import os
+import re
+import json
+import fcntl
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+from werkzeug.utils import secure_filename
+from app.utils.artifacts import get_artifact_store
+
+# Bytes read from the request / file per iteration while streaming
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Leading bytes every PDF starts with
+PDF_MAGIC = b'%PDF-'
+
+
+class UploadError(Exception):
+    """Upload request that can't be accepted, with the HTTP status to report"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadStore:
+    """
+    Chunked, resumable uploads streamed straight to disk, deduplicated by content hash
+
+    A session's bytes go to `<upload folder>/.partial/<id>.part`; its
+    metadata sits next to it, so an interrupted upload can resume from the
+    size of the partial file, even after a restart. A SHA-256 of the
+    content is kept up to date as chunks arrive. Finished uploads are
+    indexed by hash, one file per hash under `.hashes/` so server worker
+    processes never overwrite each other's entries, and an upload identical
+    to an existing one resolves
+    to the existing file, so its processed PDF, checkpoints and renditions
+    are reused.
+    """
+
+    def __init__(self, upload_folder, max_upload_size, chunk_size, session_ttl=24 * 3600):
+        self.upload_folder = upload_folder
+        self.max_upload_size = max_upload_size
+        self.chunk_size = chunk_size
+        self.session_ttl = session_ttl
+        self.partial_folder = os.path.join(upload_folder, '.partial')
+        self.index_folder = os.path.join(upload_folder, '.hashes')
+        self._lock = threading.Lock()
+        self._hashers = {}   # upload id -> (offset hashed, hashlib object)
+        self._busy = set()   # upload ids with a chunk being written
+
+        os.makedirs(self.partial_folder, exist_ok=True)
+        os.makedirs(self.index_folder, exist_ok=True)
+        self._migrate_index(os.path.join(upload_folder, '.hashes.json'))
+
+    def _paths(self, upload_id):
+        base = os.path.join(self.partial_folder, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def _write_json(self, path, data):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as json_file:
+            json.dump(data, json_file)
+        os.replace(temp_path, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as json_file:
+                return json.load(json_file)
+        except (OSError, ValueError):
+            return None
+
+    def _index_entry(self, sha256):
+        """Upload filename recorded for a hash, or None"""
+        if not re.fullmatch(r'[0-9a-f]{64}', sha256 or ''):
+            return None
+        try:
+            with open(os.path.join(self.index_folder, sha256), 'r', encoding='utf-8') as entry_file:
+                return entry_file.read().strip() or None
+        except OSError:
+            return None
+
+    def find_by_hash(self, sha256):
+        """
+        Find a finished upload with this content hash
+
+        Args:
+            sha256 (str): Hex SHA-256 of the file
+
+        Returns:
+            str: Upload filename, or None if unknown or since deleted
+        """
+        filename = self._index_entry(sha256)
+        if filename and os.path.exists(os.path.join(self.upload_folder, filename)):
+            return filename
+        return None
+
+    def _register(self, sha256, filename):
+        """
+        Record `filename` as the upload with this hash, unless a live one is recorded
+
+        The entry is written to a temporary file and hard-linked into place,
+        which fails if the entry exists, so of two processes storing the
+        same content at once exactly one wins.
+
+        Returns:
+            str: Filename the index holds for the hash afterwards
+        """
+        entry_path = os.path.join(self.index_folder, sha256)
+        fd, temp_path = tempfile.mkstemp(dir=self.index_folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as entry_file:
+                entry_file.write(filename)
+            try:
+                os.link(temp_path, entry_path)
+                return filename
+            except FileExistsError:
+                existing = self.find_by_hash(sha256)
+                if existing is not None:
+                    return existing
+                # The recorded upload has since been deleted
+                os.replace(temp_path, entry_path)
+                return filename
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _migrate_index(self, legacy_path):
+        """Move entries from the single-file index of earlier versions"""
+        index = self._read_json(legacy_path)
+        if index is None:
+            return
+        for sha256, filename in index.items():
+            if re.fullmatch(r'[0-9a-f]{64}', sha256):
+                self._register(sha256, filename)
+        os.remove(legacy_path)
+
+    def _cleanup_expired(self):
+        """Drop sessions that haven't received data within the TTL"""
+        cutoff = time.time() - self.session_ttl
+        for name in os.listdir(self.partial_folder):
+            path = os.path.join(self.partial_folder, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                upload_id = name.rsplit('.', 1)[0]
+                with self._lock:
+                    if upload_id in self._busy:
+                        continue
+                    self._hashers.pop(upload_id, None)
+                os.remove(path)
+            except FileNotFoundError:
+                # Finished or cleaned up by another worker process meanwhile
+                continue
+
+    def create(self, filename, size):
+        """
+        Start an upload session
+
+        Args:
+            filename (str): Client file name
+            size (int): Total size in bytes
+
+        Returns:
+            dict: Session with 'upload_id', 'filename', 'size' and 'offset'
+        """
+        if not filename or not filename.lower().endswith('.pdf'):
+            raise UploadError('Invalid file type. Please upload a PDF.')
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('Invalid file size')
+        if size > self.max_upload_size:
+            raise UploadError(f"File is larger than {self.max_upload_size // (1024 * 1024)}MB", 413)
+
+        self._cleanup_expired()
+
+        session = {
+            'upload_id': uuid.uuid4().hex,
+            'filename': secure_filename(filename) or 'upload.pdf',
+            'size': size,
+            'created_at': time.time()
+        }
+        meta_path, part_path = self._paths(session['upload_id'])
+        open(part_path, 'wb').close()
+        self._write_json(meta_path, session)
+        session['offset'] = 0
+        return session
+
+    def status(self, upload_id):
+        """
+        Current state of an upload session
+
+        Returns:
+            dict: Session including the 'offset' to resume from, or None
+        """
+        if not upload_id.isalnum():
+            return None
+        meta_path, part_path = self._paths(upload_id)
+        session = self._read_json(meta_path)
+        if session is None or not os.path.exists(part_path):
+            return None
+        session['offset'] = os.path.getsize(part_path)
+        return session
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """
+        Append a chunk read from `stream` at `offset`
+
+        Args:
+            upload_id (str): Session ID
+            offset (int): Byte offset of the chunk; must equal the bytes received so far
+            stream (file-like): Request body
+            length (int): Chunk length in bytes
+
+        Returns:
+            dict: Updated session
+        """
+        session = self.status(upload_id)
+        if session is None:
+            raise UploadError('Upload not found', 404)
+        if offset != session['offset']:
+            raise UploadError(f"Expected offset {session['offset']}", 409)
+        if length is None or offset + length > session['size']:
+            raise UploadError('Chunk exceeds the declared file size')
+
+        with self._lock:
+            if upload_id in self._busy:
+                raise UploadError('Another chunk is being written', 409)
+            self._busy.add(upload_id)
+
+        _, part_path = self._paths(upload_id)
+        try:
+            with open(part_path, 'ab') as part_file:
+                # Locked across processes too, since a retried chunk may reach
+                # another server worker; the size is checked again under the
+                # lock so a chunk that finished meanwhile isn't appended twice
+                try:
+                    fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadError('Another chunk is being written', 409)
+                current_offset = os.fstat(part_file.fileno()).st_size
+                if current_offset != offset:
+                    raise UploadError(f"Expected offset {current_offset}", 409)
+
+                hasher = self._hasher(upload_id, part_path, offset)
+                written = 0
+                while written < length:
+                    data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                    if not data:
+                        break
+                    part_file.write(data)
+                    hasher.update(data)
+                    written += len(data)
+            with self._lock:
+                self._hashers[upload_id] = (offset + written, hasher)
+        finally:
+            with self._lock:
+                self._busy.discard(upload_id)
+
+        session['offset'] = offset + written
+        return session
+
+    def _hasher(self, upload_id, part_path, offset):
+        """Running hash of the first `offset` bytes, rebuilt from disk if needed"""
+        with self._lock:
+            hashed_offset, hasher = self._hashers.get(upload_id, (None, None))
+        if hasher is not None and hashed_offset == offset:
+            return hasher
+
+        # First chunk after a restart, or an earlier chunk was cut short
+        hasher = hashlib.sha256()
+        with open(part_path, 'rb') as part_file:
+            remaining = offset
+            while remaining:
+                data = part_file.read(min(COPY_BUFFER_SIZE, remaining))
+                if not data:
+                    break
+                hasher.update(data)
+                remaining -= len(data)
+        return hasher
+
+    def finalize(self, upload_id):
+        """
+        Turn a complete session into an upload, or resolve it to an identical one
+
+        Returns:
+            dict: 'filename', 'sha256' and 'deduplicated'
+        """
+        session = self.status(upload_id)
+        if session is None:
+            raise UploadError('Upload not found', 404)
+        if session['offset'] != session['size']:
+            raise UploadError(f"Upload incomplete: {session['offset']} of {session['size']} bytes", 409)
+
+        meta_path, part_path = self._paths(upload_id)
+        sha256 = self._hasher(upload_id, part_path, session['offset']).hexdigest()
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+
+        try:
+            return self._store(part_path, session['filename'], sha256)
+        finally:
+            for path in (meta_path, part_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def add_file(self, path, filename):
+        """
+        Register a file received in a single request
+
+        Args:
+            path (str): Temporary path of the received file
+            filename (str): Client file name
+
+        Returns:
+            dict: 'filename', 'sha256' and 'deduplicated'
+        """
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as received:
+            for data in iter(lambda: received.read(COPY_BUFFER_SIZE), b''):
+                hasher.update(data)
+        try:
+            return self._store(path, secure_filename(filename) or 'upload.pdf', hasher.hexdigest())
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _store(self, path, filename, sha256):
+        """Move a received file into the upload folder unless an identical one exists"""
+        with open(path, 'rb') as received:
+            if received.read(len(PDF_MAGIC)) != PDF_MAGIC:
+                raise UploadError('Invalid file type. Please upload a PDF.')
+
+        existing = self.find_by_hash(sha256)
+        if existing is not None:
+            get_artifact_store().touch(existing)
+            return {'filename': existing, 'sha256': sha256, 'deduplicated': True}
+
+        unique_filename = f"{uuid.uuid4().hex}_{filename}"
+        stored_path = os.path.join(self.upload_folder, unique_filename)
+        os.replace(path, stored_path)
+        registered = self._register(sha256, unique_filename)
+        if registered != unique_filename:
+            # Another process stored the same content first
+            os.remove(stored_path)
+            get_artifact_store().touch(registered)
+            return {'filename': registered, 'sha256': sha256, 'deduplicated': True}
+        get_artifact_store().add(stored_path, unique_filename, 'upload')
+        return {'filename': unique_filename, 'sha256': sha256, 'deduplicated': False}
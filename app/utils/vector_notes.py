@@ -0,0 +1,183 @@
+import re
+from PyPDF2 import PageObject
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject,
+    NameObject, NumberObject
+)
+from app.utils.fonts import FONT_PATH, get_font
+from app.utils.texture import pencil_texture
+
+# Side of the square texture tile repeated across each vector note page
+TEXTURE_TILE_SIZE = 256
+
+# Single-byte encoding used for note text (PDF WinAnsiEncoding)
+TEXT_ENCODING = 'cp1252'
+
+def vector_notes_available():
+    """Vector note pages need the handwriting font to embed"""
+    return FONT_PATH is not None
+
+def layout_encodable(ops):
+    """
+    Whether every text operation of a layout can be written with the
+    embedded font's single-byte encoding
+
+    Pages with other characters (arrows, Greek letters, math symbols) are
+    written as raster note pages instead, so nothing turns into '?'.
+    """
+    try:
+        for op in ops:
+            if op['op'] == 'text':
+                op['text'].encode(TEXT_ENCODING)
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def _number(value):
+    """Format a number compactly for a content stream"""
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+def _color(color):
+    return ' '.join(_number(channel / 255) for channel in color)
+
+def _compressed_stream(data, entries=None):
+    """Flate-compressed stream object carrying `entries` in its dictionary"""
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    stream = stream.flate_encode()
+    for key, value in (entries or {}).items():
+        stream[NameObject(key)] = value
+    return stream
+
+
+class VectorNoteRenderer:
+    """
+    Write laid-out note pages as PDF vector content
+
+    The handwriting font and one small texture tile are embedded once per
+    document and shared by every note page, so a note page only adds a short
+    compressed content stream. One page pixel maps to one PDF point, the same
+    size raster note pages are embedded at.
+    """
+
+    def __init__(self, pdf_writer, texture_seed=None):
+        self.pdf_writer = pdf_writer
+        self.font = self._add_font()
+        self.texture = self._add_texture(texture_seed)
+
+    def _add_font(self):
+        """Embed the handwriting TrueType font with WinAnsi widths"""
+        with open(FONT_PATH, 'rb') as font_file:
+            font_data = font_file.read()
+
+        # PIL measures at 1000 px per em, which is PDF glyph space
+        font = get_font(1000)
+        ascent, descent = font.getmetrics()
+        widths = []
+        for code in range(32, 256):
+            try:
+                char = bytes([code]).decode(TEXT_ENCODING)
+                widths.append(NumberObject(round(font.getlength(char))))
+            except UnicodeDecodeError:
+                widths.append(NumberObject(0))
+
+        font_name = re.sub(r'[^A-Za-z0-9-]', '', ''.join(font.getname())) or 'Handwriting'
+        font_file = self.pdf_writer._add_object(_compressed_stream(font_data, {
+            '/Length1': NumberObject(len(font_data))
+        }))
+        descriptor = self.pdf_writer._add_object(DictionaryObject({
+            NameObject('/Type'): NameObject('/FontDescriptor'),
+            NameObject('/FontName'): NameObject(f'/{font_name}'),
+            NameObject('/Flags'): NumberObject(32),
+            NameObject('/FontBBox'): ArrayObject([
+                NumberObject(0), NumberObject(-descent), NumberObject(1000), NumberObject(ascent)
+            ]),
+            NameObject('/ItalicAngle'): NumberObject(0),
+            NameObject('/Ascent'): NumberObject(ascent),
+            NameObject('/Descent'): NumberObject(-descent),
+            NameObject('/CapHeight'): NumberObject(ascent),
+            NameObject('/StemV'): NumberObject(80),
+            NameObject('/FontFile2'): font_file
+        }))
+        return self.pdf_writer._add_object(DictionaryObject({
+            NameObject('/Type'): NameObject('/Font'),
+            NameObject('/Subtype'): NameObject('/TrueType'),
+            NameObject('/BaseFont'): NameObject(f'/{font_name}'),
+            NameObject('/FirstChar'): NumberObject(32),
+            NameObject('/LastChar'): NumberObject(255),
+            NameObject('/Widths'): ArrayObject(widths),
+            NameObject('/Encoding'): NameObject('/WinAnsiEncoding'),
+            NameObject('/FontDescriptor'): descriptor
+        }))
+
+    def _add_texture(self, seed):
+        """Embed one grayscale pencil texture tile"""
+        tile = pencil_texture(TEXTURE_TILE_SIZE, TEXTURE_TILE_SIZE, gray_range=(240, 252), seed=seed)
+        return self.pdf_writer._add_object(_compressed_stream(tile.convert('L').tobytes(), {
+            '/Type': NameObject('/XObject'),
+            '/Subtype': NameObject('/Image'),
+            '/Width': NumberObject(TEXTURE_TILE_SIZE),
+            '/Height': NumberObject(TEXTURE_TILE_SIZE),
+            '/ColorSpace': NameObject('/DeviceGray'),
+            '/BitsPerComponent': NumberObject(8)
+        }))
+
+    def content_stream(self, ops, width, height):
+        """
+        Build the page content for a layout
+
+        Args:
+            ops (list): Drawing operations from `flow_notes`
+            width (int): Width of the page
+            height (int): Height of the page
+
+        Returns:
+            bytes: Uncompressed content stream
+        """
+        commands = []
+
+        # Tile the texture over the page
+        for x in range(0, width, TEXTURE_TILE_SIZE):
+            for y in range(0, height, TEXTURE_TILE_SIZE):
+                commands.append(f"q {TEXTURE_TILE_SIZE} 0 0 {TEXTURE_TILE_SIZE} {x} {height - y - TEXTURE_TILE_SIZE} cm /Tx Do Q")
+
+        # Layout positions are PIL top-left corners; PDF text sits on the
+        # baseline and the y axis points up
+        for op in ops:
+            if op['op'] == 'text':
+                ascent = get_font(op['size']).getmetrics()[0]
+                text = op['text'].encode(TEXT_ENCODING, errors='replace').hex()
+                commands.append(
+                    f"BT /F1 {op['size']} Tf {_color(op['color'])} rg "
+                    f"1 0 0 1 {_number(op['x'])} {_number(height - op['y'] - ascent)} Tm <{text}> Tj ET"
+                )
+            elif op['op'] == 'line':
+                (x1, y1), (x2, y2) = op['points']
+                commands.append(
+                    f"{_color(op['color'])} RG {_number(op['width'])} w "
+                    f"{_number(x1)} {_number(height - y1)} m {_number(x2)} {_number(height - y2)} l S"
+                )
+
+        return '\n'.join(commands).encode('ascii')
+
+    def page(self, ops, width, height):
+        """
+        Create a vector note page
+
+        Args:
+            ops (list): Drawing operations from `flow_notes`
+            width (int): Width of the page
+            height (int): Height of the page
+
+        Returns:
+            PyPDF2.PageObject: Page ready for `PdfWriter.add_page`
+        """
+        page = PageObject.create_blank_page(None, FloatObject(width), FloatObject(height))
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): self.font}),
+            NameObject('/XObject'): DictionaryObject({NameObject('/Tx'): self.texture})
+        })
+        page[NameObject('/Contents')] = self.pdf_writer._add_object(
+            _compressed_stream(self.content_stream(ops, width, height))
+        )
+        return page
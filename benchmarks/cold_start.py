@@ -0,0 +1,171 @@
+"""
+Measure ScribblePDF start-up time and memory per server worker
+
+Runs each scenario in a fresh interpreter:
+
+- create_app: lazy start, heavy modules not loaded
+- warm_up: create_app plus the preloading the production server does
+- gunicorn: the production config with and without preloading, reading
+  each worker's start time and private memory from its log line
+
+    python -m benchmarks.cold_start --workers 4 --repeat 3
+
+The gunicorn scenarios are skipped when gunicorn isn't installed.
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter and prints its measurements as JSON
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app, warm_up
+app = create_app()
+created = time.perf_counter()
+if {warm}:
+    warm_up(app)
+warmed = time.perf_counter()
+from app.utils.metrics import process_memory
+heavy = [name for name in ('numpy', 'PIL.Image', 'PyPDF2', 'pdf2image', 'requests') if name in sys.modules]
+print(json.dumps(dict(
+    create_seconds=created - started, warm_seconds=warmed - created,
+    heavy_modules=heavy, **process_memory()
+)))
+"""
+
+# "Worker <pid> ready in <ms> ms: <rss> MB resident, <private> MB private"
+WORKER_READY = re.compile(r'Worker (\d+) ready in ([\d.]+) ms: ([\d.]+) MB resident, ([\d.]+) MB private')
+
+def child_env(workdir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env.setdefault('GEMINI_API_KEY', 'cold-start')
+    env['GEMINI_CACHE_DIR'] = os.path.join(workdir, 'cache', 'gemini')
+    env['ARTIFACT_INDEX'] = os.path.join(workdir, 'cache', 'artifacts.db')
+    env['JOB_STATE_FOLDER'] = os.path.join(workdir, 'cache', 'jobs')
+    return env
+
+def probe(warm):
+    """
+    Start the app in a fresh interpreter
+
+    Returns:
+        dict: Wall time of the whole process, create/warm time and memory
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(warm=warm)],
+            cwd=workdir, env=child_env(workdir), capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_seconds'] = time.perf_counter() - started
+    return result
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run_gunicorn(workers, preload, timeout=60):
+    """
+    Start gunicorn with the production config and wait for every worker
+
+    Returns:
+        dict: Time until all workers were ready and each worker's start time and memory
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        env = child_env(workdir)
+        env.update({
+            'WEB_WORKERS': str(workers),
+            'WEB_PRELOAD': 'true' if preload else 'false',
+            'BIND': f'127.0.0.1:{free_port()}'
+        })
+        log_path = os.path.join(workdir, 'gunicorn.log')
+        with open(log_path, 'w') as log_file:
+            started = time.perf_counter()
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'wsgi:app'],
+                cwd=workdir, env=env, stdout=log_file, stderr=subprocess.STDOUT
+            )
+        try:
+            ready = []
+            while time.perf_counter() - started < timeout:
+                with open(log_path) as log_file:
+                    ready = WORKER_READY.findall(log_file.read())
+                if len(ready) >= workers or server.poll() is not None:
+                    break
+                time.sleep(0.05)
+            all_ready = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if len(ready) < workers:
+        raise RuntimeError(f"Only {len(ready)} of {workers} workers started; see the gunicorn log")
+    return {
+        'all_ready_seconds': all_ready,
+        'worker_start_ms': [float(ms) for _, ms, _, _ in ready],
+        'worker_rss_mb': [float(rss) for _, _, rss, _ in ready],
+        'worker_private_mb': [float(private) for _, _, _, private in ready]
+    }
+
+def gunicorn_available():
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def summarize(name, runs):
+    """Median of each measurement over repeated runs"""
+    report = {'scenario': name, 'runs': len(runs)}
+    for key, first in runs[0].items():
+        if isinstance(first, (int, float)):
+            report[key] = round(statistics.median(run[key] for run in runs), 4)
+        elif first and isinstance(first, list) and isinstance(first[0], (int, float)):
+            # Per-worker values: median over every worker of every run
+            report[key] = round(statistics.median(value for run in runs for value in run[key]), 4)
+        else:
+            report[key] = first
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='Gunicorn worker processes')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario (medians are reported)')
+    parser.add_argument('--json', dest='json_path', help='Also write the reports to this JSON file')
+    args = parser.parse_args(argv)
+
+    reports = [
+        summarize('create_app', [probe(warm=False) for _ in range(args.repeat)]),
+        summarize('create_app + warm_up', [probe(warm=True) for _ in range(args.repeat)])
+    ]
+    if gunicorn_available():
+        for preload in (True, False):
+            name = f"gunicorn {args.workers} workers, {'preload' if preload else 'no preload'}"
+            reports.append(summarize(name, [run_gunicorn(args.workers, preload) for _ in range(args.repeat)]))
+    else:
+        print('gunicorn is not installed; skipping the server scenarios', file=sys.stderr)
+
+    for report in reports:
+        print(json.dumps(report))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump({'reports': reports, 'args': vars(args)}, output, indent=2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
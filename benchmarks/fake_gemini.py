@@ -0,0 +1,133 @@
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Marker lines the client puts before each page of a batched request
+PAGE_MARKER = re.compile(r'^=== PAGE (\d+) ===$')
+
+
+class FakeGeminiServer:
+    """
+    Local stand-in for the Gemini generateContent endpoint
+
+    Answers every POST with notes-like text after a configurable delay, and
+    fails a configurable fraction of requests with a retryable status.
+    Batched requests get one "=== PAGE n ===" section per page, so the
+    client's batching path is exercised as well.
+
+    Usage:
+        with FakeGeminiServer(latency=0.5, error_rate=0.02) as server:
+            os.environ['GEMINI_API_BASE_URL'] = server.base_url
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, error_rate=0.0, error_status=503,
+                 response_lines=12, line_length=48, host='127.0.0.1', port=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.response_lines = response_lines
+        self.line_length = line_length
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'pages': 0, 'bytes_received': 0, 'bytes_sent': 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def notes_text(self, page_number=1):
+        """Notes-like text of the configured size"""
+        lines = []
+        for line_number in range(1, self.response_lines + 1):
+            line = f"- Page {page_number} point {line_number}: "
+            lines.append((line + "key idea " * self.line_length)[:self.line_length])
+        return '\n'.join(lines)
+
+    def respond(self, request_data):
+        """
+        Decide the response for one request
+
+        Returns:
+            tuple: (status code, response dict)
+        """
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+
+        if failed:
+            return self.error_status, {'error': {'code': self.error_status, 'message': 'Simulated failure'}}
+
+        parts = request_data.get('contents', [{}])[0].get('parts', [])
+        markers = [
+            int(match.group(1)) for match in
+            (PAGE_MARKER.match(part.get('text', '')) for part in parts) if match
+        ]
+        if markers:
+            text = '\n'.join(f"=== PAGE {number} ===\n{self.notes_text(number)}" for number in markers)
+        else:
+            text = self.notes_text()
+
+        with self._lock:
+            self.stats['pages'] += max(1, len(markers))
+        return 200, {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    request_data = json.loads(body)
+                except ValueError:
+                    request_data = {}
+
+                status, response_data = server.respond(request_data)
+                payload = json.dumps(response_data).encode('utf-8')
+
+                with server._lock:
+                    server.stats['requests'] += 1
+                    server.stats['bytes_received'] += len(body)
+                    server.stats['bytes_sent'] += len(payload)
+                    if status != 200:
+                        server.stats['errors'] += 1
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if status in (429, 503):
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
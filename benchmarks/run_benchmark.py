@@ -0,0 +1,252 @@
+"""
+End-to-end ScribblePDF benchmark against a local Gemini stand-in
+
+Starts `FakeGeminiServer`, points the app at it and drives /upload,
+/generate-notes and /get-page with synthetic PDFs through Flask's test
+client, so the measured process is the app itself. Reports pages/sec,
+p50/p99 latency and peak RSS for each stage.
+
+    python -m benchmarks.run_benchmark --pages 1 10 100 --latency 0.5
+
+Needs poppler (pdftoppm) like the app does. Peak RSS covers the web
+process only; PDF_EXTRACT_WORKERS > 1 moves rasterization into child
+processes that are not included.
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+import PyPDF2
+from PyPDF2 import PageObject
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from benchmarks.fake_gemini import FakeGeminiServer
+
+# Seconds between job status polls
+POLL_INTERVAL = 0.05
+
+def synthetic_pdf(page_count, seed=0):
+    """
+    Build a text PDF where every page has different content
+
+    Args:
+        page_count (int): Number of pages
+        seed (int): Varies the text so runs don't share cached responses
+
+    Returns:
+        bytes: PDF document
+    """
+    writer = PyPDF2.PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica')
+    }))
+    for page_number in range(1, page_count + 1):
+        page = PageObject.create_blank_page(None, 612, 792)
+        lines = [f"Benchmark document {seed}, page {page_number}"] + [
+            f"{page_number}.{line} Section heading with some body text about topic {seed * 1000 + page_number + line}"
+            for line in range(1, 25)
+        ]
+        commands = ['BT /F1 11 Tf 14 TL 56 740 Td']
+        commands += [f"({line}) Tj T*" for line in lines]
+        commands.append('ET')
+
+        content = DecodedStreamObject()
+        content.set_data('\n'.join(commands).encode('latin-1'))
+        page[NameObject('/Contents')] = writer._add_object(content)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})
+        })
+        writer.add_page(page)
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Track the peak RSS of this process while a stage runs"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+def stage_report(name, page_count, latencies, seconds, peak_rss, **extra):
+    report = {
+        'stage': name,
+        'pages': page_count,
+        'requests': len(latencies),
+        'seconds': round(seconds, 3),
+        'pages_per_second': round(page_count / seconds, 2) if seconds else None,
+        'p50_ms': round(1000 * percentile(latencies, 0.5), 1) if latencies else None,
+        'p99_ms': round(1000 * percentile(latencies, 0.99), 1) if latencies else None,
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1)
+    }
+    report.update(extra)
+    return report
+
+def run_document(client, page_count, seed, view_pages):
+    """
+    Upload, generate and view one synthetic document
+
+    Returns:
+        list: One report per stage
+    """
+    reports = []
+    pdf_bytes = synthetic_pdf(page_count, seed=seed)
+
+    # Upload
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        response = client.post(
+            '/upload',
+            data={'file': (io.BytesIO(pdf_bytes), f'benchmark_{page_count}.pdf')},
+            content_type='multipart/form-data'
+        )
+        upload_seconds = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed: {response.get_json()}")
+    filename = response.get_json()['filename']
+    reports.append(stage_report('upload', page_count, [upload_seconds], upload_seconds, rss.peak,
+                                bytes=len(pdf_bytes)))
+
+    # Generate notes: time from submission until the job finishes
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        response = client.post('/generate-notes', json={'filename': filename})
+        submit_seconds = time.perf_counter() - started
+        if response.status_code != 202:
+            raise RuntimeError(f"Generate failed: {response.get_json()}")
+        submitted = response.get_json()
+        while True:
+            status = client.get(submitted['status_url']).get_json()
+            if status['status'] in ('completed', 'failed'):
+                break
+            time.sleep(POLL_INTERVAL)
+        job_seconds = time.perf_counter() - started
+    if status['status'] != 'completed':
+        raise RuntimeError(f"Job failed: {status['error']}")
+    page_seconds = [page['seconds'] for page in status['pages'].values() if page.get('seconds') is not None]
+    reports.append(stage_report(
+        'generate', page_count, page_seconds, job_seconds, rss.peak,
+        submit_ms=round(1000 * submit_seconds, 1),
+        failed_pages=sum(1 for page in status['pages'].values() if page['status'] == 'failed'),
+        job_stages=status['stages']
+    ))
+
+    # View pages in order, like the viewer does
+    output_pages = min(status['output_pages'], view_pages) if view_pages else status['output_pages']
+    latencies = []
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        for page_num in range(output_pages):
+            page_started = time.perf_counter()
+            while True:
+                response = client.get(f"/get-page/{submitted['processed_file']}/{page_num}")
+                if response.status_code != 202:
+                    break
+                time.sleep(POLL_INTERVAL)
+            if response.status_code != 200:
+                raise RuntimeError(f"Page {page_num} failed: {response.get_json()}")
+            latencies.append(time.perf_counter() - page_started)
+        view_seconds = time.perf_counter() - started
+    reports.append(stage_report('get-page', output_pages, latencies, view_seconds, rss.peak))
+
+    return reports
+
+def print_table(reports):
+    columns = ['pages', 'stage', 'requests', 'seconds', 'pages_per_second', 'p50_ms', 'p99_ms', 'peak_rss_mb']
+    print('  '.join(f'{column:>16}' for column in columns))
+    for report in reports:
+        print('  '.join(f"{'-' if report[column] is None else report[column]:>16}" for column in columns))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100],
+                        help='Page counts of the synthetic documents (1-500)')
+    parser.add_argument('--repeat', type=int, default=1, help='Documents per page count')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake Gemini response time (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Random +/- latency (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with 503')
+    parser.add_argument('--response-lines', type=int, default=12, help='Note lines per generated page')
+    parser.add_argument('--view-pages', type=int, default=0,
+                        help='Fetch at most this many output pages per document (0 = all)')
+    parser.add_argument('--cache', action='store_true', help='Keep the Gemini response cache enabled')
+    parser.add_argument('--json', dest='json_path', help='Also write the reports to this JSON file')
+    args = parser.parse_args(argv)
+
+    for page_count in args.pages:
+        if not 1 <= page_count <= 500:
+            parser.error('--pages values must be between 1 and 500')
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    with FakeGeminiServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          response_lines=args.response_lines, seed=0) as server:
+        # Settings are read when the app modules are imported, so set them first
+        workdir = tempfile.mkdtemp(prefix='scribblepdf-bench-')
+        os.chdir(workdir)
+        os.environ['GEMINI_API_BASE_URL'] = server.base_url
+        os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+        os.environ['GEMINI_CACHE_DIR'] = os.path.join(workdir, 'cache')
+        if not args.cache:
+            os.environ['GEMINI_CACHE_MAX_MB'] = '0'
+
+        from app import create_app
+        client = create_app().test_client()
+
+        reports = []
+        for page_count in args.pages:
+            for run in range(args.repeat):
+                reports.extend(run_document(client, page_count, seed=run, view_pages=args.view_pages))
+
+        print_table(reports)
+        print(f"\nFake Gemini: {json.dumps(server.stats)}  (workdir {workdir})")
+
+    if json_path:
+        with open(json_path, 'w') as output:
+            json.dump({'reports': reports, 'fake_gemini': server.stats, 'args': vars(args)}, output, indent=2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
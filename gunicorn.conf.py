@@ -0,0 +1,64 @@
+"""
+Gunicorn settings for the production server
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is created and warmed once in the master process (`preload_app`;
+WEB_PRELOAD=false turns it off), then forked into WEB_WORKERS processes
+with WEB_THREADS request threads each. Modules, fonts and textures loaded
+before the fork are shared copy-on-write. Each worker logs how long it
+took to start and how much memory is its own.
+
+Note generation jobs run on a thread pool inside the worker that received
+the request; their status is shared through JOB_STATE_FOLDER. The Gemini
+limits (GEMINI_REQUESTS_PER_SECOND, GEMINI_MAX_IN_FLIGHT) are enforced per
+worker process and shared by all of its jobs, so the server as a whole
+sends up to WEB_WORKERS times those limits; divide them by WEB_WORKERS to
+cap the total. /metrics counters are per worker.
+"""
+import gc
+import os
+import time
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv('WEB_WORKERS', '2'))
+threads = int(os.getenv('WEB_THREADS', '8'))
+worker_class = 'gthread'
+preload_app = os.getenv('WEB_PRELOAD', 'true').lower() == 'true'
+
+# Uploads of large chunks and on-demand page renders can take a while
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+# Monotonic time each worker was forked, by pid
+_forked_at = {}
+
+def when_ready(server):
+    # Everything allocated while preloading is moved out of the garbage
+    # collector's reach, so collections in the workers don't touch (and
+    # copy) the shared pages
+    gc.freeze()
+
+def pre_fork(server, worker):
+    _forked_at['next'] = time.monotonic()
+
+def post_fork(server, worker):
+    _forked_at[os.getpid()] = _forked_at.pop('next', time.monotonic())
+
+def post_worker_init(worker):
+    from app.utils.metrics import record_stage, process_memory
+
+    seconds = time.monotonic() - _forked_at.get(os.getpid(), time.monotonic())
+    record_stage('worker_start', seconds)
+    memory = process_memory()
+    resident = memory.get('rss_bytes', memory.get('max_rss_bytes', 0))
+    worker.log.info(
+        "Worker %s ready in %.1f ms: %.1f MB resident, %.1f MB private",
+        os.getpid(), seconds * 1000,
+        resident / (1024 * 1024),
+        memory.get('private_bytes', resident) / (1024 * 1024)
+    )
@@ -0,0 +1,12 @@
+"""Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production"""
+import os
+from app import create_app
+
+app = create_app()
+
+if __name__ == '__main__':
+    app.run(
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', '5000')),
+        debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+    )
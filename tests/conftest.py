@@ -0,0 +1,26 @@
+import pytest
+import PyPDF2
+from app.utils import artifacts
+from app.utils.artifacts import ArtifactStore
+
+
+@pytest.fixture(autouse=True)
+def artifact_store(tmp_path, monkeypatch):
+    """Keep the process-wide artifact store out of the working directory"""
+    store = ArtifactStore(str(tmp_path / 'artifacts.db'))
+    monkeypatch.setattr(artifacts, '_artifact_store', store)
+    return store
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Write a PDF with `pages` blank pages and return its path"""
+    def make(pages, name='document.pdf'):
+        writer = PyPDF2.PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=612, height=792)
+        path = tmp_path / name
+        with open(path, 'wb') as pdf_file:
+            writer.write(pdf_file)
+        return str(path)
+    return make
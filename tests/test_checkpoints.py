@@ -0,0 +1,21 @@
+import pytest
+from app.utils.checkpoints import parse_page_ranges
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1-3,7', [1, 2, 3, 7]),
+    (' 2 , 4-5 ', [2, 4, 5]),
+    ('1-4,3-6,5', [1, 2, 3, 4, 5, 6]),
+    ('3,3,1', [1, 3]),
+    ([3, 1, 2], [1, 2, 3]),
+    (['1-2', '2'], [1, 2]),
+    ('1-10', list(range(1, 11))),
+])
+def test_parse_page_ranges(value, expected):
+    assert parse_page_ranges(value, 10) == expected
+
+
+@pytest.mark.parametrize('value', ['0', '11', '5-11', '4-2', 'a', '1-b', '1-2-3', '-1', '', ',', []])
+def test_parse_page_ranges_rejects(value):
+    with pytest.raises(ValueError):
+        parse_page_ranges(value, 10)
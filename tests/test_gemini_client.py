@@ -0,0 +1,25 @@
+import pytest
+from app.utils.gemini_client import split_batched_notes
+
+
+def test_split_batched_notes():
+    content = '=== PAGE 1 ===\nfirst page\n\n=== PAGE 2 ===\nsecond\npage\n'
+    assert split_batched_notes(content, 2) == ['first page', 'second\npage']
+
+
+def test_split_batched_notes_tolerates_markdown_markers():
+    content = '**=== PAGE 1 ===**\none\n## === Page 2 ===\ntwo'
+    assert split_batched_notes(content, 2) == ['one', 'two']
+
+
+@pytest.mark.parametrize('content', [
+    'no markers at all',
+    '=== PAGE 1 ===\none',
+    '=== PAGE 1 ===\none\n=== PAGE 3 ===\nthree',
+    '=== PAGE 2 ===\ntwo\n=== PAGE 1 ===\none',
+    '=== PAGE 1 ===\none\n=== PAGE 1 ===\nagain',
+    '=== PAGE 1 ===\n\n=== PAGE 2 ===\ntwo',
+    '=== PAGE 1 ===\none\n=== PAGE 2 ===\ntwo\n=== PAGE 3 ===\nextra',
+])
+def test_split_batched_notes_rejects_malformed(content):
+    assert split_batched_notes(content, 2) is None
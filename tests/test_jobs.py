@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+import pytest
+from app.utils.jobs import JobManager, JobAlreadyRunning
+
+
+def _blocking_job():
+    """Job function that runs until the returned event is set"""
+    release = threading.Event()
+
+    def run(job):
+        job.start(1)
+        release.wait(5)
+        job.complete('processed.pdf')
+    return run, release
+
+
+def _wait(manager, job_id):
+    """Wait for a job to finish"""
+    deadline = time.monotonic() + 5
+    while not manager.get(job_id).finished:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture(params=[False, True], ids=['in-memory', 'state-folder'])
+def manager(request, tmp_path):
+    state_folder = str(tmp_path / 'jobs') if request.param else None
+    manager = JobManager(max_workers=2, state_folder=state_folder)
+    yield manager
+    manager.executor.shutdown(wait=True)
+
+
+def test_job_runs_and_is_found(manager):
+    job = manager.submit('a.pdf', lambda job: job.complete('a_processed.pdf'))
+    manager.executor.shutdown(wait=True)
+    assert manager.get(job.id).to_dict()['status'] == 'completed'
+    assert manager.latest_for('a.pdf').id == job.id
+    assert manager.latest_for('b.pdf') is None
+
+
+def test_failing_job_is_marked_failed(manager):
+    def fail(job):
+        raise RuntimeError('boom')
+    job = manager.submit('a.pdf', fail)
+    manager.executor.shutdown(wait=True)
+    assert manager.get(job.id).to_dict()['error'] == 'boom'
+    assert manager.get(job.id).finished
+
+
+def test_only_one_job_per_upload(manager):
+    run, release = _blocking_job()
+    running = manager.submit('a.pdf', run)
+    with pytest.raises(JobAlreadyRunning) as error:
+        manager.submit('a.pdf', run)
+    assert error.value.job.id == running.id
+    assert error.value.status_code == 409
+
+    # Other uploads aren't held up
+    other = manager.submit('b.pdf', lambda job: job.complete('b_processed.pdf'))
+    _wait(manager, other.id)
+    assert not manager.get(running.id).finished
+
+    # Once finished, the upload can be processed again
+    release.set()
+    _wait(manager, running.id)
+    again = manager.submit('a.pdf', lambda job: job.complete('a_processed.pdf'))
+    assert manager.latest_for('a.pdf').id == again.id
+
+
+def test_running_job_blocks_other_processes(tmp_path):
+    state_folder = str(tmp_path / 'jobs')
+    first, second = JobManager(state_folder=state_folder), JobManager(state_folder=state_folder)
+    run, release = _blocking_job()
+    running = first.submit('a.pdf', run)
+    try:
+        with pytest.raises(JobAlreadyRunning) as error:
+            second.submit('a.pdf', run)
+        assert error.value.job.id == running.id
+        assert second.get(running.id).id == running.id
+    finally:
+        release.set()
+        first.executor.shutdown(wait=True)
+    second.submit('a.pdf', lambda job: job.complete('a_processed.pdf'))
+    second.executor.shutdown(wait=True)
+
+
+def test_job_of_a_dead_process_does_not_block(tmp_path):
+    state_folder = str(tmp_path / 'jobs')
+    manager = JobManager(state_folder=state_folder)
+    run, release = _blocking_job()
+    stale = manager.submit('a.pdf', run)
+    release.set()
+    manager.executor.shutdown(wait=True)
+
+    # Leave the snapshot as if its process died mid-run
+    state_path = os.path.join(state_folder, f"{stale.id}.json")
+    with open(state_path, 'r', encoding='utf-8') as state_file:
+        state = json.load(state_file)
+    state.update(status='running', pid=2 ** 22 + 1)
+    with open(state_path, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file)
+
+    other = JobManager(state_folder=state_folder)
+    job = other.submit('a.pdf', lambda job: job.complete('a_processed.pdf'))
+    other.executor.shutdown(wait=True)
+    assert other.latest_for('a.pdf').id == job.id
+
+
+def test_unknown_job(manager):
+    assert manager.get('missing') is None
+    assert manager.get('../etc/passwd') is None
@@ -0,0 +1,100 @@
+import pytest
+from app.utils.note_layout import Note, parse_notes, notes_from_list, flow_notes
+
+
+def test_structured_line():
+    notes = parse_notes('1. (x: 120, y: 80) Content: "Mitosis" Style: underline')
+    assert notes == (Note('Mitosis', 'underline', 0.12, 0.08),)
+
+
+def test_labelled_position_and_style():
+    notes = parse_notes('Position: (10, 20), Content: Cell cycle, Style: heading')
+    assert notes == (Note('Cell cycle', 'heading', 0.1, 0.2),)
+
+
+def test_leading_pair_needs_content_label():
+    assert parse_notes('(0.5, 0.25) Content: half') == (Note('half', 'normal', 0.5, 0.25),)
+    assert parse_notes('(3, 4) is a point') == (Note('(3, 4) is a point', 'normal', None, None),)
+
+
+@pytest.mark.parametrize('line', [
+    'f(2, 3) = 13',
+    'The point (3, 4) is on the line',
+    'Writing style: bold',
+    '-5 + 3 = -2',
+    '__init__ runs first',
+    'x: the unknown, y: the result',
+])
+def test_note_text_is_kept(line):
+    assert parse_notes(line) == (Note(line, 'normal', None, None),)
+
+
+def test_markdown_lines():
+    notes = parse_notes('# Title\n- item one\n**Bold line**\nA -> B\nImportant fact (underline)\n\n')
+    assert notes == (
+        Note('Title', 'heading', None, None),
+        Note('item one', 'normal', None, None),
+        Note('Bold line', 'heading', None, None),
+        Note('A -> B', 'arrow', None, None),
+        Note('Important fact', 'underline', None, None),
+    )
+
+
+def test_trailing_normal_is_text():
+    assert parse_notes('Plain text (normal)') == (Note('Plain text (normal)', 'normal', None, None),)
+
+
+def test_json_notes():
+    content = (
+        '```json\n'
+        '[{"content": "a", "x": 0.1, "y": 0.2, "style": "arrow"},'
+        ' {"text": "b", "position": [50, 60]}, 3, {"content": ""},'
+        ' {"content": "c", "position": {"x": "left", "y": 1}}]\n'
+        '```'
+    )
+    assert parse_notes(content) == (
+        Note('a', 'arrow', 0.1, 0.2),
+        Note('b', 'normal', 0.5, 0.6),
+        Note('c', 'normal', None, None),
+    )
+
+
+def test_json_object_with_notes_list():
+    notes = parse_notes('{"notes": [{"content": "c", "position": {"x": 500, "y": 900}}]}')
+    assert notes == (Note('c', 'normal', 0.5, 0.9),)
+
+
+@pytest.mark.parametrize('content', ['', '\n  \n'])
+def test_no_notes(content):
+    assert parse_notes(content) == ()
+
+
+@pytest.mark.parametrize('content', ['{not json', '{"notes": 3}'])
+def test_unusable_json_is_read_as_text(content):
+    assert parse_notes(content) == (Note(content, 'normal', None, None),)
+
+
+def test_notes_from_list_round_trip():
+    notes = parse_notes('Position: (10, 20), Content: Cell cycle, Style: heading')
+    assert notes_from_list([list(note) for note in notes]) == notes
+
+
+def test_flow_notes_stays_on_page():
+    notes = parse_notes('\n'.join(f"Note number {i} with some words to wrap" for i in range(200)))
+    ops = flow_notes(notes, 1000, 1400)
+    texts = [op for op in ops if op['op'] == 'text']
+    assert texts
+    assert len(texts) < 200
+    for op in texts:
+        assert 0 <= op['x'] < 1000
+        assert 0 <= op['y'] < 1400
+
+
+def test_flow_notes_is_deterministic():
+    notes = parse_notes('# Title\nline one\nA -> B\nImportant fact (underline)')
+    assert flow_notes(notes, 1000, 1400) == flow_notes(notes, 1000, 1400)
+    assert {op['op'] for op in flow_notes(notes, 1000, 1400)} == {'text', 'line'}
+
+
+def test_flow_notes_empty():
+    assert flow_notes((), 1000, 1400) == []
@@ -0,0 +1,59 @@
+import io
+import PyPDF2
+from PyPDF2.generic import DecodedStreamObject, NameObject
+from app.utils.pdf_processor import count_pdf_pages, optimize_pdf_objects
+
+CONTENT = b'BT /F1 12 Tf 72 720 Td (Hello) Tj ET\n' * 50
+
+
+def test_count_pdf_pages(make_pdf):
+    assert count_pdf_pages(make_pdf(1)) == 1
+    assert count_pdf_pages(make_pdf(7)) == 7
+
+
+def test_count_pdf_pages_falls_back_to_page_tree(make_pdf, tmp_path):
+    writer = PyPDF2.PdfWriter()
+    writer.append(make_pdf(3))
+    writer._root_object['/Pages'][NameObject('/Count')] = PyPDF2.generic.NumberObject(-1)
+    path = tmp_path / 'bad_count.pdf'
+    with open(path, 'wb') as pdf_file:
+        writer.write(pdf_file)
+    assert count_pdf_pages(str(path)) == 3
+
+
+def _writer_with_duplicate_streams(pages):
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+        page = writer.pages[-1]
+        stream = DecodedStreamObject()
+        stream.set_data(CONTENT)
+        page[NameObject('/Contents')] = writer._add_object(stream)
+    return writer
+
+
+def test_optimize_pdf_objects_output_still_parses():
+    writer = _writer_with_duplicate_streams(3)
+    unoptimized = io.BytesIO()
+    writer.write(unoptimized)
+
+    assert optimize_pdf_objects(writer) == {'compressed': 3, 'deduplicated': 2}
+    optimized = io.BytesIO()
+    writer.write(optimized)
+    assert len(optimized.getvalue()) < len(unoptimized.getvalue())
+
+    reader = PyPDF2.PdfReader(optimized)
+    assert len(reader.pages) == 3
+    contents = [page.raw_get('/Contents') for page in reader.pages]
+    assert len({content.idnum for content in contents}) == 1
+    for page in reader.pages:
+        assert page.get_contents().get_data() == CONTENT
+
+
+def test_optimize_pdf_objects_without_duplicates():
+    writer = _writer_with_duplicate_streams(1)
+    assert optimize_pdf_objects(writer) == {'compressed': 1, 'deduplicated': 0}
+    assert optimize_pdf_objects(writer) == {'compressed': 0, 'deduplicated': 0}
+    output = io.BytesIO()
+    writer.write(output)
+    assert PyPDF2.PdfReader(output).pages[0].get_contents().get_data() == CONTENT
@@ -0,0 +1,168 @@
+import io
+import os
+import pytest
+from app.utils.uploads import UploadStore, UploadError
+
+CONTENT = b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / 'uploads'), max_upload_size=1024 * 1024, chunk_size=4096)
+
+
+def _upload(store, content, filename='notes.pdf', chunk=4096):
+    session = store.create(filename, len(content))
+    for offset in range(0, len(content), chunk):
+        data = content[offset:offset + chunk]
+        store.write_chunk(session['upload_id'], offset, io.BytesIO(data), len(data))
+    return store.finalize(session['upload_id'])
+
+
+def test_chunked_upload(store):
+    result = _upload(store, CONTENT)
+    assert result['deduplicated'] is False
+    assert result['filename'].endswith('_notes.pdf')
+    with open(os.path.join(store.upload_folder, result['filename']), 'rb') as stored:
+        assert stored.read() == CONTENT
+    assert os.listdir(store.partial_folder) == []
+
+
+def test_resume_from_reported_offset(store):
+    session = store.create('notes.pdf', len(CONTENT))
+    upload_id = session['upload_id']
+    store.write_chunk(upload_id, 0, io.BytesIO(CONTENT[:1000]), 1000)
+
+    # A new store (e.g. after a restart) reports where to resume and rebuilds the hash
+    resumed = UploadStore(store.upload_folder, store.max_upload_size, store.chunk_size)
+    offset = resumed.status(upload_id)['offset']
+    assert offset == 1000
+    resumed.write_chunk(upload_id, offset, io.BytesIO(CONTENT[offset:]), len(CONTENT) - offset)
+    result = resumed.finalize(upload_id)
+    with open(os.path.join(store.upload_folder, result['filename']), 'rb') as stored:
+        assert stored.read() == CONTENT
+    assert _upload(store, CONTENT) == {**result, 'deduplicated': True}
+
+
+def test_short_chunk_is_resumed(store):
+    session = store.create('notes.pdf', len(CONTENT))
+    upload_id = session['upload_id']
+    # The client announced 2000 bytes but the connection dropped after 500
+    assert store.write_chunk(upload_id, 0, io.BytesIO(CONTENT[:500]), 2000)['offset'] == 500
+    store.write_chunk(upload_id, 500, io.BytesIO(CONTENT[500:]), len(CONTENT) - 500)
+    assert store.finalize(upload_id)['sha256'] == _upload(store, CONTENT)['sha256']
+
+
+@pytest.mark.parametrize('offset', [0, 999, 1001])
+def test_wrong_offset_is_rejected(store, offset):
+    session = store.create('notes.pdf', len(CONTENT))
+    store.write_chunk(session['upload_id'], 0, io.BytesIO(CONTENT[:1000]), 1000)
+    with pytest.raises(UploadError) as error:
+        store.write_chunk(session['upload_id'], offset, io.BytesIO(b'x'), 1)
+    assert error.value.status_code == 409
+    assert str(error.value) == 'Expected offset 1000'
+    assert store.status(session['upload_id'])['offset'] == 1000
+
+
+def test_chunk_past_declared_size_is_rejected(store):
+    session = store.create('notes.pdf', 10)
+    with pytest.raises(UploadError) as error:
+        store.write_chunk(session['upload_id'], 0, io.BytesIO(b'%PDF-12345x'), 11)
+    assert error.value.status_code == 400
+
+
+def test_incomplete_upload_cannot_be_finalized(store):
+    session = store.create('notes.pdf', len(CONTENT))
+    store.write_chunk(session['upload_id'], 0, io.BytesIO(CONTENT[:10]), 10)
+    with pytest.raises(UploadError) as error:
+        store.finalize(session['upload_id'])
+    assert error.value.status_code == 409
+
+
+def test_unknown_upload(store):
+    assert store.status('missing') is None
+    assert store.status('../etc') is None
+    with pytest.raises(UploadError) as error:
+        store.write_chunk('missing', 0, io.BytesIO(b''), 0)
+    assert error.value.status_code == 404
+
+
+@pytest.mark.parametrize('filename, size, status_code', [
+    ('notes.txt', 10, 400),
+    ('notes.pdf', 0, 400),
+    ('notes.pdf', 2 * 1024 * 1024, 413),
+])
+def test_create_rejects(store, filename, size, status_code):
+    with pytest.raises(UploadError) as error:
+        store.create(filename, size)
+    assert error.value.status_code == status_code
+
+
+def test_non_pdf_content_is_rejected(store):
+    with pytest.raises(UploadError):
+        _upload(store, b'not a pdf at all')
+
+
+def test_identical_upload_is_deduplicated(store):
+    first = _upload(store, CONTENT, 'a.pdf')
+    second = _upload(store, CONTENT, 'b.pdf', chunk=1000)
+    assert second == {**first, 'deduplicated': True}
+    assert len([name for name in os.listdir(store.upload_folder) if name.endswith('.pdf')]) == 1
+    assert store.find_by_hash(first['sha256']) == first['filename']
+
+    path = os.path.join(store.upload_folder, 'single.tmp')
+    with open(path, 'wb') as received:
+        received.write(CONTENT)
+    assert store.add_file(path, 'c.pdf') == {**first, 'deduplicated': True}
+    assert not os.path.exists(path)
+
+
+def test_deleted_upload_is_stored_again(store):
+    first = _upload(store, CONTENT)
+    os.remove(os.path.join(store.upload_folder, first['filename']))
+    assert store.find_by_hash(first['sha256']) is None
+
+    second = _upload(store, CONTENT)
+    assert second['deduplicated'] is False
+    assert second['filename'] != first['filename']
+    assert store.find_by_hash(first['sha256']) == second['filename']
+
+
+def test_register_race_keeps_first_upload(store):
+    first = _upload(store, CONTENT)
+    # Another process stored the same content between the lookup and registering
+    open(os.path.join(store.upload_folder, 'late_copy.pdf'), 'wb').close()
+    assert store._register(first['sha256'], 'late_copy.pdf') == first['filename']
+
+
+def test_find_by_hash_ignores_bad_hashes(store):
+    assert store.find_by_hash('../../etc/passwd') is None
+    assert store.find_by_hash('0' * 64) is None
+
+
+def test_legacy_index_is_migrated(tmp_path):
+    folder = tmp_path / 'uploads'
+    folder.mkdir()
+    (folder / 'old.pdf').write_bytes(CONTENT)
+    (folder / '.hashes.json').write_text('{"%s": "old.pdf", "bad": "x.pdf"}' % ('a' * 64))
+    store = UploadStore(str(folder), 1024 * 1024, 4096)
+    assert store.find_by_hash('a' * 64) == 'old.pdf'
+    assert not (folder / '.hashes.json').exists()
+
+
+def test_expired_sessions_are_cleaned_up(store, monkeypatch):
+    stale = store.create('notes.pdf', len(CONTENT))
+    store.session_ttl = -1
+    fresh = store.create('notes.pdf', len(CONTENT))
+    assert store.status(stale['upload_id']) is None
+    assert store.status(fresh['upload_id'])['offset'] == 0
+
+    # A partial file finished by another process meanwhile is skipped
+    real_remove = os.remove
+
+    def remove_vanished(path):
+        real_remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'remove', remove_vanished)
+    store.create('notes.pdf', len(CONTENT))
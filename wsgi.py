@@ -0,0 +1,12 @@
+"""
+Production WSGI entrypoint
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With the gunicorn config's preloading, this module is imported once in the
+master process and the workers are forked from it.
+"""
+from app import create_app, warm_up
+
+app = create_app()
+warm_up(app)